@@ -0,0 +1,105 @@
+import random
+import threading
+import time
+from collections import deque
+
+
+class BudgetExceeded(Exception):
+    """Raised when a call could not finish inside its latency budget."""
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class LatencyBudget:
+    """
+    Per-request time limit for a remote call, with jittered retries inside it.
+
+    call(fn) invokes fn(connect_timeout, read_timeout) with timeouts clipped to
+    what is left of the budget, retrying exceptions listed in retry_on with
+    exponential backoff (x0.5-1.5 jitter). When the budget runs out, or the
+    last retry fails, BudgetExceeded is raised and the caller answers from its
+    local fallback, reporting that through record_fallback().
+
+    Latencies of the last `window` calls are kept for percentile metrics.
+    """
+
+    def __init__(self, budget=8.0, connect_timeout=3.0, read_timeout=20.0, retries=2,
+                 backoff=0.25, retry_on=(), window=1000):
+        self.budget = budget
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.retry_on = tuple(retry_on)
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)  # ms per call, successful or not
+        self._metrics = {
+            'calls': 0,
+            'successes': 0,
+            'retries': 0,
+            'budget_exceeded': 0,
+            'errors': 0,
+            'fallbacks': 0,
+        }
+
+    def call(self, fn):
+        started = time.monotonic()
+        deadline = started + self.budget
+        attempt = 0
+        with self._lock:
+            self._metrics['calls'] += 1
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0.05:
+                    self._count('budget_exceeded')
+                    raise BudgetExceeded(f"No answer within the {self.budget:g}s budget")
+                try:
+                    result = fn(min(self.connect_timeout, remaining), min(self.read_timeout, remaining))
+                except self.retry_on as err:
+                    attempt += 1
+                    pause = self.backoff * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+                    if attempt > self.retries or time.monotonic() + pause >= deadline:
+                        self._count('budget_exceeded')
+                        raise BudgetExceeded(f"Gave up after {attempt} attempt(s): {err}") from err
+                    self._count('retries')
+                    time.sleep(pause)
+                    continue
+                except Exception:
+                    self._count('errors')
+                    raise
+                self._count('successes')
+                return result
+        finally:
+            with self._lock:
+                self._latencies.append((time.monotonic() - started) * 1000)
+
+    def record_fallback(self):
+        self._count('fallbacks')
+
+    def _count(self, name):
+        with self._lock:
+            self._metrics[name] += 1
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._metrics)
+            latencies = sorted(self._latencies)
+        answered = data['successes'] + data['fallbacks']
+        data.update({
+            'budget_s': self.budget,
+            'fallback_rate': round(data['fallbacks'] / answered, 3) if answered else 0.0,
+            'latency_p50_ms': percentile(latencies, 50),
+            'latency_p95_ms': percentile(latencies, 95),
+            'latency_p99_ms': percentile(latencies, 99),
+            'latency_samples': len(latencies),
+        })
+        for key in ('latency_p50_ms', 'latency_p95_ms', 'latency_p99_ms'):
+            if data[key] is not None:
+                data[key] = round(data[key], 1)
+        return data
@@ -0,0 +1,302 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_medicines(med_names):
+    """Order- and spacing-insensitive form of a medicine list."""
+    return sorted(' '.join(name.lower().split()) for name in med_names if name and name.strip())
+
+
+def analysis_key(mode, content, prompt_version, model):
+    """
+    Cache key for one analysis: sha256 over (mode, content, prompt version, model).
+    content is a list of medicine names (text mode), or for image mode the
+    image bytes or their sha256 hex digest (uploads.ContentStore already has it),
+    which give the same key.
+    """
+    digest = hashlib.sha256()
+    digest.update(f"{mode}\0{prompt_version}\0{model}\0".encode('utf-8'))
+    if mode == 'image':
+        if isinstance(content, (bytes, bytearray)):
+            content = hashlib.sha256(content).hexdigest()
+        digest.update(content.encode('ascii'))
+    else:
+        digest.update('\n'.join(normalize_medicines(content)).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class MemoryTier:
+    """LRU of recent analyses, each entry valid for ttl seconds."""
+
+    def __init__(self, max_entries=512, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, html)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DiskTier:
+    """
+    Analyses stored as files under directory/<key[:2]>/<key>.html.
+
+    Total size is kept under max_bytes by evicting the least recently used
+    files (reads bump the mtime). Entries older than ttl seconds are treated
+    as missing; ttl=0 keeps them until evicted. Writes go to a temp file and
+    are renamed into place, so readers in other processes never see a
+    partial entry. Each process indexes the directory on first use and then
+    tracks its own writes, so with several workers the bound is approximate.
+
+    clear() also replaces the directory/.purged marker file; generation()
+    identifies the current marker, so other processes can tell a purge
+    happened and drop what they hold in memory.
+    """
+
+    PURGE_MARKER = '.purged'
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024, ttl=30 * 24 * 3600):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._index = None  # key -> (size, mtime), built lazily from the directory
+        self._bytes = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.html")
+
+    def generation(self):
+        """Identity of the last purge marker (None if never purged); changes on every clear()."""
+        try:
+            st = os.stat(os.path.join(self.directory, self.PURGE_MARKER))
+        except OSError:
+            return None
+        return (st.st_ino, st.st_mtime_ns)
+
+    def _write_marker(self):
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(f"{time.time()}\n")
+        # Renamed into place, so the marker gets a new inode every time
+        os.replace(tmp_path, os.path.join(self.directory, self.PURGE_MARKER))
+
+    def forget_index(self):
+        """Rebuild the size index from the directory on next use (after another process purged it)."""
+        with self._lock:
+            self._index = None
+            self._bytes = 0
+
+    def _load_index(self):
+        if self._index is not None:
+            return
+        self._index = {}
+        self._bytes = 0
+        if not os.path.isdir(self.directory):
+            return
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith('.html'):
+                    continue
+                try:
+                    st = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue
+                self._index[name[:-5]] = (st.st_size, st.st_mtime)
+                self._bytes += st.st_size
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            st = os.stat(path)
+            if self.ttl and time.time() - st.st_mtime > self.ttl:
+                self.delete(key)
+                return None
+            with open(path, 'r', encoding='utf-8') as f:
+                value = f.read()
+            now = time.time()
+            os.utime(path, (now, now))
+        except OSError:
+            return None
+        with self._lock:
+            if self._index is not None and key in self._index:
+                self._index[key] = (self._index[key][0], now)
+        return value
+
+    def put(self, key, value):
+        path = self._path(key)
+        data = value.encode('utf-8')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+        with self._lock:
+            self._load_index()
+            previous = self._index.get(key)
+            if previous:
+                self._bytes -= previous[0]
+            self._index[key] = (len(data), time.time())
+            self._bytes += len(data)
+            self._evict()
+
+    def _evict(self):
+        if self._bytes <= self.max_bytes:
+            return
+        for key, (size, _) in sorted(self._index.items(), key=lambda item: item[1][1]):
+            if self._bytes <= self.max_bytes:
+                break
+            try:
+                os.unlink(self._path(key))
+            except OSError:
+                pass
+            del self._index[key]
+            self._bytes -= size
+
+    def delete(self, key):
+        try:
+            os.unlink(self._path(key))
+        except OSError:
+            pass
+        with self._lock:
+            if self._index is not None and key in self._index:
+                self._bytes -= self._index.pop(key)[0]
+
+    def clear(self):
+        with self._lock:
+            self._load_index()
+            removed = len(self._index)
+            for key in list(self._index):
+                try:
+                    os.unlink(self._path(key))
+                except OSError:
+                    pass
+            self._index = {}
+            self._bytes = 0
+            try:
+                self._write_marker()
+            except OSError as err:
+                print(f"AI Cache Purge Marker Error: {err}")
+        return removed
+
+    def stats(self):
+        with self._lock:
+            self._load_index()
+            return {'entries': len(self._index), 'bytes': self._bytes, 'max_bytes': self.max_bytes}
+
+
+class AnalysisCache:
+    """
+    Two-tier cache of AI analysis HTML: a per-process MemoryTier in front of a
+    DiskTier shared by every worker on the host. Disk hits are promoted to memory.
+
+    A purge in any worker replaces the disk tier's purge marker. Every lookup
+    compares the marker with the one this process last saw (one stat call) and
+    empties its memory tier when it changed, so no worker keeps serving purged
+    analyses from memory.
+    """
+
+    def __init__(self, memory, disk):
+        self.memory = memory
+        self.disk = disk
+        self._lock = threading.Lock()
+        self._generation = disk.generation()
+        self._metrics = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'writes': 0,
+                         'write_errors': 0, 'purges': 0, 'remote_purges': 0, 'lookup_time_total_ms': 0.0}
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._metrics[name] += n
+
+    def _sync(self):
+        generation = self.disk.generation()
+        if generation != self._generation:
+            # Purged by another worker since this one filled its memory tier
+            self._generation = generation
+            self.memory.clear()
+            self.disk.forget_index()
+            self._count('remote_purges')
+
+    def get(self, key):
+        started = time.perf_counter()
+        self._sync()
+        value = self.memory.get(key)
+        if value is not None:
+            outcome = 'memory_hits'
+        else:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.put(key, value)
+                outcome = 'disk_hits'
+            else:
+                outcome = 'misses'
+        with self._lock:
+            self._metrics[outcome] += 1
+            self._metrics['lookup_time_total_ms'] += (time.perf_counter() - started) * 1000
+        return value
+
+    def put(self, key, value):
+        self.memory.put(key, value)
+        try:
+            self.disk.put(key, value)
+            self._count('writes')
+        except OSError as err:
+            print(f"AI Cache Write Error: {err}")
+            self._count('write_errors')
+
+    def purge(self):
+        """Drop every cached analysis from both tiers. Returns the number of disk entries removed."""
+        self.memory.clear()
+        removed = self.disk.clear()
+        self._generation = self.disk.generation()
+        self._count('purges')
+        return removed
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._metrics)
+        lookups = data['memory_hits'] + data['disk_hits'] + data['misses']
+        data['hit_rate'] = round((data['memory_hits'] + data['disk_hits']) / lookups, 3) if lookups else 0.0
+        data['lookup_time_avg_ms'] = round(data['lookup_time_total_ms'] / lookups, 3) if lookups else 0.0
+        data['memory_entries'] = len(self.memory)
+        data['disk'] = self.disk.stats()
+        return data
@@ -0,0 +1,182 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import mysql.connector
+
+
+class QueueFull(Exception):
+    """Raised when the job backlog is at its limit; the caller should ask the user to retry."""
+
+
+class JobStore:
+    """
+    Persists analysis jobs in the ai_jobs table so any worker process can
+    answer a poll. Recent jobs are also kept in a bounded in-memory map, which
+    is all there is when the database is down (TEMP_DATA-style fallback).
+
+    connect is a context manager yielding a connection or None (app.get_db_connection).
+    """
+
+    COLUMNS = ('job_id', 'user_id', 'source_type', 'source_ref', 'status', 'result', 'error',
+               'created_at', 'started_at', 'finished_at')
+
+    def __init__(self, connect, max_memory_jobs=1000):
+        self.connect = connect
+        self.max_memory_jobs = max_memory_jobs
+        self._jobs = OrderedDict()  # job_id -> dict
+        self._lock = threading.Lock()
+
+    def _remember(self, job):
+        with self._lock:
+            self._jobs[job['job_id']] = job
+            self._jobs.move_to_end(job['job_id'])
+            while len(self._jobs) > self.max_memory_jobs:
+                self._jobs.popitem(last=False)
+
+    def _write(self, query, params):
+        with self.connect() as conn:
+            if not conn:
+                return
+            try:
+                cursor = conn.cursor()
+                cursor.execute(query, params)
+                conn.commit()
+                cursor.close()
+            except mysql.connector.Error as err:
+                print(f"AI Job Store Error: {err}")
+
+    def create(self, job):
+        self._remember(job)
+        self._write("""
+            INSERT INTO ai_jobs (job_id, user_id, source_type, source_ref, status, created_at)
+            VALUES (%s, %s, %s, %s, %s, FROM_UNIXTIME(%s))
+        """, (job['job_id'], job['user_id'], job['source_type'], job['source_ref'], job['status'], job['created_at']))
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(fields)
+        assignments = []
+        params = []
+        for column, value in fields.items():
+            if column in ('started_at', 'finished_at'):
+                assignments.append(f"{column} = FROM_UNIXTIME(%s)")
+            else:
+                assignments.append(f"{column} = %s")
+            params.append(value)
+        self._write(f"UPDATE ai_jobs SET {', '.join(assignments)} WHERE job_id = %s", params + [job_id])
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return dict(job)
+        # Submitted through another worker process
+        with self.connect() as conn:
+            if not conn:
+                return None
+            try:
+                cursor = conn.cursor(dictionary=True, buffered=True)
+                cursor.execute("""
+                    SELECT job_id, user_id, source_type, source_ref, status, result, error,
+                           UNIX_TIMESTAMP(created_at) as created_at, UNIX_TIMESTAMP(started_at) as started_at,
+                           UNIX_TIMESTAMP(finished_at) as finished_at
+                    FROM ai_jobs WHERE job_id = %s
+                """, (job_id,))
+                row = cursor.fetchone()
+                cursor.close()
+                return row
+            except mysql.connector.Error as err:
+                print(f"AI Job Store Error: {err}")
+                return None
+
+
+class JobQueue:
+    """
+    Runs AI analyses on a bounded in-process thread pool so request threads
+    return at once with a job ID.
+
+    - max_workers: concurrent AI calls per process.
+    - max_pending: queued + running jobs accepted before submit() raises QueueFull.
+    """
+
+    def __init__(self, store, max_workers=4, max_pending=100):
+        self.store = store
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ai-job')
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._metrics = {
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0,
+            'rejected': 0,
+            'run_time_total_ms': 0.0,
+            'queue_time_total_ms': 0.0,
+        }
+
+    def submit(self, func, *args, user_id=None, source_type=None, source_ref=None):
+        """Queue func(*args); its return value (HTML) becomes the job result. Returns the job ID."""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._metrics['rejected'] += 1
+                raise QueueFull(f"AI analysis queue is full ({self._pending} jobs pending). Please try again shortly.")
+            self._pending += 1
+            self._metrics['submitted'] += 1
+
+        job = {
+            'job_id': uuid.uuid4().hex,
+            'user_id': user_id,
+            'source_type': source_type,
+            'source_ref': None if source_ref is None else str(source_ref)[:255],
+            'status': 'queued',
+            'result': None,
+            'error': None,
+            'created_at': time.time(),
+            'started_at': None,
+            'finished_at': None,
+        }
+        self.store.create(job)
+        try:
+            self._executor.submit(self._run, job['job_id'], job['created_at'], func, args)
+        except RuntimeError:
+            with self._lock:
+                self._pending -= 1
+            raise
+        return job['job_id']
+
+    def _run(self, job_id, created_at, func, args):
+        started = time.time()
+        self.store.update(job_id, status='running', started_at=started)
+        try:
+            result = func(*args)
+        except Exception as err:
+            print(f"AI Job {job_id} failed: {err}")
+            self.store.update(job_id, status='failed', error=str(err)[:1000], finished_at=time.time())
+            outcome = 'failed'
+        else:
+            self.store.update(job_id, status='done', result=result, finished_at=time.time())
+            outcome = 'completed'
+        finished = time.time()
+        with self._lock:
+            self._pending -= 1
+            self._metrics[outcome] += 1
+            self._metrics['run_time_total_ms'] += (finished - started) * 1000
+            self._metrics['queue_time_total_ms'] += (started - created_at) * 1000
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._metrics)
+            data.update({'pending': self._pending, 'max_pending': self.max_pending, 'workers': self.max_workers})
+        finished = data['completed'] + data['failed']
+        data['run_time_avg_ms'] = round(data['run_time_total_ms'] / finished, 2) if finished else 0.0
+        data['queue_time_avg_ms'] = round(data['queue_time_total_ms'] / finished, 2) if finished else 0.0
+        return data
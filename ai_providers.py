@@ -0,0 +1,294 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+try:
+    from openai import OpenAI, Timeout, AuthenticationError, PermissionDeniedError, NotFoundError
+    # Errors that say "this provider is misconfigured", not "this request is bad"
+    _PROVIDER_FAULTS = (AuthenticationError, PermissionDeniedError, NotFoundError)
+except Exception:
+    OpenAI = None
+    Timeout = None
+    _PROVIDER_FAULTS = ()
+
+
+class ProviderUnavailable(Exception):
+    """The chosen provider rejected our credentials or model; fail over to another one."""
+
+
+class NoProvider(Exception):
+    """No configured provider serves this kind of analysis."""
+
+
+class Provider:
+    """
+    One OpenAI-compatible endpoint: its models, limits and rolling health.
+
+    - model / vision_model: used for text and image analyses; a provider
+      without vision_model is never sent images.
+    - max_concurrency: requests in flight at once; a full provider is only
+      used once every other candidate is full too.
+    - read_timeout: cap on the per-attempt read timeout for this provider.
+
+    The last `window` outcomes give the error rate; successful latencies feed
+    an exponentially weighted moving average (alpha 0.2) used for routing.
+    After `failure_threshold` consecutive failures (or an error rate above
+    max_error_rate) the provider cools down for `cooldown` seconds, then gets
+    a single trial request, like db.CircuitBreaker.
+    """
+
+    def __init__(self, name, model, base_url=None, api_key=None, vision_model=None, max_concurrency=8,
+                 read_timeout=None, window=50, failure_threshold=3, max_error_rate=0.5, cooldown=30.0):
+        self.name = name
+        self.model = model
+        self.base_url = base_url
+        self.api_key = api_key
+        self.vision_model = vision_model
+        self.max_concurrency = max_concurrency
+        self.read_timeout = read_timeout
+        self.failure_threshold = failure_threshold
+        self.max_error_rate = max_error_rate
+        self.cooldown = cooldown
+        self.client = None
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=window)  # True/False per finished request
+        self._latency_ewma = None  # ms, successful requests only
+        self._in_flight = 0
+        self._consecutive_failures = 0
+        self._cooling_until = 0.0
+        self._trial_running = False
+        self._metrics = {'requests': 0, 'successes': 0, 'failures': 0, 'cooldowns': 0}
+
+    def model_for(self, image_mode):
+        return self.vision_model if image_mode else self.model
+
+    def error_rate(self):
+        with self._lock:
+            return self._error_rate()
+
+    def _error_rate(self):
+        if not self._outcomes:
+            return 0.0
+        return self._outcomes.count(False) / len(self._outcomes)
+
+    def available(self, now):
+        """True unless cooling down (a cooled-down provider gets one trial at a time)."""
+        with self._lock:
+            if now >= self._cooling_until:
+                return not (self._cooling_until and self._trial_running)
+            return False
+
+    def full(self):
+        return self._in_flight >= self.max_concurrency
+
+    def score(self):
+        # Untried providers sort first so each one gets measured
+        with self._lock:
+            return self._latency_ewma if self._latency_ewma is not None else 0.0
+
+    def begin(self):
+        with self._lock:
+            self._in_flight += 1
+            self._metrics['requests'] += 1
+            if self._cooling_until:
+                self._trial_running = True
+
+    def end(self, ok, latency_ms=None):
+        with self._lock:
+            self._in_flight -= 1
+            self._trial_running = False
+            self._outcomes.append(ok)
+            if ok:
+                self._metrics['successes'] += 1
+                self._consecutive_failures = 0
+                self._cooling_until = 0.0
+                if latency_ms is not None:
+                    self._latency_ewma = latency_ms if self._latency_ewma is None \
+                        else 0.8 * self._latency_ewma + 0.2 * latency_ms
+                return
+            self._metrics['failures'] += 1
+            self._consecutive_failures += 1
+            if (self._consecutive_failures >= self.failure_threshold or self._cooling_until
+                    or (len(self._outcomes) >= 10 and self._error_rate() > self.max_error_rate)):
+                if not self._cooling_until or time.monotonic() >= self._cooling_until:
+                    self._metrics['cooldowns'] += 1
+                    print(f"AI provider {self.name} cooling down for {self.cooldown:g}s")
+                self._cooling_until = time.monotonic() + self.cooldown
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._metrics)
+            data.update({
+                'model': self.model,
+                'vision_model': self.vision_model,
+                'in_flight': self._in_flight,
+                'error_rate': round(self._error_rate(), 3),
+                'latency_ewma_ms': round(self._latency_ewma, 1) if self._latency_ewma is not None else None,
+                'healthy': time.monotonic() >= self._cooling_until,
+            })
+        return data
+
+
+class ProviderRegistry:
+    """
+    The AI providers an analysis can go to, fastest healthy one first.
+
+    choose() ranks the providers that have an API key and a model for the
+    request's mode: available ones before cooling ones, then providers with
+    free capacity, then by latency EWMA. complete() sends a chat completion to
+    one provider with that provider's model and records the outcome. Callers
+    fail over by choosing again with the providers already tried excluded;
+    with LatencyBudget that is one provider per attempt, all inside the same
+    budget.
+
+    client_factory(provider) builds the OpenAI-compatible client; tests pass
+    one pointing at fake_ai_server.
+    """
+
+    def __init__(self, providers, client_factory=None):
+        if not providers:
+            raise ValueError("At least one AI provider is required")
+        self.providers = list(providers)
+        self.client_factory = client_factory or _openai_client
+        self._lock = threading.Lock()
+        self._metrics = {'routed': 0, 'failovers': 0, 'unavailable': 0}
+
+    def signature(self):
+        """Stable description of the configured models, for cache keys."""
+        return ','.join(f"{p.name}:{p.model}:{p.vision_model or ''}" for p in self.providers)
+
+    def serving(self, image_mode=False):
+        """Providers with an API key and a model for this mode."""
+        return [p for p in self.providers if p.api_key and p.model_for(image_mode)]
+
+    def choose(self, image_mode=False, exclude=()):
+        """
+        Best provider not in exclude (names already tried). Once every provider
+        has been tried, the ranking starts over, so a single provider is retried.
+        """
+        now = time.monotonic()
+        serving = self.serving(image_mode)
+        if not serving:
+            with self._lock:
+                self._metrics['unavailable'] += 1
+            raise NoProvider(f"No AI provider configured for {'image' if image_mode else 'text'} analysis")
+        candidates = [p for p in serving if p.name not in exclude] or serving
+        best = min(candidates, key=lambda p: (not p.available(now), p.full(), p.score()))
+        with self._lock:
+            self._metrics['routed'] += 1
+            if exclude:
+                self._metrics['failovers'] += 1
+        return best
+
+    def _client(self, provider):
+        if provider.client is None:
+            provider.client = self.client_factory(provider)
+        return provider.client
+
+    def complete(self, provider, kwargs, connect_timeout, read_timeout, image_mode=False, stream=False):
+        """
+        One chat completion on provider. For stream=True the response's first
+        chunk is awaited (so latency means time to first token) and
+        (first_chunk, chunk_iterator) is returned. The provider's concurrency
+        slot stays taken until the iterator is exhausted or closed, so close
+        it when abandoning a stream early.
+        """
+        if provider.read_timeout:
+            read_timeout = min(read_timeout, provider.read_timeout)
+        kwargs = dict(kwargs, model=provider.model_for(image_mode))
+        client = self._client(provider).with_options(timeout=Timeout(read_timeout, connect=connect_timeout))
+        started = time.perf_counter()
+        provider.begin()
+        try:
+            if stream:
+                response = client.chat.completions.create(stream=True, **kwargs)
+                chunks = iter(response)
+                first = next(chunks, None)
+            else:
+                response = client.chat.completions.create(**kwargs)
+        except _PROVIDER_FAULTS as err:
+            provider.end(False)
+            raise ProviderUnavailable(f"{provider.name}: {err}") from err
+        except Exception:
+            provider.end(False)
+            raise
+        latency_ms = (time.perf_counter() - started) * 1000
+        if stream:
+            held = _held_stream(provider, response, chunks, latency_ms)
+            next(held)  # enter the try block, so even an unread stream is released on close
+            return first, held
+        provider.end(True, latency_ms)
+        return response
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._metrics)
+        data['providers'] = {p.name: p.stats() for p in self.providers}
+        return data
+
+
+def _held_stream(provider, response, chunks, latency_ms):
+    """The rest of a stream; ends the provider's request (freeing its slot) when done or closed."""
+    ok = True
+    try:
+        yield
+        yield from chunks
+    except GeneratorExit:
+        # Closed by the reader (e.g. the browser went away): not the provider's fault
+        raise
+    except Exception:
+        ok = False
+        raise
+    finally:
+        close = getattr(response, 'close', None)
+        if close:
+            close()
+        provider.end(ok, latency_ms if ok else None)
+
+
+def _openai_client(provider):
+    if OpenAI is None:
+        raise ProviderUnavailable("The openai package is not installed")
+    # Retries are done by the caller's LatencyBudget, which also fails over
+    return OpenAI(api_key=provider.api_key, base_url=provider.base_url, max_retries=0)
+
+
+def provider_from_config(config):
+    """
+    Provider from a dict like
+    {"name": "groq", "base_url": "https://api.groq.com/openai/v1", "api_key_env": "GROQ_API_KEY",
+     "model": "llama-3.2-90b-vision-preview", "vision_model": "llama-3.2-90b-vision-preview",
+     "max_concurrency": 4}
+    api_key_env names the environment variable holding the key, so files never contain secrets.
+    """
+    config = dict(config)
+    key_env = config.pop('api_key_env', None)
+    if key_env:
+        config['api_key'] = os.getenv(key_env)
+    return Provider(**config)
+
+
+def registry_from_env(client_factory=None):
+    """
+    Providers from AI_PROVIDERS_FILE (a JSON list of provider configs) or the
+    AI_PROVIDERS environment variable (the same JSON inline). Without either,
+    OpenAI (OPENAI_API_KEY / OPENAI_BASE_URL / OPENAI_MODEL) is the only
+    provider, plus Groq when GROQ_API_KEY is set.
+    """
+    path = os.getenv('AI_PROVIDERS_FILE')
+    if path:
+        with open(path, 'r', encoding='utf-8') as f:
+            configs = json.load(f)
+    elif os.getenv('AI_PROVIDERS'):
+        configs = json.loads(os.getenv('AI_PROVIDERS'))
+    else:
+        model = os.getenv('OPENAI_MODEL', 'gpt-4o')
+        configs = [{'name': 'openai', 'base_url': os.getenv('OPENAI_BASE_URL'), 'api_key_env': 'OPENAI_API_KEY',
+                    'model': model, 'vision_model': model}]
+        if os.getenv('GROQ_API_KEY'):
+            configs.append({'name': 'groq', 'base_url': 'https://api.groq.com/openai/v1',
+                            'api_key_env': 'GROQ_API_KEY', 'model': 'llama-3.2-90b-vision-preview',
+                            'vision_model': 'llama-3.2-90b-vision-preview'})
+    return ProviderRegistry([provider_from_config(c) for c in configs], client_factory=client_factory)
@@ -1,15 +1,36 @@
 
-from flask import Flask, render_template, request, redirect, url_for, session, flash
+from flask import (Flask, render_template, request, redirect, url_for, session, flash, jsonify,
+                   Response, stream_template, stream_with_context)
 import os
 from werkzeug.utils import secure_filename
 import mysql.connector
-import itertools # For interaction pairing
+from markupsafe import escape
 try:
-    from openai import OpenAI
+    from openai import APIConnectionError, RateLimitError, InternalServerError
+    # Transient failures worth another try inside the latency budget (timeouts are APIConnectionErrors)
+    AI_RETRYABLE = (APIConnectionError, RateLimitError, InternalServerError)
 except Exception:
-    OpenAI = None
-import base64
+    AI_RETRYABLE = ()
+import re
+import time
+import itertools
+from contextlib import contextmanager
+from datetime import datetime
 from dotenv import load_dotenv
+from db import pool_from_env, breaker_from_env, PoolTimeout
+from ai_jobs import JobStore, JobQueue, QueueFull
+from ai_budget import LatencyBudget
+from ai_providers import registry_from_env, ProviderUnavailable
+from ai_cache import AnalysisCache, MemoryTier, DiskTier, analysis_key
+from imaging import ImagePreprocessor
+from uploads import ContentStore
+from pagination import KeysetPaginator, decode_cursor
+from patient_search import PatientSearch, search_tokens
+from catalog import MedicineCatalog
+from invoices import InvoiceSnapshots
+from stock import StockReservations, InsufficientStock, AlreadyProcessed, demand, allocate
+from validation import (RuleStore, AllergyMatcher, ValidationCache, compile_dosage, DosageError,
+                        DEFAULT_MAX_DOSAGE, DEFAULT_INTERACTIONS)
 
 # Load environment variables
 load_dotenv()
@@ -22,38 +43,94 @@ db_config = {
     'host': 'localhost',
     'user': 'root',      # Default XAMPP/MySQL user
     'password': '123456',      # Default XAMPP/MySQL password (empty)
-    'database': 'pharmacy_db'
+    'database': 'pharmacy_db',
+    'connection_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', 5))
 }
 
+# One pool per worker process; size it with DB_POOL_SIZE / DB_POOL_MAX_OVERFLOW
+db_pool = pool_from_env(db_config)
+# Once the DB is known down, skip straight to TEMP_DATA until the probe sees it back
+db_breaker = breaker_from_env(probe=db_pool.probe)
+
+@contextmanager
 def get_db_connection():
+    """
+    Check out a pooled connection for the duration of a with-block.
+    Yields None if the database is unreachable (or the circuit breaker is open)
+    so routes can fall back to TEMP_DATA.
+    The connection always goes back to the pool, even when the route raises.
+    """
+    conn = None
+    if db_breaker.allow():
+        try:
+            conn = db_pool.acquire()
+            db_breaker.record_success()
+        except PoolTimeout as err:
+            # Pool is busy, not down: don't count it against the breaker
+            print(f"DB Pool Error: {err}")
+        except mysql.connector.Error as err:
+            print(f"DB Connection Error: {err}")
+            db_breaker.record_failure()
     try:
-        conn = mysql.connector.connect(**db_config)
-        return conn
-    except mysql.connector.Error:
-        return None
+        yield conn
+    finally:
+        if conn:
+            conn.close()
 
-# AI Check Constants
-AI_MAX_DOSAGE = {
-    'Paracetamol': 4000, # mg
-    'Ibuprofen': 1200,
-    'Amoxicillin': 1500,
-    'Cetirizine': 10,
-    'Aspirin': 300,
-    'Metformin': 2000,
-    'Atorvastatin': 80,
-    'Omeprazole': 40,
-    'Azithromycin': 500,
-    'Pantoprazole': 40,
-    'Diclofenac': 150
-}
+# AI Check Rules
+# Dosage limits and interactions live in the dosage_rules / interaction_rules
+# tables (see setup_db.py). Each worker keeps an immutable snapshot in memory and
+# swaps it when rule_set_version changes; see validation.RuleStore
+RULES = RuleStore(get_db_connection, refresh_interval=float(os.getenv('RULES_REFRESH_INTERVAL', 10)))
 
-AI_INTERACTIONS = {
-    frozenset(['Aspirin', 'Ibuprofen']): 'Increased risk of bleeding',
-    frozenset(['Paracetamol', 'Warfarin']): 'Increased risk of bleeding',
-    frozenset(['Amoxicillin', 'Methotrexate']): 'Increased toxicity',
-    frozenset(['Metformin', 'Contrast Dye']): 'Risk of lactic acidosis',
-    frozenset(['Simvastatin', 'Amlodipine']): 'Increased risk of myopathy'
-}
+# Guarded, retrying stock deduction shared by single and batch dispensing
+STOCK = StockReservations(attempts=int(os.getenv('STOCK_RETRY_ATTEMPTS', 3)))
+
+# Medicine names, prices and stock for every route; reloaded only when catalog_version moves
+CATALOG = MedicineCatalog(get_db_connection, refresh_interval=float(os.getenv('CATALOG_REFRESH_INTERVAL', 10)),
+                          miss_interval=float(os.getenv('CATALOG_MISS_INTERVAL', 1)))
+LOW_STOCK_THRESHOLD = int(os.getenv('LOW_STOCK_THRESHOLD', 100))
+
+def with_medicine_info(rows):
+    """
+    Fill medicine_name, price, stock and in_catalog on rows carrying
+    medicine_id, from the catalog. For display and checks only: bills are
+    priced from STOCK.prices inside the dispensing transaction, since the
+    catalog can lag a price change.
+    """
+    catalog = CATALOG.lookup({row['medicine_id'] for row in rows})
+    for row in rows:
+        med = catalog.get(row['medicine_id'])
+        row['medicine_name'] = med['name'] if med else "Unknown"
+        row['price'] = med['price'] if med else 0
+        row['stock'] = med['quantity'] if med else 0
+        row['in_catalog'] = med is not None
+    return rows
+
+# Paid invoices, frozen at payment time and served from invoice_snapshots afterwards
+INVOICES = InvoiceSnapshots(max_entries=int(os.getenv('INVOICE_SNAPSHOT_CACHE_SIZE', 1024)))
+
+def price_invoice(document):
+    """
+    Medicine names for an invoice document's items, from the catalog. Items keep
+    the unit price stored when the bill was made; only lines billed before
+    prices were stored fall back to the catalog's.
+    """
+    billed = [item['price'] for item in document['items']]
+    for item, price in zip(with_medicine_info(document['items']), billed):
+        item.pop('stock', None)
+        item.pop('in_catalog', None)
+        if price is not None:
+            item['price'] = price
+    return document
+
+# Results for repeat prescriptions (same medicines, doses, allergies and rule version)
+VALIDATION_CACHE = ValidationCache(max_entries=int(os.getenv('VALIDATION_CACHE_SIZE', 10000)))
+
+# Allergen vocabulary fixed to the known ingredients; other patient terms are matched per patient
+ALLERGY_MATCHER = AllergyMatcher(
+    vocabulary=[n.lower() for n in list(DEFAULT_MAX_DOSAGE) + [n for pair in DEFAULT_INTERACTIONS for n in pair]]
+)
 
 # --- Temp Storage (Fallback if DB is down) ---
 TEMP_DATA = {
@@ -86,118 +163,317 @@ TEMP_DATA = {
 UPLOAD_FOLDER = 'static/uploads'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+# Content-addressed: static/uploads/<sha[:2]>/<sha>.<ext>, one file per distinct image
+UPLOADS = ContentStore(UPLOAD_FOLDER, get_db_connection)
 
-# Configure OpenAI API
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-try:
-    client = OpenAI(api_key=OPENAI_API_KEY) if OpenAI else None
-except Exception:
-    client = None
+# AI providers (OpenAI, Groq, or fake_ai_server for local runs) from AI_PROVIDERS_FILE /
+# AI_PROVIDERS, else OPENAI_* and GROQ_API_KEY; each analysis goes to the fastest healthy one
+AI_PROVIDERS = registry_from_env()
+# Cache keys follow the configured models, so a provider change doesn't serve old analyses
+AI_MODEL = AI_PROVIDERS.signature()
+
+# Every AI call gets AI_BUDGET_SECONDS in total (retries included); past that the
+# rule-based local analysis answers instead
+AI_BUDGET = LatencyBudget(
+    budget=float(os.getenv('AI_BUDGET_SECONDS', 15)),
+    connect_timeout=float(os.getenv('AI_CONNECT_TIMEOUT', 3)),
+    read_timeout=float(os.getenv('AI_READ_TIMEOUT', 12)),
+    retries=int(os.getenv('AI_RETRIES', 2)),
+    # Each retry goes to the next provider, see routed_completion
+    retry_on=AI_RETRYABLE + (ProviderUnavailable,),
+)
+# Bump when the prompts below change so cached analyses from old prompts stop matching
+AI_PROMPT_VERSION = 1
+
+# Two-tier analysis cache: per-process LRU in front of a shared on-disk store
+AI_CACHE = AnalysisCache(
+    MemoryTier(max_entries=int(os.getenv('AI_CACHE_MEMORY_ENTRIES', 512)),
+               ttl=int(os.getenv('AI_CACHE_MEMORY_TTL', 3600))),
+    DiskTier(os.getenv('AI_CACHE_DIR', 'cache/ai_analysis'),
+             max_bytes=int(os.getenv('AI_CACHE_DISK_MAX_MB', 256)) * 1024 * 1024,
+             ttl=int(os.getenv('AI_CACHE_DISK_TTL', 30 * 24 * 3600))),
+)
+
+# Vision uploads are shrunk before sending; Pillow is optional (see imaging.py)
+IMAGE_PREP = ImagePreprocessor(
+    max_side=int(os.getenv('AI_IMAGE_MAX_SIDE', 1600)),
+    max_bytes=int(os.getenv('AI_IMAGE_MAX_KB', 512)) * 1024,
+    fmt=os.getenv('AI_IMAGE_FORMAT', 'JPEG'),
+)
+
+# AI calls run on a bounded background pool; results are kept in ai_jobs for polling
+AI_JOBS = JobQueue(
+    JobStore(get_db_connection),
+    max_workers=int(os.getenv('AI_JOB_WORKERS', 4)),
+    max_pending=int(os.getenv('AI_JOB_MAX_PENDING', 100)),
+)
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def encode_image(image_path):
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
+def analysis_request(context_text, image_mode=False):
+    """Chat completion arguments for one analysis (context_text is the filepath in image_mode)."""
+    if image_mode:
+        image_path = context_text
+        # Grayscale, downscaled, metadata-free and labelled with its real MIME type
+        image = IMAGE_PREP.prepare(image_path)
+        print(f"Image prep: {image.original_bytes // 1024} KB -> {len(image.data) // 1024} KB {image.mime} "
+              f"(saved {image.bytes_saved // 1024} KB) in {image.elapsed_ms:.0f} ms")
+        
+        prompt_text = """
+        Analyze this prescription image. 
+        1. Transcribe the text found in the image purely.
+        2. List the medicines found.
+        3. For each medicine, explain what condition it treats.
+        4. Provide any warnings or recommendations (e.g. allergies).
+        Format the output as HTML. Use <ul> for lists, <strong> for headers.
+        """
+        
+        return dict(
+            messages=[
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": prompt_text},
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": image.data_url()
+                            },
+                        },
+                    ],
+                }
+            ],
+            max_tokens=1000
+        )
+        
+    else:
+        # Text Mode (Database Record)
+        prompt = f"""
+        You are a medical assistant AI. Analyze the following prescription data:
+        {context_text}
+        
+        1. Identify the likely medical condition being treated based on the combination of medicines.
+        2. Explain what each medicine is used for.
+        3. Check for any potential severe drug interactions between these specific medicines.
+        4. Provide a summary recommendation for the pharmacist.
+        
+        Format the output as clear HTML. Do not use markdown code blocks (```html), just return the raw HTML tags like <h3>, <p>, <ul>.
+        """
+        
+        return dict(
+            messages=[
+                {"role": "system", "content": "You are a helpful medical pharmacy assistant."},
+                {"role": "user", "content": prompt}
+            ]
+        )
 
-def get_ai_analysis_mock(context_text, image_mode=False):
+def packed_analysis_request(context_texts):
     """
-    Real Integration with OpenAI API (GPT-4o).
+    One chat completion covering several text-mode analyses (precompute_analyses.py).
+    Each answer comes back after its own marker; see split_packed_analysis.
     """
+    listing = "\n".join(f"[{i}] {text}" for i, text in enumerate(context_texts, 1))
+    prompt = f"""
+        You are a medical assistant AI. Analyze each of the following {len(context_texts)} prescriptions independently:
+        {listing}
+        
+        For each prescription:
+        1. Identify the likely medical condition being treated based on the combination of medicines.
+        2. Explain what each medicine is used for.
+        3. Check for any potential severe drug interactions between these specific medicines.
+        4. Provide a summary recommendation for the pharmacist.
+        
+        Start the answer for prescription N with the line <!-- analysis N --> and never refer to the other prescriptions.
+        Format each answer as clear HTML. Do not use markdown code blocks (```html), just return the raw HTML tags like <h3>, <p>, <ul>.
+        """
+    return dict(
+        messages=[
+            {"role": "system", "content": "You are a helpful medical pharmacy assistant."},
+            {"role": "user", "content": prompt}
+        ]
+    )
+
+PACKED_MARKER = re.compile(r"<!--\s*analysis\s+(\d+)\s*-->")
+
+def split_packed_analysis(text, count):
+    """Per-prescription answers from a packed response, or None unless all count arrived in order."""
+    text = text.replace("```html", "").replace("```", "")
+    markers = list(PACKED_MARKER.finditer(text))
+    if [int(m.group(1)) for m in markers] != list(range(1, count + 1)):
+        return None
+    ends = [m.start() for m in markers[1:]] + [len(text)]
+    parts = [text[m.end():end].strip() for m, end in zip(markers, ends)]
+    return parts if all(parts) else None
+
+def routed_completion(kwargs, image_mode=False, stream=False, budget=None):
+    """
+    Chat completion on the fastest healthy provider. Every retry the budget
+    allows goes to the next best provider not tried yet (failover).
+    """
+    tried = set()
+
+    def attempt(connect, read):
+        provider = AI_PROVIDERS.choose(image_mode, exclude=tried)
+        tried.add(provider.name)
+        return AI_PROVIDERS.complete(provider, kwargs, connect, read, image_mode, stream)
+
+    return (budget or AI_BUDGET).call(attempt)
+
+def request_ai_analysis(context_text, image_mode=False):
+    """
+    Real Integration with the configured AI providers (see AI_PROVIDERS).
+    Raises on any API/quota error; see get_ai_analysis_mock for the fallback.
+    """
+    kwargs = analysis_request(context_text, image_mode)
+    started = time.perf_counter()
+    response = routed_completion(kwargs, image_mode)
+    print(f"AI round trip {(time.perf_counter() - started) * 1000:.0f} ms")
+    if image_mode:
+        return response.choices[0].message.content
+    return response.choices[0].message.content.replace("```html", "").replace("```", "")
+
+def stream_ai_analysis(context_text, image_mode=False):
+    """
+    Yield the analysis text as the model writes it (streaming chat completions).
+    The latency budget covers the wait for the first chunk; after that each
+    chunk only has to arrive within the read timeout.
+    """
+    kwargs = analysis_request(context_text, image_mode)
+    first, chunks = routed_completion(kwargs, image_mode, stream=True)
     try:
-        if image_mode:
-            # context_text is the filepath in image_mode
-            image_path = context_text
-            base64_image = encode_image(image_path)
-            
-            prompt_text = """
-            Analyze this prescription image. 
-            1. Transcribe the text found in the image purely.
-            2. List the medicines found.
-            3. For each medicine, explain what condition it treats.
-            4. Provide any warnings or recommendations (e.g. allergies).
-            Format the output as HTML. Use <ul> for lists, <strong> for headers.
-            """
-            
-            response = client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": prompt_text},
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{base64_image}"
-                                },
-                            },
-                        ],
-                    }
-                ],
-                max_tokens=1000
-            )
-            return response.choices[0].message.content
-            
-        else:
-            # Text Mode (Database Record)
-            prompt = f"""
-            You are a medical assistant AI. Analyze the following prescription data:
-            {context_text}
-            
-            1. Identify the likely medical condition being treated based on the combination of medicines.
-            2. Explain what each medicine is used for.
-            3. Check for any potential severe drug interactions between these specific medicines.
-            4. Provide a summary recommendation for the pharmacist.
-            
-            Format the output as clear HTML. Do not use markdown code blocks (```html), just return the raw HTML tags like <h3>, <p>, <ul>.
-            """
-            
-            response = client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": "You are a helpful medical pharmacy assistant."},
-                    {"role": "user", "content": prompt}
-                ]
-            )
-            return response.choices[0].message.content.replace("```html", "").replace("```", "")
-            
+        if first is None:
+            return
+        for chunk in itertools.chain([first], chunks):
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    finally:
+        # Frees the provider's concurrency slot even if the reader stops early
+        chunks.close()
+
+def _held_fence_prefix(text):
+    # Length of a trailing partial "```html" that the next token might complete
+    for n in range(min(len(text), 6), 0, -1):
+        if "```html".startswith(text[-n:]):
+            return n
+    return 0
+
+def streamed_analysis(cache_key, context_text, image_mode=False, fallback_html=None):
+    """
+    Forward the analysis as it streams, with code fences stripped across token
+    boundaries. A stream that completes is cached like a background job result;
+    if the model can't be reached the local fallback is sent instead.
+    """
+    parts = []
+    pending = ""
+    started = time.perf_counter()
+    try:
+        for delta in stream_ai_analysis(context_text, image_mode):
+            if not parts and not pending:
+                print(f"AI first token after {(time.perf_counter() - started) * 1000:.0f} ms")
+            pending += delta
+            hold = _held_fence_prefix(pending)
+            ready, pending = pending[:len(pending) - hold], pending[len(pending) - hold:]
+            ready = ready.replace("```html", "").replace("```", "")
+            if ready:
+                parts.append(ready)
+                yield ready
     except Exception as e:
         print(f"AI API/Quota Error: {e}. Falling back to Simulation Mode.")
-        
-        # Fallback Simulation Response
-        fallback_response = """
-        <h3><i class='fas fa-robot'></i> AI Analysis Report (Simulation)</h3>
-        <div style="background-color: #f8dbdb; color: #721c24; padding: 10px; border-radius: 5px; margin-bottom: 15px;">
-            <strong>Notice:</strong> API Quota Exceeded. Showing simulated analysis for demonstration.
-        </div>
+        if not parts:
+            AI_BUDGET.record_fallback()
+            yield fallback_html or simulated_analysis(image_mode)
+        else:
+            yield "<p><em>The AI response was interrupted. Please try again.</em></p>"
+        return
+    tail = pending.replace("```html", "").replace("```", "")
+    if tail:
+        parts.append(tail)
+        yield tail
+    print(f"AI stream complete in {(time.perf_counter() - started) * 1000:.0f} ms")
+    AI_CACHE.put(cache_key, "".join(parts))
+
+def simulated_analysis(image_mode=False):
+    # Fallback Simulation Response
+    fallback_response = """
+    <h3><i class='fas fa-robot'></i> AI Analysis Report (Simulation)</h3>
+    <div style="background-color: #f8dbdb; color: #721c24; padding: 10px; border-radius: 5px; margin-bottom: 15px;">
+        <strong>Notice:</strong> API Quota Exceeded. Showing simulated analysis for demonstration.
+    </div>
+    """
+    
+    if image_mode:
+        fallback_response += """
+        <p><strong>Image Analysis:</strong> Scanned prescription image successfully.</p>
+        <ul>
+            <li><strong>Detected Text:</strong> "Rx: Amoxicillin 500mg, 1 tablet twice daily for 7 days."</li>
+            <li><strong>Medicines Identified:</strong> Amoxicillin</li>
+            <li><strong>Calculated Dosage:</strong> 500mg, BID (Two times a day)</li>
+        </ul>
+        <p><strong>Clinical Explanation:</strong> Amoxicillin is a penicillin antibiotic used to treat bacterial infections such as chest infections (including pneumonia) and dental abscesses.</p>
+        <div style="background:#e8f5e9; padding:10px; border-radius:5px;"><strong>Safety Check:</strong> No immediate contraindications found in visual scan. Verify patient allergies.</div>
+        """
+    else:
+        fallback_response += """
+        <p><strong>Data Analysis:</strong> Based on the digital record:</p>
+        <ul>
+            <li><strong>Condition Identified:</strong> Likely Bacterial Infection or Respiratory Tract Infection.</li>
+            <li><strong>Treatment Protocols:</strong> The prescribed antibiotic course is standard for this condition.</li>
+            <li><strong>Drug Interactions:</strong> No severe interactions detected with common concurrent medications (e.g. Paracetamol).</li>
+        </ul>
+        <p><strong>recommendation:</strong> Dispense as prescribed. Advise patient to complete the full course even if they feel better.</p>
         """
         
-        if image_mode:
-            fallback_response += """
-            <p><strong>Image Analysis:</strong> Scanned prescription image successfully.</p>
-            <ul>
-                <li><strong>Detected Text:</strong> "Rx: Amoxicillin 500mg, 1 tablet twice daily for 7 days."</li>
-                <li><strong>Medicines Identified:</strong> Amoxicillin</li>
-                <li><strong>Calculated Dosage:</strong> 500mg, BID (Two times a day)</li>
-            </ul>
-            <p><strong>Clinical Explanation:</strong> Amoxicillin is a penicillin antibiotic used to treat bacterial infections such as chest infections (including pneumonia) and dental abscesses.</p>
-            <div style="background:#e8f5e9; padding:10px; border-radius:5px;"><strong>Safety Check:</strong> No immediate contraindications found in visual scan. Verify patient allergies.</div>
-            """
-        else:
-            fallback_response += """
-            <p><strong>Data Analysis:</strong> Based on the digital record:</p>
-            <ul>
-                <li><strong>Condition Identified:</strong> Likely Bacterial Infection or Respiratory Tract Infection.</li>
-                <li><strong>Treatment Protocols:</strong> The prescribed antibiotic course is standard for this condition.</li>
-                <li><strong>Drug Interactions:</strong> No severe interactions detected with common concurrent medications (e.g. Paracetamol).</li>
-            </ul>
-            <p><strong>recommendation:</strong> Dispense as prescribed. Advise patient to complete the full course even if they feel better.</p>
-            """
-            
-        return fallback_response
+    return fallback_response
+
+def local_analysis(lines, alerts):
+    """
+    Rule-based report built from the structured prescription record, used when the
+    AI service can't answer inside its latency budget. alerts come from validation_errors.
+    """
+    report = """
+    <h3><i class='fas fa-clipboard-check'></i> Prescription Analysis (Rule-Based)</h3>
+    <div style="background-color: #fff3cd; color: #856404; padding: 10px; border-radius: 5px; margin-bottom: 15px;">
+        <strong>Notice:</strong> The AI assistant did not answer in time. This report was built from the prescription record and the pharmacy's safety rules.
+    </div>
+    <p><strong>Medicines:</strong></p>
+    <ul>
+    """
+    for line in lines:
+        daily = f", {float(line['daily_mg']):g} mg/day" if line.get('daily_mg') is not None else ""
+        report += f"<li><strong>{escape(line['medicine_name'])}</strong>: {escape(line['dosage'])} for {line['days']} days{daily}</li>"
+    report += "</ul>"
+    if alerts:
+        report += "<p><strong>Safety Alerts:</strong></p><ul>"
+        report += "".join(f"<li>{escape(alert)}</li>" for alert in alerts)
+        report += "</ul><p><strong>Recommendation:</strong> Resolve the alerts above with the prescriber before dispensing.</p>"
+    else:
+        report += """
+        <div style="background:#e8f5e9; padding:10px; border-radius:5px;"><strong>Safety Check:</strong> No allergy, dosage or interaction rule is violated. Dispense as prescribed.</div>
+        """
+    return report
+
+def get_ai_analysis_mock(context_text, image_mode=False):
+    """
+    Real Integration with the configured AI providers, falling back to a simulated report.
+    """
+    try:
+        return request_ai_analysis(context_text, image_mode)
+    except Exception as e:
+        print(f"AI API/Quota Error: {e}. Falling back to Simulation Mode.")
+        AI_BUDGET.record_fallback()
+        return simulated_analysis(image_mode)
 
+def analyze_and_cache(cache_key, context_text, image_mode=False, fallback_html=None):
+    """Background job body: real analyses are cached, fallbacks are not."""
+    try:
+        result = request_ai_analysis(context_text, image_mode)
+    except Exception as e:
+        print(f"AI API/Quota Error: {e}. Falling back to Simulation Mode.")
+        AI_BUDGET.record_fallback()
+        return fallback_html or simulated_analysis(image_mode)
+    AI_CACHE.put(cache_key, result)
+    return result
 
 @app.route('/')
 def index():
@@ -221,30 +497,29 @@ def create_user():
     password = request.form['password']
     role = request.form['role']
     
-    conn = get_db_connection()
-    if conn:
-        try:
-            cursor = conn.cursor(buffered=True)
-            cursor.execute("INSERT INTO users (full_name, username, email, password, role) VALUES (%s, %s, %s, %s, %s)", 
-                           (full_name, username, email, password, role))
-            conn.commit()
-            cursor.close()
-            conn.close()
-            flash(f"User {username} created successfully!")
-        except mysql.connector.Error as err:
-            flash(f"Database Error: {err}")
-    else:
-        # Temp Data Add
-        new_id = max([u['user_id'] for u in TEMP_DATA['users']]) + 1
-        TEMP_DATA['users'].append({
-            'user_id': new_id,
-            'full_name': full_name,
-            'username': username,
-            'email': email,
-            'password': password,
-            'role': role
-        })
-        flash(f"User {username} created (Temp Storage)!")
+    with get_db_connection() as conn:
+        if conn:
+            try:
+                cursor = conn.cursor(buffered=True)
+                cursor.execute("INSERT INTO users (full_name, username, email, password, role) VALUES (%s, %s, %s, %s, %s)", 
+                               (full_name, username, email, password, role))
+                conn.commit()
+                cursor.close()
+                flash(f"User {username} created successfully!")
+            except mysql.connector.Error as err:
+                flash(f"Database Error: {err}")
+        else:
+            # Temp Data Add
+            new_id = max([u['user_id'] for u in TEMP_DATA['users']]) + 1
+            TEMP_DATA['users'].append({
+                'user_id': new_id,
+                'full_name': full_name,
+                'username': username,
+                'email': email,
+                'password': password,
+                'role': role
+            })
+            flash(f"User {username} created (Temp Storage)!")
         
     return redirect(url_for('admin_dashboard'))
 
@@ -257,39 +532,34 @@ def admin_dashboard():
     sales = []
     patients = []
     
-    conn = get_db_connection()
-    if conn:
-        try:
-            cursor = conn.cursor(dictionary=True, buffered=True)
-            cursor.execute("SELECT * FROM users")
-            users = cursor.fetchall()
-            
-            # Simple recent sales from billing
-            cursor.execute("SELECT * FROM billing ORDER BY generated_at DESC LIMIT 5")
-            raw_sales = cursor.fetchall() 
-            # Note: A proper join for names is better but keeping it simple for admin view or assuming IDs are fine
-            # Let's try a join for better UX if possible, reusing query from pharmacist dashboard logic
-            cursor.execute("""
-                SELECT b.bill_id, b.total_amount, b.payment_status, b.generated_at, p.name as patient_name 
-                FROM billing b 
-                JOIN prescriptions pr ON b.prescription_id = pr.prescription_id 
-                JOIN patients p ON pr.patient_id = p.patient_id 
-                ORDER BY b.generated_at DESC LIMIT 5
-            """)
-            sales = cursor.fetchall()
-            
-            cursor.execute("SELECT * FROM patients ORDER BY patient_id DESC LIMIT 10")
-            patients = cursor.fetchall()
-            
-            cursor.close()
-            conn.close()
-        except mysql.connector.Error as err:
-            print(f"Admin DB Error: {err}")
+    with get_db_connection() as conn:
+        if conn:
+            try:
+                cursor = conn.cursor(dictionary=True, buffered=True)
+                cursor.execute("SELECT * FROM users")
+                users = cursor.fetchall()
+                
+                # Recent sales with patient names, same query as the pharmacist dashboard
+                cursor.execute("""
+                    SELECT b.bill_id, b.total_amount, b.payment_status, b.generated_at, p.name as patient_name 
+                    FROM billing b 
+                    JOIN prescriptions pr ON b.prescription_id = pr.prescription_id 
+                    JOIN patients p ON pr.patient_id = p.patient_id 
+                    ORDER BY b.generated_at DESC LIMIT 5
+                """)
+                sales = cursor.fetchall()
+                
+                cursor.execute("SELECT * FROM patients ORDER BY patient_id DESC LIMIT 10")
+                patients = cursor.fetchall()
+                
+                cursor.close()
+            except mysql.connector.Error as err:
+                print(f"Admin DB Error: {err}")
+                users = TEMP_DATA['users']
+                patients = TEMP_DATA['patients']
+        else:
             users = TEMP_DATA['users']
             patients = TEMP_DATA['patients']
-    else:
-        users = TEMP_DATA['users']
-        patients = TEMP_DATA['patients']
         
     return render_template('admin_dashboard.html', users=users, sales=sales, patients=patients)
 
@@ -301,24 +571,22 @@ def forgot_password():
         new_password = request.form['new_password']
         
         updated = False
-        conn = get_db_connection()
-        
-        if conn:
-            try:
-                cursor = conn.cursor(dictionary=True, buffered=True)
-                # Verify user by username AND email
-                cursor.execute("SELECT * FROM users WHERE username = %s AND email = %s", (username, email))
-                user = cursor.fetchone()
-                
-                if user:
-                    # Update password
-                    cursor.execute("UPDATE users SET password = %s WHERE user_id = %s", (new_password, user['user_id']))
-                    conn.commit()
-                    updated = True
-                cursor.close()
-                conn.close()
-            except mysql.connector.Error as err:
-                print(f"Reset Password DB Error: {err}")
+        with get_db_connection() as conn:
+            if conn:
+                try:
+                    cursor = conn.cursor(dictionary=True, buffered=True)
+                    # Verify user by username AND email
+                    cursor.execute("SELECT * FROM users WHERE username = %s AND email = %s", (username, email))
+                    user = cursor.fetchone()
+                    
+                    if user:
+                        # Update password
+                        cursor.execute("UPDATE users SET password = %s WHERE user_id = %s", (new_password, user['user_id']))
+                        conn.commit()
+                        updated = True
+                    cursor.close()
+                except mysql.connector.Error as err:
+                    print(f"Reset Password DB Error: {err}")
         
         # Fallback/Sync with Temp Data
         for u in TEMP_DATA['users']:
@@ -342,18 +610,15 @@ def login():
         password = request.form['password']
         
         user = None
-        conn = get_db_connection()
-        
-        if conn:
-            try:
-                cursor = conn.cursor(dictionary=True, buffered=True)
-                cursor.execute("SELECT * FROM users WHERE username = %s AND password = %s", (username, password))
-                user = cursor.fetchone()
-                cursor.close()
-                conn.close()
-            except mysql.connector.Error as err:
-                print(f"Login Query Error: {err}")
-                conn = None # Treat as connection failure to trigger fallback
+        with get_db_connection() as conn:
+            if conn:
+                try:
+                    cursor = conn.cursor(dictionary=True, buffered=True)
+                    cursor.execute("SELECT * FROM users WHERE username = %s AND password = %s", (username, password))
+                    user = cursor.fetchone()
+                    cursor.close()
+                except mysql.connector.Error as err:
+                    print(f"Login Query Error: {err}")
         
         # Fallback to Temp Data if user not found in DB or DB failed
         if not user:
@@ -379,29 +644,50 @@ def logout():
     session.clear()
     return redirect(url_for('login'))
 
+# Dashboard patient lists: newest first, PATIENTS_PAGE_SIZE per page, seek-paginated on the primary key
+PATIENT_PAGES = KeysetPaginator('patient_id', default_size=int(os.getenv('PATIENTS_PAGE_SIZE', 25)))
+
+# Type-ahead for the prescription form: indexed SQL, plus an optional per-process prefix trie
+PATIENT_SEARCH = PatientSearch(
+    get_db_connection,
+    use_trie=os.getenv('PATIENT_SEARCH_TRIE', '0') == '1',
+    refresh_interval=float(os.getenv('PATIENT_SEARCH_REFRESH_INTERVAL', 30)),
+)
+
+def patient_page(conn, token, per_page=None):
+    """One page of patients (only the listed columns) for the ?cursor= token."""
+    direction, key = decode_cursor(token)
+    size = PATIENT_PAGES.page_size(per_page)
+    if conn:
+        where, params, order = PATIENT_PAGES.seek(direction, key)
+        try:
+            cursor = conn.cursor(dictionary=True, buffered=True)
+            cursor.execute(f"""
+                SELECT patient_id, name, age, gender, contact
+                FROM patients
+                WHERE {where}
+                ORDER BY {order}
+                LIMIT %s
+            """, params + (size + 1,))
+            rows = cursor.fetchall()
+            cursor.close()
+            return PATIENT_PAGES.page(rows, direction, size)
+        except mysql.connector.Error as err:
+            print(f"Patient Page Query Error: {err}")
+    return PATIENT_PAGES.page_from_list(TEMP_DATA['patients'], direction, key, size)
+
 @app.route('/doctor_dashboard')
 def doctor_dashboard():
     if 'user_id' not in session or session['role'] != 'doctor':
         return redirect(url_for('login'))
     
-    conn = get_db_connection()
-    if not conn:
-        # Fallback to Temp Data
-        patients = TEMP_DATA['patients']
-        medicines = TEMP_DATA['medicines']
-    else:
-        try:
-            cursor = conn.cursor(dictionary=True, buffered=True)
-            cursor.execute("SELECT * FROM patients ORDER BY patient_id DESC")
-            patients = cursor.fetchall()
-            cursor.execute("SELECT * FROM medicines")
-            medicines = cursor.fetchall()
-            cursor.close()
-            conn.close()
-        except mysql.connector.Error as err:
-            print(f"Dashboard Query Error: {err}")
-            patients = TEMP_DATA['patients']
+    with get_db_connection() as conn:
+        patients = patient_page(conn, request.args.get('cursor'), request.args.get('per_page'))
+        if not conn:
+            # Fallback to Temp Data
             medicines = TEMP_DATA['medicines']
+        else:
+            medicines = CATALOG.current().medicines
     
     return render_template('doctor_dashboard.html', patients=patients, medicines=medicines)
 
@@ -416,16 +702,57 @@ def add_patient():
     contact = request.form['contact']
     allergies = request.form['allergies']
     
-    conn = get_db_connection()
-    cursor = conn.cursor(buffered=True)
-    cursor.execute("INSERT INTO patients (name, age, gender, contact, allergies) VALUES (%s, %s, %s, %s, %s)", 
-                   (name, age, gender, contact, allergies))
-    conn.commit()
-    cursor.close()
-    conn.close()
-    flash('Patient added successfully!')
+    with get_db_connection() as conn:
+        if conn:
+            try:
+                cursor = conn.cursor(buffered=True)
+                cursor.execute("INSERT INTO patients (name, age, gender, contact, allergies) VALUES (%s, %s, %s, %s, %s)", 
+                               (name, age, gender, contact, allergies))
+                conn.commit()
+                PATIENT_SEARCH.add(cursor.lastrowid, name, contact)
+                cursor.close()
+                flash('Patient added successfully!')
+            except mysql.connector.Error as err:
+                flash(f"Database Error: {err}")
+        else:
+            # Temp Data Add
+            new_id = max([p['patient_id'] for p in TEMP_DATA['patients']], default=0) + 1
+            TEMP_DATA['patients'].append({
+                'patient_id': new_id,
+                'name': name,
+                'age': age,
+                'gender': gender,
+                'contact': contact,
+                'allergies': allergies
+            })
+            flash('Patient added (Temp Storage)!')
     return redirect(url_for('doctor_dashboard'))
 
+@app.route('/patients/search')
+def search_patients():
+    """Type-ahead: ?q= part of a name, contact number or patient ID; ?limit= up to 25."""
+    if 'user_id' not in session or session['role'] not in ['doctor', 'pharmacist', 'admin']:
+        return jsonify({'error': 'Login required'}), 401
+    term = request.args.get('q', '')
+    limit = request.args.get('limit', '10')
+    limit = int(limit) if limit.isdigit() else 10
+    started = time.perf_counter()
+    with get_db_connection() as conn:
+        if conn:
+            results, source = PATIENT_SEARCH.search(conn, term, limit)
+        else:
+            # Temp Data: every query word must start a word of the name or contact (or be the ID)
+            words = search_tokens(term)
+            results = []
+            for p in reversed(TEMP_DATA['patients']):
+                tokens = search_tokens(f"{p['name']} {p['contact']}")
+                if words and all(str(p['patient_id']) == w or any(t.startswith(w) for t in tokens) for w in words):
+                    results.append({k: p[k] for k in ('patient_id', 'name', 'age', 'gender', 'contact')})
+            results = results[:max(1, min(limit, 25))]
+            source = 'temp'
+    return jsonify({'results': results, 'source': source,
+                    'took_ms': round((time.perf_counter() - started) * 1000, 2)})
+
 @app.route('/create_prescription', methods=['POST'])
 def create_prescription():
     if 'user_id' not in session or session['role'] != 'doctor':
@@ -436,95 +763,155 @@ def create_prescription():
     dosage = request.form['dosage']
     days = request.form['days']
     
-    conn = get_db_connection()
-    cursor = conn.cursor(buffered=True)
-    
-    # Create Prescription Record
-    cursor.execute("INSERT INTO prescriptions (patient_id, doctor_id, date) VALUES (%s, %s, NOW())", 
-                   (patient_id, session['user_id']))
-    prescription_id = cursor.lastrowid
-    
-    # Add Medicine Details (Hackathon simplification: 1 medicine per prescription for speed, or handle multiple if UI allows)
-    # The prompt implies "prescription_details" table. I'll add one item.
-    cursor.execute("INSERT INTO prescription_details (prescription_id, medicine_id, dosage, days) VALUES (%s, %s, %s, %s)",
-                   (prescription_id, medicine_id, dosage, days))
-    
-    conn.commit()
-    cursor.close()
-    conn.close()
-    flash('Prescription created!')
+    with get_db_connection() as conn:
+        if conn:
+            try:
+                cursor = conn.cursor(buffered=True)
+                
+                # Parse the dosage once here; validation reads the stored numbers
+                med = CATALOG.lookup([int(medicine_id)]).get(int(medicine_id))
+                dose = compile_dosage(dosage, med['name'] if med else '')
+                
+                # Create Prescription Record
+                cursor.execute("INSERT INTO prescriptions (patient_id, doctor_id, date) VALUES (%s, %s, NOW())", 
+                               (patient_id, session['user_id']))
+                prescription_id = cursor.lastrowid
+                
+                # Add Medicine Details (Hackathon simplification: 1 medicine per prescription for speed, or handle multiple if UI allows)
+                # The prompt implies "prescription_details" table. I'll add one item.
+                cursor.execute("""
+                    INSERT INTO prescription_details
+                        (prescription_id, medicine_id, dosage, days, units_per_slot, units_per_day, strength_mg, daily_mg)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                """, (prescription_id, medicine_id, dosage, days,
+                      dose['units_per_slot'], dose['units_per_day'], dose['strength_mg'], dose['daily_mg']))
+                
+                conn.commit()
+                cursor.close()
+                flash('Prescription created!')
+            except DosageError as err:
+                flash(f"Prescription not created: {err}")
+            except mysql.connector.Error as err:
+                flash(f"Database Error: {err}")
+        else:
+            # Temp Data Add
+            med = next((m for m in TEMP_DATA['medicines'] if m['medicine_id'] == int(medicine_id)), None)
+            try:
+                dose = compile_dosage(dosage, med['name'] if med else '')
+            except DosageError as err:
+                flash(f"Prescription not created: {err}")
+                return redirect(url_for('doctor_dashboard'))
+            prescription_id = max([p['prescription_id'] for p in TEMP_DATA['prescriptions']], default=0) + 1
+            TEMP_DATA['prescriptions'].append({
+                'prescription_id': prescription_id,
+                'patient_id': int(patient_id),
+                'doctor_id': session['user_id'],
+                'date': datetime.now(),
+                'status': 'pending'
+            })
+            TEMP_DATA['prescription_details'].append({
+                'detail_id': len(TEMP_DATA['prescription_details']) + 1,
+                'prescription_id': prescription_id,
+                'medicine_id': int(medicine_id),
+                'dosage': dosage,
+                'days': int(days),
+                **dose
+            })
+            flash('Prescription created (Temp Storage)!')
     return redirect(url_for('doctor_dashboard'))
 
-    return redirect(url_for('doctor_dashboard'))
+# Visits on the patient history page, newest first; older ones load on demand
+HISTORY_PAGES = KeysetPaginator('prescription_id', default_size=int(os.getenv('HISTORY_PAGE_SIZE', 10)))
+
+def history_details(conn, prescription_ids):
+    """{prescription_id: [detail rows]} for a page of visits, in one query."""
+    if not prescription_ids:
+        return {}
+    placeholders = ', '.join(['%s'] * len(prescription_ids))
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(f"""
+            SELECT * FROM prescription_details
+            WHERE prescription_id IN ({placeholders})
+            ORDER BY prescription_id, detail_id
+        """, tuple(prescription_ids))
+        # Rows arrive sorted, so each visit is grouped as it streams off the cursor
+        return {p_id: with_medicine_info(list(rows))
+                for p_id, rows in itertools.groupby(cursor, key=lambda r: r['prescription_id'])}
+    finally:
+        cursor.close()
+
+def history_page(conn, patient_id, token, per_page=None):
+    """One page of a patient's visits with their medicines: two queries however many visits."""
+    direction, key = decode_cursor(token)
+    size = HISTORY_PAGES.page_size(per_page)
+    where, params, order = HISTORY_PAGES.seek(direction, key)
+    cursor = conn.cursor(dictionary=True, buffered=True)
+    cursor.execute(f"""
+        SELECT p.*, u.full_name as doctor_name
+        FROM prescriptions p
+        JOIN users u ON p.doctor_id = u.user_id
+        WHERE p.patient_id = %s AND {where}
+        ORDER BY {order}
+        LIMIT %s
+    """, (patient_id,) + params + (size + 1,))
+    page = HISTORY_PAGES.page(cursor.fetchall(), direction, size)
+    cursor.close()
+    details = history_details(conn, [p['prescription_id'] for p in page])
+    for p in page:
+        p['details'] = details.get(p['prescription_id'], [])
+    return page
+
+def temp_history_page(patient_id, token, per_page=None):
+    direction, key = decode_cursor(token)
+    size = HISTORY_PAGES.page_size(per_page)
+    visits = []
+    for p in TEMP_DATA['prescriptions']:
+        if p['patient_id'] != patient_id:
+            continue
+        p_copy = p.copy()
+        p_copy['details'] = [d.copy() for d in TEMP_DATA['prescription_details'] if d['prescription_id'] == p['prescription_id']]
+        for rd_copy in p_copy['details']:
+            med = next((m for m in TEMP_DATA['medicines'] if m['medicine_id'] == rd_copy['medicine_id']), None)
+            rd_copy['medicine_name'] = med['name'] if med else "Unknown"
+        doc = next((u for u in TEMP_DATA['users'] if u['user_id'] == p['doctor_id']), None)
+        p_copy['doctor_name'] = doc['full_name'] if doc else "Unknown"
+        visits.append(p_copy)
+    return HISTORY_PAGES.page_from_list(visits, direction, key, size)
 
 @app.route('/patient_history/<int:patient_id>')
 def patient_history(patient_id):
     if 'user_id' not in session or session['role'] != 'doctor':
         return redirect(url_for('login'))
         
-    conn = get_db_connection()
     patient = None
-    history = []
+    history = None
+    token = request.args.get('cursor')
+    per_page = request.args.get('per_page')
+    # ?partial=1: just the visit cards, appended by the "Load older visits" button
+    partial = request.args.get('partial') == '1'
     
-    if conn:
-        try:
-            cursor = conn.cursor(dictionary=True, buffered=True)
-            # Fetch Patient Info
-            cursor.execute("SELECT * FROM patients WHERE patient_id = %s", (patient_id,))
-            patient = cursor.fetchone()
-            
-            # Fetch Prescriptions
-            query = """
-                SELECT p.*, u.full_name as doctor_name 
-                FROM prescriptions p
-                JOIN users u ON p.doctor_id = u.user_id
-                WHERE p.patient_id = %s
-                ORDER BY p.date DESC
-            """
-            cursor.execute(query, (patient_id,))
-            prescriptions = cursor.fetchall()
-            
-            for p in prescriptions:
-                # Fetch Details for each prescription
-                d_query = """
-                    SELECT pd.*, m.name as medicine_name 
-                    FROM prescription_details pd
-                    JOIN medicines m ON pd.medicine_id = m.medicine_id
-                    WHERE pd.prescription_id = %s
-                """
-                cursor.execute(d_query, (p['prescription_id'],))
-                p['details'] = cursor.fetchall()
-                history.append(p)
-                
-            cursor.close()
-            conn.close()
-        except mysql.connector.Error as err:
-            print(f"History Db Error: {err}")
-            conn = None # Fallback
+    with get_db_connection() as conn:
+        if conn:
+            try:
+                if not partial:
+                    cursor = conn.cursor(dictionary=True, buffered=True)
+                    cursor.execute("SELECT * FROM patients WHERE patient_id = %s", (patient_id,))
+                    patient = cursor.fetchone()
+                    cursor.close()
+                history = history_page(conn, patient_id, token, per_page)
+            except mysql.connector.Error as err:
+                print(f"History Db Error: {err}")
+                conn = None # Fallback
             
     if not conn:
         # TEMP DATA Fallback
         patient = next((pat for pat in TEMP_DATA['patients'] if pat['patient_id'] == patient_id), None)
-        if patient:
-            # Find prescriptions
-            temp_prescriptions = [p for p in TEMP_DATA['prescriptions'] if p['patient_id'] == patient_id]
-            for p in temp_prescriptions:
-                p_copy = p.copy()
-                # Find details
-                raw_details = [d for d in TEMP_DATA['prescription_details'] if d['prescription_id'] == p['prescription_id']]
-                p_copy['details'] = []
-                for rd in raw_details:
-                    rd_copy = rd.copy()
-                    med = next((m for m in TEMP_DATA['medicines'] if m['medicine_id'] == rd['medicine_id']), None)
-                    rd_copy['medicine_name'] = med['name'] if med else "Unknown"
-                    p_copy['details'].append(rd_copy)
-                
-                # Doctor name
-                doc = next((u for u in TEMP_DATA['users'] if u['user_id'] == p['doctor_id']), None)
-                p_copy['doctor_name'] = doc['full_name'] if doc else "Unknown"
-                history.append(p_copy)
-                
-    return render_template('patient_history.html', patient=patient, history=history)
+        history = temp_history_page(patient_id, token, per_page)
+
+    if partial:
+        return render_template('patient_history_visits.html', patient_id=patient_id, history=history)
+    return render_template('patient_history.html', patient=patient, patient_id=patient_id, history=history)
 
 @app.route('/pharmacist_dashboard', methods=['GET'])
 def pharmacist_dashboard():
@@ -537,290 +924,498 @@ def pharmacist_dashboard():
     
     prescription_id = request.args.get('prescription_id')
     
-    if prescription_id:
-        conn = get_db_connection()
-        
+    # Fetch Sales and Patients for Dashboard View
+    recent_sales = []
+    low_stock_items = []
+    
+    # One pooled connection serves both the lookup and the dashboard panels
+    with get_db_connection() as conn:
         if conn:
             cursor = conn.cursor(dictionary=True, buffered=True)
             
-            # Fetch Basic Prescription Info
-            query = """
-                SELECT p.prescription_id, p.date, p.status, pat.name as patient_name, u.full_name as doctor_name
-                FROM prescriptions p
-                JOIN patients pat ON p.patient_id = pat.patient_id
-                JOIN users u ON p.doctor_id = u.user_id
-                WHERE p.prescription_id = %s
-            """
-            cursor.execute(query, (prescription_id,))
-            prescription = cursor.fetchone()
-            
-            if prescription:
-                # Fetch Medicines
-                det_query = """
-                    SELECT pd.*, m.name as medicine_name, m.price, m.quantity as stock
-                    FROM prescription_details pd
-                    JOIN medicines m ON pd.medicine_id = m.medicine_id
-                    WHERE pd.prescription_id = %s
+            if prescription_id:
+                # Fetch Basic Prescription Info
+                query = """
+                    SELECT p.prescription_id, p.date, p.status, pat.name as patient_name, u.full_name as doctor_name
+                    FROM prescriptions p
+                    JOIN patients pat ON p.patient_id = pat.patient_id
+                    JOIN users u ON p.doctor_id = u.user_id
+                    WHERE p.prescription_id = %s
                 """
-                cursor.execute(det_query, (prescription_id,))
-                details = cursor.fetchall()
-                
-                # Fetch Bill if exists
-                cursor.execute("SELECT * FROM billing WHERE prescription_id = %s", (prescription_id,))
-                bill = cursor.fetchone()
-                
-            cursor.close()
-            conn.close()
-        else:
-            # Fallback for Temp Storage
-            # Use int conversion for ID matching
-            try:
-                p_id_int = int(prescription_id)
-                for p in TEMP_DATA['prescriptions']:
-                    if p['prescription_id'] == p_id_int:
-                        # Emulate join for display
-                        prescription = p.copy()
-                        # Find patient name logic would go here, simplified:
-                        prescription['patient_name'] = "Temp Patient" # simplified
-                        prescription['doctor_name'] = "Temp Doctor"   # simplified
-                        break
+                cursor.execute(query, (prescription_id,))
+                prescription = cursor.fetchone()
                 
                 if prescription:
-                    # Find details
-                    details = [d for d in TEMP_DATA['prescription_details'] if d['prescription_id'] == p_id_int]
-                    # Find bill
-                    for b in TEMP_DATA['billing']:
-                        if b['prescription_id'] == p_id_int:
-                            bill = b
-                            break
-            except ValueError:
+                    # Fetch Medicines
+                    # Names, prices and stock come from the catalog
+                    cursor.execute("SELECT * FROM prescription_details WHERE prescription_id = %s", (prescription_id,))
+                    details = with_medicine_info(cursor.fetchall())
+                    
+                    # Fetch Bill if exists
+                    cursor.execute("SELECT * FROM billing WHERE prescription_id = %s", (prescription_id,))
+                    bill = cursor.fetchone()
+            
+            try:
+                # Sales
+                cursor.execute("""
+                    SELECT b.bill_id, b.total_amount, b.payment_status, b.generated_at, p.name as patient_name 
+                    FROM billing b 
+                    JOIN prescriptions pr ON b.prescription_id = pr.prescription_id 
+                    JOIN patients p ON pr.patient_id = p.patient_id 
+                    ORDER BY b.generated_at DESC LIMIT 5
+                """)
+                recent_sales = cursor.fetchall()
+            except mysql.connector.Error:
                 pass
-        
-    # Fetch Sales and Patients for Dashboard View
-    recent_sales = []
-    all_patients = []
-    low_stock_items = []
-    
-    conn_extra = get_db_connection()
-    if conn_extra:
-        try:
-            cur = conn_extra.cursor(dictionary=True, buffered=True)
-            # Sales
-            cur.execute("""
-                SELECT b.bill_id, b.total_amount, b.payment_status, b.generated_at, p.name as patient_name 
-                FROM billing b 
-                JOIN prescriptions pr ON b.prescription_id = pr.prescription_id 
-                JOIN patients p ON pr.patient_id = p.patient_id 
-                ORDER BY b.generated_at DESC LIMIT 5
-            """)
-            recent_sales = cur.fetchall()
-            # Patients
-            cur.execute("SELECT * FROM patients ORDER BY patient_id DESC")
-            all_patients = cur.fetchall()
 
             # Low Stock Medicines
-            cur.execute("SELECT * FROM medicines WHERE quantity < 100")
-            low_stock_items = cur.fetchall()
+            low_stock_items = CATALOG.current().low_stock(LOW_STOCK_THRESHOLD)
 
-            cur.close()
-            conn_extra.close()
-        except:
-            pass
+            cursor.close()
+        else:
+            if prescription_id:
+                # Fallback for Temp Storage
+                # Use int conversion for ID matching
+                try:
+                    p_id_int = int(prescription_id)
+                    for p in TEMP_DATA['prescriptions']:
+                        if p['prescription_id'] == p_id_int:
+                            # Emulate join for display
+                            prescription = p.copy()
+                            # Find patient name logic would go here, simplified:
+                            prescription['patient_name'] = "Temp Patient" # simplified
+                            prescription['doctor_name'] = "Temp Doctor"   # simplified
+                            break
+                    
+                    if prescription:
+                        # Find details
+                        details = [d for d in TEMP_DATA['prescription_details'] if d['prescription_id'] == p_id_int]
+                        # Find bill
+                        for b in TEMP_DATA['billing']:
+                            if b['prescription_id'] == p_id_int:
+                                bill = b
+                                break
+                except ValueError:
+                    pass
             
-    if not conn_extra:
-         all_patients = TEMP_DATA['patients']
-         low_stock_items = [m for m in TEMP_DATA['medicines'] if m['quantity'] < 100]
+            low_stock_items = [m for m in TEMP_DATA['medicines'] if m['quantity'] < LOW_STOCK_THRESHOLD]
+
+        # Patients
+        all_patients = patient_page(conn, request.args.get('cursor'), request.args.get('per_page'))
 
     return render_template('pharmacist_dashboard.html', prescription=prescription, details=details, bill=bill, sales=recent_sales, patients=all_patients, low_stock_items=low_stock_items)
 
-@app.route('/validate_prescription/<int:p_id>', methods=['POST'])
-def validate_prescription(p_id):
-    if 'user_id' not in session or session['role'] != 'pharmacist':
-        return redirect(url_for('login'))
-        
-    conn = get_db_connection()
-    validation_data = []
-    
-    # --- 1. Fetch Data for Validation (Patient Allergies + Medicines + Dosages) ---
-    if conn:
-        try:
-            cursor = conn.cursor(dictionary=True, buffered=True)
-            query = """
-                SELECT pat.allergies, pd.dosage, m.name as medicine_name, pd.days, pd.medicine_id
-                FROM prescriptions p
-                JOIN patients pat ON p.patient_id = pat.patient_id
-                JOIN prescription_details pd ON p.prescription_id = pd.prescription_id
-                JOIN medicines m ON pd.medicine_id = m.medicine_id
-                WHERE p.prescription_id = %s
-            """
-            cursor.execute(query, (p_id,))
-            validation_data = cursor.fetchall()
-            # Do not close cursor yet, we might need it for updates
-        except mysql.connector.Error as err:
-            print(f"Validation Fetch Error: {err}")
-            conn = None
-    
-    # Fallback to Temp Data if DB failed
-    if not conn: 
-        # Simulate fetch from TEMP_DATA
-        print("Using TEMP DATA for validation check")
-        # Find prescription
-        t_p = next((p for p in TEMP_DATA['prescriptions'] if p['prescription_id'] == p_id), None)
-        if t_p:
-            t_pat = next((pat for pat in TEMP_DATA['patients'] if pat['patient_id'] == t_p['patient_id']), None)
-            t_dets = [d for d in TEMP_DATA['prescription_details'] if d['prescription_id'] == p_id]
-            for d in t_dets:
-                t_med = next((m for m in TEMP_DATA['medicines'] if m['medicine_id'] == d['medicine_id']), None)
-                if t_pat and t_med:
-                    validation_data.append({
-                        'allergies': t_pat['allergies'],
-                        'dosage': d['dosage'],
-                        'medicine_name': t_med['name'],
-                        'days': d['days'],
-                        'medicine_id': d['medicine_id']
-                    })
-
-    if not validation_data:
-        flash("Error: Could not fetch prescription data for validation.")
-        return redirect(url_for('pharmacist_dashboard', prescription_id=p_id))
+def temp_validation_data(p_id):
+    """Validation rows for one prescription from TEMP_DATA (same shape as the DB query)."""
+    rows = []
+    t_p = next((p for p in TEMP_DATA['prescriptions'] if p['prescription_id'] == p_id), None)
+    if t_p:
+        t_pat = next((pat for pat in TEMP_DATA['patients'] if pat['patient_id'] == t_p['patient_id']), None)
+        t_dets = [d for d in TEMP_DATA['prescription_details'] if d['prescription_id'] == p_id]
+        for d in t_dets:
+            t_med = next((m for m in TEMP_DATA['medicines'] if m['medicine_id'] == d['medicine_id']), None)
+            if t_pat and t_med:
+                rows.append({
+                    'prescription_id': p_id,
+                    'status': t_p['status'],
+                    'patient_id': t_pat['patient_id'],
+                    'allergies': t_pat['allergies'],
+                    'dosage': d['dosage'],
+                    'units_per_day': d.get('units_per_day'),
+                    'daily_mg': d.get('daily_mg'),
+                    'medicine_name': t_med['name'],
+                    'days': d['days'],
+                    'medicine_id': d['medicine_id'],
+                    'price': t_med['price']
+                })
+    return rows
+
+def validation_errors(validation_data, rules):
+    """Run the allergy, dosage and interaction checks over one prescription's lines."""
+    # Parsed once per patient and cached; see validation.AllergyMatcher
+    allergy_profile = ALLERGY_MATCHER.patient_profile(validation_data[0]['patient_id'], validation_data[0]['allergies'])
 
-    # --- 2. Perform AI Checks ---
+    cache_key = VALIDATION_CACHE.fingerprint(validation_data, allergy_profile, rules.version)
+    errors = VALIDATION_CACHE.get(cache_key)
+    if errors is not None:
+        return errors
     errors = []
-    patient_allergies = validation_data[0]['allergies'] if validation_data[0]['allergies'] else ""
-    
+
     med_names = []
-    
+
     for item in validation_data:
+        if not item.get('in_catalog', True):
+            # No name to screen, so the line can't pass the checks below
+            errors.append(f"MEDICINE ALERT: Medicine #{item['medicine_id']} is not in the catalog and can't be checked.")
+            continue
         name = item['medicine_name']
         med_names.append(name)
-        
+    
         # A. Allergy Check
-        # Check if allergy string contains medicine name (Case insensitive partial match)
-        # e.g. Allergy="Peanuts, Sulfa" -> Check if "Sulfa" in Name
-        # Reverse: Check if Medicine Name in Allergy string? 
-        # Better: Check if any part of allergy string matches medicine name
-        allergy_list = [a.strip().lower() for a in patient_allergies.split(',')]
-        for allergy in allergy_list:
-            if allergy and allergy in name.lower():
-                errors.append(f"ALLERGY ALERT: Patient is allergic to {allergy} (Found in {name})")
+        # Any of the patient's allergy terms found in the medicine name (case-insensitive partial match)
+        # e.g. Allergy="Peanuts, Sulfa" -> flags "Sulfamethoxazole 400mg"
+        for allergy in ALLERGY_MATCHER.match(allergy_profile, name):
+            errors.append(f"ALLERGY ALERT: Patient is allergic to {allergy} (Found in {name})")
 
         # B. Dosage Check
-        # Parse '1-0-1' or '1'
-        dosage_str = item['dosage']
-        daily_count = 0
-        try:
-            if '-' in dosage_str:
-                daily_count = sum(int(x) for x in dosage_str.split('-') if x.strip().isdigit())
-            elif dosage_str.isdigit():
-                daily_count = int(dosage_str)
-        except:
-            pass # Unable to parse
-            
-        # Check against Limit
-        for key, limit in AI_MAX_DOSAGE.items():
-            if key.lower() in name.lower():
-                if daily_count > limit:
-                     errors.append(f"DOSAGE ALERT: {name} dosage ({daily_count}/day) exceeds safety limit of {limit}.")
+        # Daily mg was computed from the dosage and strength when the prescription was created
+        daily_mg = item['daily_mg']
+        if item['units_per_day'] is None:
+            # Line the structured-dosage backfill could not read
+            errors.append(f"DOSAGE ALERT: Could not read dosage '{item['dosage']}' for {name}.")
+        
+        # Check against Limit (mg/day)
+        if daily_mg is not None:
+            for ingredient, limit in rules.dosage_limits(name):
+                if daily_mg > limit:
+                     errors.append(f"DOSAGE ALERT: {name} dosage ({float(daily_mg):g} mg/day) exceeds safety limit of {limit:g} mg.")
 
     # C. Interaction Check
-    # Check all pairs
-    for med_a, med_b in itertools.combinations(med_names, 2):
-        # We need to map full names like "Aspirin 75mg" to keys "Aspirin"
-        # Simple fuzzy check:
-        found_pair = None
-        for key_set, msg in AI_INTERACTIONS.items():
-            # key_set is like {'Aspirin', 'Ibuprofen'}
-            # Check if both keys are present in the current pair of meds (substring match)
-            list_keys = list(key_set)
-            match_1 = any(list_keys[0].lower() in med_a.lower() for k in [1]) # Truism for structure
-            # Wait, cleaner logic:
-            # Check if k1 in med_a AND k2 in med_b OR k1 in med_b AND k2 in med_a
-            k1, k2 = list_keys[0], list_keys[1]
-            
-            cond1 = (k1.lower() in med_a.lower() and k2.lower() in med_b.lower())
-            cond2 = (k1.lower() in med_b.lower() and k2.lower() in med_a.lower())
-            
-            if cond1 or cond2:
-                errors.append(f"INTERACTION ALERT: {med_a} + {med_b} -> {msg}")
+    # Names resolve to ingredient IDs once; each line is one bitset lookup
+    for med_a, med_b, msg in rules.check_interactions(med_names):
+        errors.append(f"INTERACTION ALERT: {med_a} + {med_b} -> {msg}")
 
-    # --- 3. Decision: Block or Proceed ---
-    if errors:
-        # BLOCK DISPENSING
-        flash("❌ AI VALIDATION REJECTED: " + " | ".join(errors))
-        if conn:
-            # Update status to 'pending' just to be sure (or a new 'flagged' status if we had it)
-            # For now, just don't validate.
-            if 'cursor' in locals() and cursor:
-                cursor.close()
-            conn.close()
-        return redirect(url_for('pharmacist_dashboard', prescription_id=p_id))
+    VALIDATION_CACHE.put(cache_key, errors)
+    return errors
 
-    # --- 4. Proceed (Validation Success) ---
-    flash("✅ AI Validation Passed. Inventory Updated.")
-    
-    if conn:
-        try:
-            # 1. Update Inventory
-            for item in validation_data:
-                qty_to_deduct = item['days'] # Simplification
-                cursor.execute("UPDATE medicines SET quantity = quantity - %s WHERE medicine_id = %s", 
-                               (qty_to_deduct, item['medicine_id']))
+def apply_temp_validation(p_id, validation_data):
+    """Deduct stock, mark validated and raise the bill in TEMP_DATA. Returns the bill total."""
+    wanted = demand(validation_data)
+    meds = {m['medicine_id']: m for m in TEMP_DATA['medicines'] if m['medicine_id'] in wanted}
+    granted, refused = allocate({med_id: m['quantity'] for med_id, m in meds.items()}, [(p_id, wanted)])
+    if refused:
+        raise InsufficientStock([dict(s, name=meds[s['medicine_id']]['name'] if s['medicine_id'] in meds else f"Medicine #{s['medicine_id']}")
+                                 for s in refused[p_id]])
+    for p in TEMP_DATA['prescriptions']:
+        if p['prescription_id'] == p_id:
+            p['status'] = 'validated'
+    total_amount = 0
+    for item in validation_data:
+        med = next((m for m in TEMP_DATA['medicines'] if m['medicine_id'] == item['medicine_id']), None)
+        if med:
+            med['quantity'] -= item['days']
+            total_amount += med['price'] * item['days']
+    TEMP_DATA['billing'].append({
+        'bill_id': max([b['bill_id'] for b in TEMP_DATA['billing']], default=0) + 1,
+        'prescription_id': p_id,
+        'total_amount': total_amount,
+        'payment_status': 'Unpaid',
+        'generated_at': datetime.now()
+    })
+    return total_amount
+
+@app.route('/validate_prescription/<int:p_id>', methods=['POST'])
+def validate_prescription(p_id):
+    if 'user_id' not in session or session['role'] != 'pharmacist':
+        return redirect(url_for('login'))
         
-            # 2. Update Status
-            cursor.execute("UPDATE prescriptions SET status = 'validated' WHERE prescription_id = %s", (p_id,))
-            
-            # 3. Calculate Bill
-            cursor.execute("""
-                SELECT SUM(m.price * pd.days) as total 
-                FROM prescription_details pd 
-                JOIN medicines m ON pd.medicine_id = m.medicine_id 
-                WHERE pd.prescription_id = %s
-            """, (p_id,))
-            result = cursor.fetchone()
-            total_amount = result['total'] if result['total'] else 0
-            
-            # 4. Create Bill
-            cursor.execute("INSERT INTO billing (prescription_id, total_amount, payment_status) VALUES (%s, %s, 'Unpaid')", 
-                           (p_id, total_amount))
-            
-            conn.commit()
-            cursor.close()
-            conn.close()
-        except mysql.connector.Error as err:
-            flash(f"Database Error during processing: {err}")
+    with get_db_connection() as conn:
+        validation_data = []
+    
+        # --- 1. Fetch Data for Validation (Patient Allergies + Medicines + Dosages) ---
+        if conn:
+            try:
+                cursor = conn.cursor(dictionary=True, buffered=True)
+                query = """
+                    SELECT p.patient_id, pat.allergies, pd.dosage, pd.units_per_day, pd.daily_mg, pd.days, pd.medicine_id
+                    FROM prescriptions p
+                    JOIN patients pat ON p.patient_id = pat.patient_id
+                    JOIN prescription_details pd ON p.prescription_id = pd.prescription_id
+                    WHERE p.prescription_id = %s
+                """
+                cursor.execute(query, (p_id,))
+                validation_data = with_medicine_info(cursor.fetchall())
+                # Do not close cursor yet, we might need it for updates
+            except mysql.connector.Error as err:
+                print(f"Validation Fetch Error: {err}")
+                conn = None
+    
+        # Fallback to Temp Data if DB failed
+        if not conn: 
+            # Simulate fetch from TEMP_DATA
+            print("Using TEMP DATA for validation check")
+            # Find prescription
+            validation_data = temp_validation_data(p_id)
+
+        if not validation_data:
+            flash("Error: Could not fetch prescription data for validation.")
+            return redirect(url_for('pharmacist_dashboard', prescription_id=p_id))
+
+        # --- 2. Perform AI Checks ---
+        # One snapshot for the whole request, even if a reload lands mid-check
+        errors = validation_errors(validation_data, RULES.current())
+
+        # --- 3. Decision: Block or Proceed ---
+        if errors:
+            # BLOCK DISPENSING
+            flash("❌ AI VALIDATION REJECTED: " + " | ".join(errors))
+            if conn:
+                # Update status to 'pending' just to be sure (or a new 'flagged' status if we had it)
+                # For now, just don't validate.
+                if 'cursor' in locals() and cursor:
+                    cursor.close()
             return redirect(url_for('pharmacist_dashboard', prescription_id=p_id))
+
+        # --- 4. Proceed (Validation Success) ---
+        if conn:
+            cursor.close()
+
+            def dispense(cursor):
+                # Claim the prescription first so a second pharmacist can't dispense it twice,
+                # then deduct every line in one guarded statement (see stock.StockReservations)
+                STOCK.claim(cursor, [p_id])
+                STOCK.deduct(cursor, demand(validation_data))
+
+                # Calculate Bill from the prices locked in this transaction (the catalog may lag)
+                prices = STOCK.prices(cursor, [line['medicine_id'] for line in validation_data])
+                total_amount = sum(prices.get(line['medicine_id'], 0) * line['days'] for line in validation_data)
+                # Keep each line's price so the invoice repeats what was billed
+                cursor.executemany("UPDATE prescription_details SET unit_price = %s WHERE prescription_id = %s AND medicine_id = %s",
+                                   [(prices.get(line['medicine_id'], 0), p_id, line['medicine_id']) for line in validation_data])
+
+                # Create Bill
+                cursor.execute("INSERT INTO billing (prescription_id, total_amount, payment_status) VALUES (%s, %s, 'Unpaid')", 
+                               (p_id, total_amount))
+
+            try:
+                STOCK.run(conn, dispense)
+                CATALOG.stock_changed(conn, demand(validation_data))
+            except (InsufficientStock, AlreadyProcessed) as err:
+                flash(f"❌ Not dispensed: {err}")
+                return redirect(url_for('pharmacist_dashboard', prescription_id=p_id))
+            except mysql.connector.Error as err:
+                flash(f"Database Error during processing: {err}")
+                return redirect(url_for('pharmacist_dashboard', prescription_id=p_id))
             
+        else:
+            # Handle Temp Data Updates (Simulation)
+            try:
+                apply_temp_validation(p_id, validation_data)
+            except InsufficientStock as err:
+                flash(f"❌ Not dispensed: {err}")
+                return redirect(url_for('pharmacist_dashboard', prescription_id=p_id))
+
+        flash("✅ AI Validation Passed. Inventory Updated.")
+        return redirect(url_for('pharmacist_dashboard', prescription_id=p_id))
+
+# Upper bound on one batch so a single request can't hold row locks for long
+MAX_VALIDATION_BATCH = int(os.getenv('MAX_VALIDATION_BATCH', 200))
+
+@app.route('/validate_prescriptions', methods=['POST'])
+def validate_prescriptions():
+    """
+    Batch validation for the pharmacist queue.
+    Takes prescription IDs (form field 'prescription_ids', comma/space separated,
+    or a JSON body {"prescription_ids": [...]}), fetches every line in one query,
+    checks them in one pass and writes all passing prescriptions in one transaction.
+    Responds with a per-prescription report (JSON for JSON requests, flashed otherwise).
+    """
+    if 'user_id' not in session or session['role'] != 'pharmacist':
+        return redirect(url_for('login'))
+
+    if request.is_json:
+        raw_ids = (request.get_json(silent=True) or {}).get('prescription_ids') or []
     else:
-        # Handle Temp Data Updates (Simulation)
-        for p in TEMP_DATA['prescriptions']:
-            if p['prescription_id'] == p_id:
-                p['status'] = 'validated'
-        # Would also need to update medicine stock and create bill in TEMP_DATA
-        # For Hackathon speed, maybe skip complex temp updates or do basic:
-        pass
-        
-    return redirect(url_for('pharmacist_dashboard', prescription_id=p_id))
+        raw_ids = request.form.get('prescription_ids', '').replace(',', ' ').split()
+    p_ids = []
+    for raw in raw_ids:
+        try:
+            p_id = int(raw)
+        except (TypeError, ValueError):
+            continue
+        if p_id not in p_ids:
+            p_ids.append(p_id)
+
+    if not p_ids or len(p_ids) > MAX_VALIDATION_BATCH:
+        message = f"Enter between 1 and {MAX_VALIDATION_BATCH} prescription IDs."
+        if request.is_json:
+            return jsonify({'error': message}), 400
+        flash(message)
+        return redirect(url_for('pharmacist_dashboard'))
+
+    report = {p_id: {'prescription_id': p_id, 'status': 'not_found', 'errors': []} for p_id in p_ids}
+    rules = RULES.current()
+
+    with get_db_connection() as conn:
+        # --- 1. One set-based fetch for every prescription in the batch ---
+        lines_by_id = {}
+        if conn:
+            try:
+                cursor = conn.cursor(dictionary=True, buffered=True)
+                placeholders = ', '.join(['%s'] * len(p_ids))
+                cursor.execute(f"""
+                    SELECT p.prescription_id, p.status, p.patient_id, pat.allergies, pd.dosage, pd.units_per_day, pd.daily_mg,
+                           pd.days, pd.medicine_id
+                    FROM prescriptions p
+                    JOIN patients pat ON p.patient_id = pat.patient_id
+                    JOIN prescription_details pd ON p.prescription_id = pd.prescription_id
+                    WHERE p.prescription_id IN ({placeholders})
+                    ORDER BY p.prescription_id, pd.detail_id
+                """, p_ids)
+                for row in with_medicine_info(cursor.fetchall()):
+                    lines_by_id.setdefault(row['prescription_id'], []).append(row)
+            except mysql.connector.Error as err:
+                print(f"Batch Validation Fetch Error: {err}")
+                conn = None
+
+        if not conn:
+            print("Using TEMP DATA for batch validation")
+            for p_id in p_ids:
+                rows = temp_validation_data(p_id)
+                if rows:
+                    lines_by_id[p_id] = rows
+
+        # --- 2. Rule checks in a single pass ---
+        passed = []
+        for p_id in p_ids:
+            lines = lines_by_id.get(p_id)
+            if not lines:
+                continue
+            entry = report[p_id]
+            if lines[0]['status'] != 'pending':
+                entry['status'] = 'skipped'
+                entry['errors'].append(f"Prescription is already {lines[0]['status']}.")
+                continue
+            entry['errors'] = validation_errors(lines, rules)
+            if entry['errors']:
+                entry['status'] = 'rejected'
+            else:
+                # Catalog prices; with a database, granted bills are repriced in the transaction
+                entry['total_amount'] = sum(line['price'] * line['days'] for line in lines)
+                passed.append(p_id)
+
+        # --- 3. Apply every passing prescription in one transaction ---
+        if conn:
+            cursor.close()
+        medicine_names = {line['medicine_id']: line['medicine_name'] for lines in lines_by_id.values() for line in lines}
+
+        def refuse(p_id, shortages):
+            report[p_id]['status'] = 'insufficient_stock'
+            report[p_id].pop('total_amount', None)
+            report[p_id]['errors'] = [
+                f"STOCK ALERT: {medicine_names.get(s['medicine_id'], s['medicine_id'])} needs {s['requested']}, only {s['available']} in stock."
+                for s in shortages
+            ]
+
+        if passed and conn:
+            def dispense(cursor):
+                # Prescriptions, then medicines, each locked in ID order; whatever the
+                # locked stock can't cover is refused per prescription, the rest is
+                # deducted in one guarded statement (see stock.StockReservations)
+                claimed = STOCK.lock_pending(cursor, passed)
+                wanted = [(p_id, demand(lines_by_id[p_id])) for p_id in passed if p_id in claimed]
+                stock = STOCK.lock(cursor, [med_id for _, w in wanted for med_id in w])
+                granted, refused = allocate(stock, wanted)
+                totals = {}
+                if granted:
+                    # Bills use the prices locked here, not the catalog's (which may lag)
+                    prices = STOCK.prices(cursor, stock)
+                    for p_id in granted:
+                        report[p_id]['total_amount'] = sum(prices.get(line['medicine_id'], 0) * line['days']
+                                                           for line in lines_by_id[p_id])
+                    for p_id in granted:
+                        for med_id, qty in demand(lines_by_id[p_id]).items():
+                            totals[med_id] = totals.get(med_id, 0) + qty
+                    STOCK.deduct(cursor, totals)
+                    cursor.executemany("UPDATE prescriptions SET status = 'validated' WHERE prescription_id = %s",
+                                       [(p_id,) for p_id in granted])
+                    cursor.executemany("UPDATE prescription_details SET unit_price = %s WHERE prescription_id = %s AND medicine_id = %s",
+                                       [(prices.get(line['medicine_id'], 0), p_id, line['medicine_id'])
+                                        for p_id in granted for line in lines_by_id[p_id]])
+                    cursor.executemany("INSERT INTO billing (prescription_id, total_amount, payment_status) VALUES (%s, %s, 'Unpaid')",
+                                       [(p_id, report[p_id]['total_amount']) for p_id in granted])
+                return claimed, granted, refused, totals
+
+            try:
+                claimed, granted, refused, deducted = STOCK.run(conn, dispense)
+                if deducted:
+                    CATALOG.stock_changed(conn, deducted)
+                for p_id in passed:
+                    if p_id in refused:
+                        refuse(p_id, refused[p_id])
+                    elif p_id in granted:
+                        report[p_id]['status'] = 'validated'
+                    else:
+                        report[p_id]['status'] = 'skipped'
+                        report[p_id].pop('total_amount', None)
+                        report[p_id]['errors'].append("Prescription was already processed by another pharmacist.")
+            except mysql.connector.Error as err:
+                print(f"Batch Validation Write Error: {err}")
+                for p_id in passed:
+                    report[p_id]['status'] = 'error'
+                    report[p_id].pop('total_amount', None)
+                    report[p_id]['errors'].append(f"Database Error during processing: {err}")
+        elif passed:
+            for p_id in passed:
+                try:
+                    apply_temp_validation(p_id, lines_by_id[p_id])
+                    report[p_id]['status'] = 'validated'
+                except InsufficientStock as err:
+                    refuse(p_id, err.shortages)
+
+    results = list(report.values())
+    for entry in results:
+        if 'total_amount' in entry:
+            entry['total_amount'] = float(entry['total_amount'])
+    if request.is_json:
+        return jsonify({'results': results,
+                        'validated': sum(1 for r in results if r['status'] == 'validated'),
+                        'rules_version': rules.version})
+
+    for entry in results:
+        if entry['status'] == 'validated':
+            flash(f"✅ #{entry['prescription_id']}: AI Validation Passed. Bill ₹{entry['total_amount']:.2f}")
+        elif entry['status'] == 'not_found':
+            flash(f"#{entry['prescription_id']}: Prescription not found.")
+        else:
+            flash(f"❌ #{entry['prescription_id']} {entry['status'].upper()}: " + " | ".join(entry['errors']))
+    return redirect(url_for('pharmacist_dashboard'))
 
 @app.route('/pay_bill/<int:bill_id>')
 def pay_bill(bill_id):
     if 'user_id' not in session or session['role'] != 'pharmacist':
         return redirect(url_for('login'))
         
-    conn = get_db_connection()
-    cursor = conn.cursor(buffered=True)
-    cursor.execute("UPDATE billing SET payment_status = 'Paid' WHERE bill_id = %s", (bill_id,))
-    
-    # Get prescription ID to redirect back
-    cursor.execute("SELECT prescription_id FROM billing WHERE bill_id = %s", (bill_id,))
-    res = cursor.fetchone()
-    p_id = res[0]
-    
-    # Update prescription status to dispensed
-    cursor.execute("UPDATE prescriptions SET status = 'dispensed' WHERE prescription_id = %s", (p_id,))
-    
-    conn.commit()
-    cursor.close()
-    conn.close()
+    with get_db_connection() as conn:
+        if conn:
+            cursor = conn.cursor(buffered=True)
+            cursor.execute("UPDATE billing SET payment_status = 'Paid' WHERE bill_id = %s", (bill_id,))
+            
+            # Get prescription ID to redirect back
+            cursor.execute("SELECT prescription_id FROM billing WHERE bill_id = %s", (bill_id,))
+            res = cursor.fetchone()
+            p_id = res[0]
+            
+            # Update prescription status to dispensed
+            cursor.execute("UPDATE prescriptions SET status = 'dispensed' WHERE prescription_id = %s", (p_id,))
+            
+            conn.commit()
+            cursor.close()
+
+            # Freeze the paid invoice in its own transaction, so a failure here
+            # (deadlock, lock wait timeout) can't undo the payment
+            try:
+                snap_cursor = conn.cursor(dictionary=True, buffered=True)
+                document, frozen = INVOICES.load(snap_cursor, bill_id)
+                if document and not frozen:
+                    INVOICES.freeze(snap_cursor, price_invoice(document))
+                    conn.commit()
+                snap_cursor.close()
+            except mysql.connector.Error as err:
+                # The invoice is frozen on its first view instead
+                conn.rollback()
+                print(f"Invoice Snapshot Error: {err}")
+        else:
+            # Temp Data Update
+            t_bill = next((b for b in TEMP_DATA['billing'] if b['bill_id'] == bill_id), None)
+            if not t_bill:
+                flash('Bill not found (Temp Data).')
+                return redirect(url_for('pharmacist_dashboard'))
+            t_bill['payment_status'] = 'Paid'
+            p_id = t_bill['prescription_id']
+            for p in TEMP_DATA['prescriptions']:
+                if p['prescription_id'] == p_id:
+                    p['status'] = 'dispensed'
     flash('Payment recorded successfully.')
     return redirect(url_for('pharmacist_dashboard', prescription_id=p_id))
 
@@ -828,94 +1423,106 @@ def pay_bill(bill_id):
 def invoice(bill_id):
     if 'user_id' not in session:
         return redirect(url_for('login'))
-        
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True, buffered=True)
-    
-    # Fetch Bill
-    cursor.execute("SELECT * FROM billing WHERE bill_id = %s", (bill_id,))
-    bill = cursor.fetchone()
-    
-    if not bill:
-        return "Invoice not found", 404
-        
-    # Fetch Prescription
-    cursor.execute("SELECT * FROM prescriptions WHERE prescription_id = %s", (bill['prescription_id'],))
-    prescription = cursor.fetchone()
-    
-    # Fetch Patient
-    cursor.execute("SELECT * FROM patients WHERE patient_id = %s", (prescription['patient_id'],))
-    patient = cursor.fetchone()
-    
-    # Fetch Doctor
-    cursor.execute("SELECT full_name FROM users WHERE user_id = %s", (prescription['doctor_id'],))
-    doctor = cursor.fetchone()
-    
-    # Fetch Items
-    query = """
-        SELECT pd.*, m.name as medicine_name, m.price 
-        FROM prescription_details pd
-        JOIN medicines m ON pd.medicine_id = m.medicine_id
-        WHERE pd.prescription_id = %s
-    """
-    cursor.execute(query, (bill['prescription_id'],))
-    items = cursor.fetchall()
-    
-    cursor.close()
-    conn.close()
+
+    with get_db_connection() as conn:
+        if conn:
+            try:
+                cursor = conn.cursor(dictionary=True, buffered=True)
+                # Paid invoices never change: reprints come straight from the snapshot
+                document, frozen = INVOICES.cached(cursor, bill_id), True
+                if not document:
+                    # Bill, prescription, patient, doctor and items in one query
+                    document, frozen = INVOICES.load(cursor, bill_id)
+                if document and not frozen:
+                    price_invoice(document)
+                    if document['bill']['payment_status'] == 'Paid':
+                        # Paid before snapshots existed: freeze it now
+                        INVOICES.freeze(cursor, document)
+                        conn.commit()
+                cursor.close()
+                if not document:
+                    return "Invoice not found", 404
+            except mysql.connector.Error as err:
+                print(f"Invoice Db Error: {err}")
+                conn = None # Fallback
+
+        if not conn:
+            # Temp Data Fallback
+            bill = next((b for b in TEMP_DATA['billing'] if b['bill_id'] == bill_id), None)
+            if not bill:
+                return "Invoice not found", 404
+            prescription = next((p for p in TEMP_DATA['prescriptions'] if p['prescription_id'] == bill['prescription_id']), {})
+            patient = next((pat for pat in TEMP_DATA['patients'] if pat['patient_id'] == prescription.get('patient_id')), None)
+            doctor = next((u for u in TEMP_DATA['users'] if u['user_id'] == prescription.get('doctor_id')), None)
+            items = []
+            for d in TEMP_DATA['prescription_details']:
+                if d['prescription_id'] == bill['prescription_id']:
+                    med = next((m for m in TEMP_DATA['medicines'] if m['medicine_id'] == d['medicine_id']), None)
+                    item = d.copy()
+                    item['medicine_name'] = med['name'] if med else "Unknown"
+                    item['price'] = med['price'] if med else 0
+                    items.append(item)
+            document = {'bill': bill, 'prescription': prescription, 'patient': patient, 'doctor': doctor, 'items': items}
     
-    return render_template('invoice.html', bill=bill, prescription=prescription, patient=patient, doctor=doctor, items=items)
+    return render_template('invoice.html', **document)
 
 @app.route('/delete_patient/<int:patient_id>', methods=['POST'])
 def delete_patient(patient_id):
     if 'user_id' not in session or session['role'] != 'admin':
         return redirect(url_for('login'))
         
-    conn = get_db_connection()
-    if conn:
-        try:
-            cursor = conn.cursor(buffered=True)
+    with get_db_connection() as conn:
+        if conn:
+            try:
+                cursor = conn.cursor(buffered=True)
             
-            # --- Cascading Delete ---
-            # 1. Get Prescriptions
-            cursor.execute("SELECT prescription_id FROM prescriptions WHERE patient_id = %s", (patient_id,))
-            p_rows = cursor.fetchall()
-            p_ids = [row[0] for row in p_rows]
+                # --- Cascading Delete ---
+                # 1. Get Prescriptions
+                cursor.execute("SELECT prescription_id FROM prescriptions WHERE patient_id = %s", (patient_id,))
+                p_rows = cursor.fetchall()
+                p_ids = [row[0] for row in p_rows]
             
-            if p_ids:
-                # Format string for IN clause
-                format_strings = ','.join(['%s'] * len(p_ids))
+                bill_ids = []
+                if p_ids:
+                    # Format string for IN clause
+                    format_strings = ','.join(['%s'] * len(p_ids))
                 
-                # 2. Delete Billing
-                cursor.execute(f"DELETE FROM billing WHERE prescription_id IN ({format_strings})", tuple(p_ids))
+                    # 2. Delete Billing (their invoice snapshots cascade)
+                    cursor.execute(f"SELECT bill_id FROM billing WHERE prescription_id IN ({format_strings})", tuple(p_ids))
+                    bill_ids = [row[0] for row in cursor.fetchall()]
+                    cursor.execute(f"DELETE FROM billing WHERE prescription_id IN ({format_strings})", tuple(p_ids))
                 
-                # 3. Delete Prescription Details
-                cursor.execute(f"DELETE FROM prescription_details WHERE prescription_id IN ({format_strings})", tuple(p_ids))
+                    # 3. Delete Prescription Details
+                    cursor.execute(f"DELETE FROM prescription_details WHERE prescription_id IN ({format_strings})", tuple(p_ids))
                 
-                # 4. Delete Prescriptions
-                cursor.execute("DELETE FROM prescriptions WHERE patient_id = %s", (patient_id,))
+                    # 4. Delete Prescriptions
+                    cursor.execute("DELETE FROM prescriptions WHERE patient_id = %s", (patient_id,))
                 
-            # 5. Delete Patient
-            cursor.execute("DELETE FROM patients WHERE patient_id = %s", (patient_id,))
+                # 5. Delete Patient
+                cursor.execute("DELETE FROM patients WHERE patient_id = %s", (patient_id,))
             
-            conn.commit()
-            cursor.close()
-            conn.close()
-            flash('Patient and all associated records deleted successfully.')
-        except mysql.connector.Error as err:
-            flash(f"Error deleting patient: {err}")
-    else:
-        # Temp Data Fallback
-        # Remove billing, details, prescriptions first
-        temp_p_ids = [p['prescription_id'] for p in TEMP_DATA['prescriptions'] if p['patient_id'] == patient_id]
-        
-        TEMP_DATA['billing'] = [b for b in TEMP_DATA['billing'] if b['prescription_id'] not in temp_p_ids]
-        TEMP_DATA['prescription_details'] = [d for d in TEMP_DATA['prescription_details'] if d['prescription_id'] not in temp_p_ids]
-        TEMP_DATA['prescriptions'] = [p for p in TEMP_DATA['prescriptions'] if p['patient_id'] != patient_id]
+                conn.commit()
+                cursor.close()
+                for bill_id in bill_ids:
+                    INVOICES.forget(bill_id)
+                flash('Patient and all associated records deleted successfully.')
+            except mysql.connector.Error as err:
+                flash(f"Error deleting patient: {err}")
+        else:
+            # Temp Data Fallback
+            # Remove billing, details, prescriptions first
+            temp_p_ids = [p['prescription_id'] for p in TEMP_DATA['prescriptions'] if p['patient_id'] == patient_id]
         
-        TEMP_DATA['patients'] = [p for p in TEMP_DATA['patients'] if p['patient_id'] != patient_id]
-        flash('Patient deleted (Temp Data).')
+            TEMP_DATA['billing'] = [b for b in TEMP_DATA['billing'] if b['prescription_id'] not in temp_p_ids]
+            TEMP_DATA['prescription_details'] = [d for d in TEMP_DATA['prescription_details'] if d['prescription_id'] not in temp_p_ids]
+            TEMP_DATA['prescriptions'] = [p for p in TEMP_DATA['prescriptions'] if p['patient_id'] != patient_id]
         
+            TEMP_DATA['patients'] = [p for p in TEMP_DATA['patients'] if p['patient_id'] != patient_id]
+            flash('Patient deleted (Temp Data).')
+
+    # Drop the cached allergy profile so a reused ID never sees stale allergies
+    ALLERGY_MATCHER.invalidate(patient_id)
+    PATIENT_SEARCH.remove(patient_id)
     return redirect(url_for('admin_dashboard'))
 
 @app.route('/delete_user/<int:user_id>', methods=['POST'])
@@ -928,27 +1535,26 @@ def delete_user(user_id):
         flash("You cannot delete your own account while logged in.")
         return redirect(url_for('admin_dashboard'))
         
-    conn = get_db_connection()
-    if conn:
-        try:
-            cursor = conn.cursor(buffered=True)
-            # Handle Foreign Keys (Set doctor_id to NULL in prescriptions)
-            cursor.execute("UPDATE prescriptions SET doctor_id = NULL WHERE doctor_id = %s", (user_id,))
+    with get_db_connection() as conn:
+        if conn:
+            try:
+                cursor = conn.cursor(buffered=True)
+                # Handle Foreign Keys (Set doctor_id to NULL in prescriptions)
+                cursor.execute("UPDATE prescriptions SET doctor_id = NULL WHERE doctor_id = %s", (user_id,))
             
-            # Now delete the user
-            cursor.execute("DELETE FROM users WHERE user_id = %s", (user_id,))
+                # Now delete the user
+                cursor.execute("DELETE FROM users WHERE user_id = %s", (user_id,))
             
-            conn.commit()
-            cursor.close()
-            conn.close()
-            flash('User deleted successfully.')
-        except mysql.connector.Error as err:
-             flash(f"Error deleting user: {err}")
-    else:
-        # Temp Data Fallback
-        TEMP_DATA['users'] = [u for u in TEMP_DATA['users'] if u['user_id'] != user_id]
-        # Also simulate FK nullify if we were tracking it seriously, but for temp data just delete user is fine enough
-        flash('User deleted (Temp Data).')
+                conn.commit()
+                cursor.close()
+                flash('User deleted successfully.')
+            except mysql.connector.Error as err:
+                 flash(f"Error deleting user: {err}")
+        else:
+            # Temp Data Fallback
+            TEMP_DATA['users'] = [u for u in TEMP_DATA['users'] if u['user_id'] != user_id]
+            # Also simulate FK nullify if we were tracking it seriously, but for temp data just delete user is fine enough
+            flash('User deleted (Temp Data).')
         
     return redirect(url_for('admin_dashboard'))
 
@@ -957,20 +1563,20 @@ def delete_sale(bill_id):
     if 'user_id' not in session or session['role'] != 'admin':
         return redirect(url_for('login'))
         
-    conn = get_db_connection()
-    if conn:
-        try:
-            cursor = conn.cursor(buffered=True)
-            cursor.execute("DELETE FROM billing WHERE bill_id = %s", (bill_id,))
-            conn.commit()
-            cursor.close()
-            conn.close()
-            flash('Sales record deleted successfully.')
-        except mysql.connector.Error as err:
-             flash(f"Error deleting sale: {err}")
-    else:
-         TEMP_DATA['billing'] = [b for b in TEMP_DATA['billing'] if b['bill_id'] != bill_id]
-         flash('Sales record deleted (Temp Data).')
+    with get_db_connection() as conn:
+        if conn:
+            try:
+                cursor = conn.cursor(buffered=True)
+                cursor.execute("DELETE FROM billing WHERE bill_id = %s", (bill_id,))
+                conn.commit()
+                cursor.close()
+                INVOICES.forget(bill_id)
+                flash('Sales record deleted successfully.')
+            except mysql.connector.Error as err:
+                 flash(f"Error deleting sale: {err}")
+        else:
+             TEMP_DATA['billing'] = [b for b in TEMP_DATA['billing'] if b['bill_id'] != bill_id]
+             flash('Sales record deleted (Temp Data).')
          
     return redirect(url_for('admin_dashboard'))
 
@@ -983,21 +1589,20 @@ def ai_analysis_dashboard():
         
     prescriptions = []
     # Fetch all prescriptions
-    conn = get_db_connection()
-    if conn:
-        try:
-            cursor = conn.cursor(dictionary=True, buffered=True)
-            cursor.execute("""
-                SELECT p.prescription_id, p.date, pat.name as patient_name 
-                FROM prescriptions p
-                JOIN patients pat ON p.patient_id = pat.patient_id
-                ORDER BY p.date DESC LIMIT 20
-            """)
-            prescriptions = cursor.fetchall()
-            cursor.close()
-            conn.close()
-        except:
-             pass
+    with get_db_connection() as conn:
+        if conn:
+            try:
+                cursor = conn.cursor(dictionary=True, buffered=True)
+                cursor.execute("""
+                    SELECT p.prescription_id, p.date, pat.name as patient_name 
+                    FROM prescriptions p
+                    JOIN patients pat ON p.patient_id = pat.patient_id
+                    ORDER BY p.date DESC LIMIT 20
+                """)
+                prescriptions = cursor.fetchall()
+                cursor.close()
+            except:
+                 pass
     
     if not prescriptions:
         # Temp Data
@@ -1018,30 +1623,38 @@ def analyze_prescription():
         return redirect(url_for('ai_analysis_dashboard'))
         
     source_type = request.form.get('source_type')
-    analysis_result = ""
+    job_args = cache_key = None
     
     if source_type == 'database':
         p_id = request.form.get('prescription_id')
         # Fetch details
         context_text = f"Prescription ID: {p_id}<br>"
         
-        conn = get_db_connection()
-        items = []
-        if conn:
-            try:
-                cursor = conn.cursor(dictionary=True, buffered=True)
-                # Fetch medicines
-                cursor.execute("""
-                    SELECT m.name, pd.dosage, pd.days 
-                    FROM prescription_details pd
-                    JOIN medicines m ON pd.medicine_id = m.medicine_id
-                    WHERE pd.prescription_id = %s
-                """, (p_id,))
-                items = cursor.fetchall()
-                cursor.close()
-                conn.close()
-            except:
-                pass
+        with get_db_connection() as conn:
+            items = []
+            if conn:
+                try:
+                    cursor = conn.cursor(dictionary=True, buffered=True)
+                    # Fetch medicines
+                    cursor.execute("""
+                        SELECT pd.dosage, pd.days, pd.medicine_id,
+                               pd.units_per_day, pd.daily_mg, p.patient_id, pat.allergies
+                        FROM prescription_details pd
+                        JOIN prescriptions p ON pd.prescription_id = p.prescription_id
+                        JOIN patients pat ON p.patient_id = pat.patient_id
+                        WHERE pd.prescription_id = %s
+                    """, (p_id,))
+                    items = [dict(line, name=line['medicine_name']) for line in with_medicine_info(cursor.fetchall())]
+                    cursor.close()
+                except:
+                    pass
+        
+        if not items and p_id and p_id.isdigit():
+            # Temp
+            items = [dict(line, name=line['medicine_name']) for line in temp_validation_data(int(p_id))]
+        
+        # Answer used if the AI misses its latency budget: the record checked against the safety rules
+        fallback_html = local_analysis(items, validation_errors(items, RULES.current())) if items else None
         
         if not items:
              # Temp
@@ -1056,7 +1669,9 @@ def analyze_prescription():
             med_names.append(item['name'])
         context_text += "</ul>"
         
-        analysis_result = get_ai_analysis_mock(" ".join(med_names), image_mode=False)
+        job_args = (" ".join(med_names), False, fallback_html)
+        cache_key = analysis_key('text', med_names, AI_PROMPT_VERSION, AI_MODEL)
+        source_ref = p_id
         
     elif source_type == 'upload':
         if 'file' not in request.files:
@@ -1069,29 +1684,74 @@ def analyze_prescription():
             
         if file and allowed_file(file.filename):
             filename = secure_filename(file.filename)
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            
-            # Ensure folder exists
-            if not os.path.exists(app.config['UPLOAD_FOLDER']):
-                os.makedirs(app.config['UPLOAD_FOLDER'])
-                
-            file.save(filepath)
-            
-            # Process Image with AI
-            analysis_result = get_ai_analysis_mock(filepath, image_mode=True)
+            # Streamed to disk while hashing; identical images are stored once
+            stored = UPLOADS.save(file.stream, user_id=session['user_id'], original_name=filename)
             
-    # Re-render with result
-    # We need to fetch prescriptions list again for the sidebar/dropdown if we want to stay on same page
-    # Or just render the template with the result
-    return render_template('ai_analysis.html', prescriptions=[], analysis_result=analysis_result)
+            # Process Image with AI (keyed by content hash, so a re-scan of the same image hits the cache)
+            job_args = (stored.path, True, None)
+            cache_key = analysis_key('image', stored.sha256, AI_PROMPT_VERSION, AI_MODEL)
+            source_ref = stored.sha256
+
+    if not job_args:
+        flash('Nothing to analyze')
+        return redirect(url_for('ai_analysis_dashboard'))
+
+    # Same medicines / same image analysed before: answer from the cache
+    cached = AI_CACHE.get(cache_key)
+    if cached is not None:
+        if request.accept_mimetypes.best == 'application/json':
+            return jsonify({'status': 'done', 'result': cached, 'cached': True})
+        return render_template('ai_analysis.html', prescriptions=[], analysis_result=cached)
+
+    # Streaming mode: forward tokens as they arrive (SSE for EventSource/API clients,
+    # chunked HTML for the form); the completed text still lands in the cache
+    if request.form.get('stream') == '1' or request.accept_mimetypes.best == 'text/event-stream':
+        chunks = streamed_analysis(cache_key, *job_args)
+        if request.accept_mimetypes.best == 'text/event-stream':
+            return Response(stream_with_context(sse_events(chunks)), mimetype='text/event-stream',
+                            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+        return Response(stream_with_context(stream_template('ai_analysis.html', prescriptions=[],
+                                                            analysis_result=None, analysis_stream=chunks)),
+                        headers={'X-Accel-Buffering': 'no'})
+
+    # Hand the AI call to the background pool; the page polls /analysis_jobs/<job_id>
+    try:
+        job_id = AI_JOBS.submit(analyze_and_cache, cache_key, *job_args,
+                                user_id=session['user_id'], source_type=source_type, source_ref=source_ref)
+    except QueueFull as err:
+        if request.accept_mimetypes.best == 'application/json':
+            return jsonify({'error': str(err)}), 503
+        flash(str(err))
+        return redirect(url_for('ai_analysis_dashboard'))
+
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify({'job_id': job_id, 'status_url': url_for('analysis_job', job_id=job_id)}), 202
+    return render_template('ai_analysis.html', prescriptions=[], analysis_result=None, job_id=job_id)
+
+def sse_events(chunks):
+    for chunk in chunks:
+        yield "".join(f"data: {line}\n" for line in chunk.split("\n")) + "\n"
+    yield "event: done\ndata: \n\n"
+
+@app.route('/analysis_jobs/<job_id>')
+def analysis_job(job_id):
+    if 'user_id' not in session:
+        return redirect(url_for('login'))
+    job = AI_JOBS.get(job_id)
+    if not job or (job['user_id'] != session['user_id'] and session['role'] != 'admin'):
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify({
+        'job_id': job['job_id'],
+        'status': job['status'],
+        'result': job['result'] if job['status'] == 'done' else None,
+        'error': job['error'],
+    })
 
 @app.route('/reports')
 def reports():
     if 'user_id' not in session or session['role'] not in ['admin', 'pharmacist']:
         return redirect(url_for('login'))
         
-    conn = get_db_connection()
-    
     # Defaults
     total_revenue = 0
     total_prescriptions = 0
@@ -1103,62 +1763,60 @@ def reports():
     status_labels = ['Pending', 'Validated', 'Dispensed']
     status_counts = [0, 0, 0]
     
-    if conn:
-        try:
-            cursor = conn.cursor(dictionary=True, buffered=True)
+    with get_db_connection() as conn:
+        if conn:
+            try:
+                cursor = conn.cursor(dictionary=True, buffered=True)
             
-            # 1. Total Revenue (Paid bills)
-            cursor.execute("SELECT SUM(total_amount) as rev FROM billing WHERE payment_status = 'Paid'")
-            res = cursor.fetchone()
-            total_revenue = res['rev'] if res['rev'] else 0
+                # 1. Total Revenue (Paid bills)
+                cursor.execute("SELECT SUM(total_amount) as rev FROM billing WHERE payment_status = 'Paid'")
+                res = cursor.fetchone()
+                total_revenue = res['rev'] if res['rev'] else 0
             
-            # 2. Counts
-            cursor.execute("SELECT COUNT(*) as c FROM prescriptions")
-            total_prescriptions = cursor.fetchone()['c']
+                # 2. Counts
+                cursor.execute("SELECT COUNT(*) as c FROM prescriptions")
+                total_prescriptions = cursor.fetchone()['c']
             
-            cursor.execute("SELECT COUNT(*) as c FROM prescriptions WHERE status = 'pending'")
-            pending_count = cursor.fetchone()['c']
+                cursor.execute("SELECT COUNT(*) as c FROM prescriptions WHERE status = 'pending'")
+                pending_count = cursor.fetchone()['c']
             
-            # Status Distribution
-            cursor.execute("SELECT status, COUNT(*) as c FROM prescriptions GROUP BY status")
-            stats = cursor.fetchall()
-            for s in stats:
-                if s['status'] == 'pending': status_counts[0] = s['c']
-                elif s['status'] == 'validated': status_counts[1] = s['c']
-                elif s['status'] == 'dispensed': status_counts[2] = s['c']
-
-            # 3. Low Stock (< 100)
-            cursor.execute("SELECT * FROM medicines WHERE quantity < 100")
-            low_stock_items = cursor.fetchall()
-            low_stock_count = len(low_stock_items)
+                # Status Distribution
+                cursor.execute("SELECT status, COUNT(*) as c FROM prescriptions GROUP BY status")
+                stats = cursor.fetchall()
+                for s in stats:
+                    if s['status'] == 'pending': status_counts[0] = s['c']
+                    elif s['status'] == 'validated': status_counts[1] = s['c']
+                    elif s['status'] == 'dispensed': status_counts[2] = s['c']
+
+                # 3. Low Stock (catalog)
+                low_stock_items = CATALOG.current().low_stock(LOW_STOCK_THRESHOLD)
+                low_stock_count = len(low_stock_items)
             
-            # 4. Top Medicines
-            # Join prescription_details with medicines, group by medicine name
-            query = """
-                SELECT m.name, SUM(pd.days) as usage_count 
-                FROM prescription_details pd
-                JOIN medicines m ON pd.medicine_id = m.medicine_id
-                GROUP BY m.name
-                ORDER BY usage_count DESC
-                LIMIT 5
-            """
-            cursor.execute(query)
-            top = cursor.fetchall()
-            top_meds_names = [t['name'] for t in top]
-            top_meds_counts = [float(t['usage_count']) for t in top]
+                # 4. Top Medicines
+                # Group prescription_details by medicine; names come from the catalog
+                query = """
+                    SELECT pd.medicine_id, SUM(pd.days) as usage_count 
+                    FROM prescription_details pd
+                    GROUP BY pd.medicine_id
+                    ORDER BY usage_count DESC
+                    LIMIT 5
+                """
+                cursor.execute(query)
+                top = with_medicine_info(cursor.fetchall())
+                top_meds_names = [t['medicine_name'] for t in top]
+                top_meds_counts = [float(t['usage_count']) for t in top]
             
-            cursor.close()
-            conn.close()
-        except mysql.connector.Error as err:
-            print(f"Report Error: {err}")
-            conn = None
+                cursor.close()
+            except mysql.connector.Error as err:
+                print(f"Report Error: {err}")
+                conn = None
             
     if not conn:
         # Temp Data Simulation
         # Simple mocks for display
         total_revenue = 1250.00
         total_prescriptions = len(TEMP_DATA['prescriptions'])
-        low_stock_items = [m for m in TEMP_DATA['medicines'] if m['quantity'] < 100]
+        low_stock_items = [m for m in TEMP_DATA['medicines'] if m['quantity'] < LOW_STOCK_THRESHOLD]
         low_stock_count = len(low_stock_items)
         top_meds_names = ['Paracetamol (Mock)', 'Ibuprofen (Mock)']
         top_meds_counts = [15, 10]
@@ -1173,5 +1831,31 @@ def reports():
                            top_meds_counts=top_meds_counts,
                            status_labels=status_labels,
                            status_counts=status_counts)
+
+@app.route('/admin/ai_cache/purge', methods=['POST'])
+def purge_ai_cache():
+    if 'user_id' not in session or session['role'] != 'admin':
+        return redirect(url_for('login'))
+    removed = AI_CACHE.purge()
+    flash(f"AI analysis cache purged ({removed} stored analyses removed).")
+    return redirect(url_for('admin_dashboard'))
+
+@app.route('/admin/metrics')
+def admin_metrics():
+    if 'user_id' not in session or session['role'] != 'admin':
+        return redirect(url_for('login'))
+    return jsonify({'db_pool': db_pool.stats(), 'db_breaker': db_breaker.stats(), 'rules': RULES.stats(),
+                    'validation_cache': VALIDATION_CACHE.stats(),
+                    'stock': STOCK.stats(),
+                    'ai_jobs': AI_JOBS.stats(),
+                    'ai_cache': AI_CACHE.stats(),
+                    'image_prep': IMAGE_PREP.stats(),
+                    'uploads': UPLOADS.stats(),
+                    'ai_latency': AI_BUDGET.stats(),
+                    'ai_providers': AI_PROVIDERS.stats(),
+                    'patient_search': PATIENT_SEARCH.stats(),
+                    'catalog': CATALOG.stats(),
+                    'invoices': INVOICES.stats()})
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
\ No newline at end of file
@@ -0,0 +1,185 @@
+import os
+import threading
+import time
+
+
+class CatalogSnapshot:
+    """
+    Immutable view of the medicines table: id -> record and lowercase name -> id.
+    Records are dicts with medicine_id, name, price and quantity, like the rows
+    of SELECT * FROM medicines. Stock changes produce a new snapshot (with_stock).
+    """
+
+    def __init__(self, version, stock_version, records):
+        self.version = version
+        self.stock_version = stock_version
+        self.by_id = {r['medicine_id']: r for r in records}
+        self.by_name = {r['name'].lower(): r['medicine_id'] for r in records}
+        self.medicines = sorted(self.by_id.values(), key=lambda r: r['medicine_id'])
+
+    def get(self, medicine_id):
+        return self.by_id.get(medicine_id)
+
+    def find(self, name):
+        medicine_id = self.by_name.get((name or '').strip().lower())
+        return self.by_id.get(medicine_id) if medicine_id is not None else None
+
+    def low_stock(self, threshold):
+        return [r for r in self.medicines if r['quantity'] < threshold]
+
+    def with_stock(self, stock_version, quantities):
+        """Copy with {medicine_id: quantity} applied."""
+        records = [dict(r, quantity=quantities[r['medicine_id']]) if r['medicine_id'] in quantities else r
+                   for r in self.medicines]
+        return CatalogSnapshot(self.version, stock_version, records)
+
+
+class MedicineCatalog:
+    """
+    Process-wide medicine catalog, so routes read names, prices and stock
+    without a query.
+
+    current() is a plain attribute read, as with validation.RuleStore. A
+    daemon thread polls the one-row catalog_version table every
+    refresh_interval seconds:
+    - version moves on any insert, delete, or name/price change (triggers,
+      see setup_db.m009_catalog_version): the whole table is reloaded
+    - stock_version moves when stock is dispensed (stock_changed): only
+      quantities are reloaded
+
+    Dispensing bumps stock_version after its transaction commits rather than
+    from a trigger, so concurrent dispenses never queue on the version row.
+    The dispensing process applies its own deduction at once; other workers
+    see it on their next poll. Stock edited by hand in SQL should bump
+    stock_version too.
+
+    connect is a context manager yielding a connection or None (app.get_db_connection).
+    Until the first successful load the catalog is empty (version 0).
+    """
+
+    def __init__(self, connect, refresh_interval=10.0, miss_interval=1.0):
+        self.connect = connect
+        self.refresh_interval = refresh_interval
+        self.miss_interval = miss_interval
+        self._snapshot = CatalogSnapshot(0, 0, [])
+        self._lock = threading.Lock()
+        self._pid = None
+        self._loaded_at = None
+        self._miss_lock = threading.Lock()
+        self._missing = (0, set())  # (version, ids known not to exist at that version)
+        self._miss_checked_at = float('-inf')
+        self._metrics = {'polls': 0, 'reloads': 0, 'stock_reloads': 0, 'miss_checks': 0,
+                         'local_stock_updates': 0, 'errors': 0}
+
+    def current(self):
+        if self._pid != os.getpid():
+            self._start()
+        return self._snapshot
+
+    def _start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self.refresh()
+            self._pid = os.getpid()
+            if self.refresh_interval:
+                threading.Thread(target=self._poll_loop, name='medicine-catalog-poll', daemon=True).start()
+
+    def _poll_loop(self):
+        while True:
+            time.sleep(self.refresh_interval)
+            self.refresh()
+
+    def lookup(self, medicine_ids):
+        """
+        Snapshot holding every id in medicine_ids that exists. An unknown id may
+        be a medicine added since the last poll, so it triggers an immediate
+        version check (and a reload if the version moved). Ids already found
+        missing at the current version don't check again, and checks are at
+        most one per miss_interval seconds, so bogus ids can't keep the
+        request path reloading.
+        """
+        snapshot = self.current()
+        unknown = {i for i in medicine_ids if i not in snapshot.by_id}
+        if not unknown:
+            return snapshot
+        with self._miss_lock:
+            version, missing = self._missing
+            now = time.monotonic()
+            if (version == snapshot.version and unknown <= missing) or \
+                    now - self._miss_checked_at < self.miss_interval:
+                return snapshot
+            self._miss_checked_at = now
+            self._metrics['miss_checks'] += 1
+            self.refresh()
+            snapshot = self._snapshot
+            if version != snapshot.version:
+                missing = set()
+            self._missing = (snapshot.version, missing | {i for i in unknown if i not in snapshot.by_id})
+        return snapshot
+
+    def refresh(self, force=False):
+        """Reload what changed since the current snapshot. Returns True if a new snapshot was swapped in."""
+        self._metrics['polls'] += 1
+        current = self._snapshot
+        try:
+            with self.connect() as conn:
+                if not conn:
+                    return False
+                cursor = conn.cursor(dictionary=True, buffered=True)
+                try:
+                    cursor.execute("SELECT version, stock_version FROM catalog_version WHERE id = 1")
+                    row = cursor.fetchone() or {'version': 0, 'stock_version': 0}
+                    if force or row['version'] != current.version or not current.by_id:
+                        cursor.execute("SELECT medicine_id, name, price, quantity FROM medicines")
+                        snapshot = CatalogSnapshot(row['version'], row['stock_version'], cursor.fetchall())
+                        counter = 'reloads'
+                    elif row['stock_version'] != current.stock_version:
+                        cursor.execute("SELECT medicine_id, quantity FROM medicines")
+                        quantities = {r['medicine_id']: r['quantity'] for r in cursor.fetchall()}
+                        snapshot = current.with_stock(row['stock_version'], quantities)
+                        counter = 'stock_reloads'
+                    else:
+                        return False
+                finally:
+                    cursor.close()
+                    conn.commit()  # end the read snapshot so the next poll sees new commits
+        except Exception as err:
+            self._metrics['errors'] += 1
+            print(f"Catalog Reload Error: {err}")
+            return False
+        self._snapshot = snapshot
+        self._loaded_at = time.time()
+        self._metrics[counter] += 1
+        return True
+
+    def stock_changed(self, conn, deducted):
+        """
+        After a committed dispense: apply {medicine_id: units deducted} to this
+        process's snapshot and bump stock_version for the other workers.
+        """
+        current = self._snapshot
+        quantities = {med_id: current.by_id[med_id]['quantity'] - qty
+                      for med_id, qty in deducted.items() if med_id in current.by_id}
+        self._snapshot = current.with_stock(current.stock_version, quantities)
+        self._metrics['local_stock_updates'] += 1
+        try:
+            cursor = conn.cursor()
+            cursor.execute("UPDATE catalog_version SET stock_version = stock_version + 1 WHERE id = 1")
+            conn.commit()
+            cursor.close()
+        except Exception as err:
+            # Other workers catch up on the next catalog change instead
+            self._metrics['errors'] += 1
+            print(f"Catalog Version Error: {err}")
+
+    def stats(self):
+        snapshot = self._snapshot
+        data = dict(self._metrics)
+        data.update({
+            'version': snapshot.version,
+            'stock_version': snapshot.stock_version,
+            'medicines': len(snapshot.by_id),
+            'loaded_at': self._loaded_at,
+        })
+        return data
@@ -0,0 +1,29 @@
+import mysql.connector
+import pytest
+
+from setup_db import DB_CONFIG, DB_NAME
+
+# test_db_connection.py is a manual script that needs a live MySQL server
+collect_ignore = ['test_db_connection.py']
+
+
+@pytest.fixture(scope='module')
+def connect():
+    """
+    Connection factory for pharmacy_db; every connection it opens is closed
+    after the module. Tests using it are skipped when MySQL isn't reachable.
+    """
+    opened = []
+
+    def _connect():
+        conn = mysql.connector.connect(database=DB_NAME, **DB_CONFIG)
+        opened.append(conn)
+        return conn
+
+    try:
+        _connect()
+    except mysql.connector.Error as err:
+        pytest.skip(f"MySQL not available: {err}")
+    yield _connect
+    for conn in opened:
+        conn.close()
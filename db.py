@@ -0,0 +1,368 @@
+import os
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+import mysql.connector
+from mysql.connector import errors
+
+
+class PoolTimeout(errors.PoolError):
+    """Raised when no connection could be checked out within the wait timeout."""
+
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_float(name, default):
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+class PooledConnection:
+    """
+    Thin proxy around a raw mysql connection checked out from a ConnectionPool.
+    close() hands the connection back to the pool instead of closing the socket,
+    so existing route code calling conn.close() keeps working.
+    """
+
+    def __init__(self, pool, raw, created_at):
+        self._pool = pool
+        self._raw = raw
+        self._created_at = created_at
+
+    def close(self):
+        if self._raw is not None:
+            raw, self._raw = self._raw, None
+            self._pool._release(raw, self._created_at)
+
+    def __getattr__(self, name):
+        if self._raw is None:
+            raise errors.OperationalError("Connection already returned to the pool")
+        return getattr(self._raw, name)
+
+
+class ConnectionPool:
+    """
+    Per-process MySQL connection pool.
+
+    - size: connections kept open while idle (one gunicorn worker = one pool,
+      so size it to the worker's thread count).
+    - max_overflow: extra connections opened under bursts, closed on release.
+    - max_lifetime: seconds after which a connection is recycled on checkout.
+    - ping_interval: connections idle longer than this are pinged on checkout.
+    - timeout: seconds a request waits for a free connection before PoolTimeout.
+    """
+
+    def __init__(self, config, size=5, max_overflow=10, max_lifetime=1800,
+                 ping_interval=5.0, timeout=5.0):
+        self.config = dict(config)
+        self.size = size
+        self.max_overflow = max_overflow
+        self.max_lifetime = max_lifetime
+        self.ping_interval = ping_interval
+        self.timeout = timeout
+
+        self._cond = threading.Condition()
+        self._reset_state()
+
+    def _reset_state(self):
+        self._pid = os.getpid()
+        self._idle = deque()  # (raw_conn, created_at, returned_at)
+        self._open = 0
+        self._checked_out = 0
+        self._metrics = {
+            'checkouts': 0,
+            'connects': 0,
+            'connect_errors': 0,
+            'waits': 0,
+            'wait_time_total_ms': 0.0,
+            'wait_time_max_ms': 0.0,
+            'timeouts': 0,
+            'health_check_failures': 0,
+            'recycled': 0,
+            'overflow_closed': 0,
+        }
+
+    def _check_fork(self):
+        # A pool inherited through fork (gunicorn --preload) shares sockets with
+        # the parent; drop them without closing and start fresh in this worker.
+        if self._pid != os.getpid():
+            self._reset_state()
+
+    def _count(self, name):
+        with self._cond:
+            self._metrics[name] += 1
+
+    def _connect(self):
+        raw = mysql.connector.connect(**self.config)
+        self._count('connects')
+        return raw, time.monotonic()
+
+    @staticmethod
+    def _discard(raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def _healthy(self, raw, created_at, returned_at):
+        now = time.monotonic()
+        if self.max_lifetime and now - created_at > self.max_lifetime:
+            self._count('recycled')
+            return False
+        if now - returned_at >= self.ping_interval:
+            try:
+                raw.ping(reconnect=False)
+            except Exception:
+                self._count('health_check_failures')
+                return False
+        return True
+
+    def acquire(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        waited = False
+
+        with self._cond:
+            self._check_fork()
+            while True:
+                if self._idle:
+                    raw, created_at, returned_at = self._idle.pop()
+                    break
+                if self._open < self.size + self.max_overflow:
+                    raw = None
+                    self._open += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._metrics['timeouts'] += 1
+                    raise PoolTimeout(
+                        f"No database connection available after {timeout:.1f}s "
+                        f"({self._open} open, pool size {self.size}+{self.max_overflow})"
+                    )
+                waited = True
+                self._cond.wait(remaining)
+
+            self._checked_out += 1
+            self._metrics['checkouts'] += 1
+            if waited:
+                wait_ms = (time.monotonic() - started) * 1000
+                self._metrics['waits'] += 1
+                self._metrics['wait_time_total_ms'] += wait_ms
+                self._metrics['wait_time_max_ms'] = max(self._metrics['wait_time_max_ms'], wait_ms)
+
+        # Network work (ping / connect) happens outside the lock.
+        try:
+            if raw is not None and not self._healthy(raw, created_at, returned_at):
+                self._discard(raw)
+                raw = None
+            if raw is None:
+                raw, created_at = self._connect()
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._checked_out -= 1
+                self._metrics['checkouts'] -= 1
+                self._metrics['connect_errors'] += 1
+                self._cond.notify()
+            raise
+
+        return PooledConnection(self, raw, created_at)
+
+    def _release(self, raw, created_at):
+        keep = True
+        try:
+            # Never hand an open transaction to the next request.
+            if raw.in_transaction:
+                raw.rollback()
+        except Exception:
+            keep = False
+
+        with self._cond:
+            if self._pid != os.getpid():
+                return
+            self._checked_out -= 1
+            if keep and len(self._idle) >= self.size:
+                self._metrics['overflow_closed'] += 1
+                keep = False
+            if keep:
+                self._idle.append((raw, created_at, time.monotonic()))
+            else:
+                self._open -= 1
+            self._cond.notify()
+
+        if not keep:
+            self._discard(raw)
+
+    def probe(self):
+        """Open and close one connection outside the pool (used by CircuitBreaker)."""
+        mysql.connector.connect(**self.config).close()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def stats(self):
+        with self._cond:
+            data = dict(self._metrics)
+            data.update({
+                'size': self.size,
+                'max_overflow': self.max_overflow,
+                'open': self._open,
+                'idle': len(self._idle),
+                'checked_out': self._checked_out,
+            })
+        waits = data['waits']
+        data['wait_time_avg_ms'] = round(data['wait_time_total_ms'] / waits, 2) if waits else 0.0
+        return data
+
+    def close_all(self):
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+            self._open -= len(idle)
+        for raw, _, _ in idle:
+            self._discard(raw)
+
+
+class CircuitBreaker:
+    """
+    Closed / open / half-open breaker in front of the database.
+
+    After failure_threshold consecutive connect failures the breaker opens and
+    allow() answers False immediately, so routes fall back to TEMP_DATA without
+    paying the connect timeout. While open, a background thread runs probe()
+    every probe_interval seconds and closes the breaker on the first success.
+    If no probe is configured, the breaker goes half-open after reset_timeout
+    and lets a single trial request through.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=3, reset_timeout=30.0, probe=None, probe_interval=5.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.probe = probe
+        self.probe_interval = probe_interval
+
+        self.state = self.CLOSED
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_started_at = None
+        self._probe_thread = None
+        self._metrics = {
+            'opens': 0,
+            'failures': 0,
+            'short_circuits': 0,
+            'probes': 0,
+            'probe_failures': 0,
+        }
+
+    def allow(self):
+        # Hot path: a closed breaker costs one attribute read.
+        if self.state == self.CLOSED:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            if self.state == self.OPEN and now - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._trial_started_at = None
+            if self.state == self.HALF_OPEN:
+                # One trial request at a time; a trial that never reported back
+                # (e.g. pool timeout) is given up on after reset_timeout.
+                if self._trial_started_at is None or now - self._trial_started_at >= self.reset_timeout:
+                    self._trial_started_at = now
+                    return True
+            if self.state == self.CLOSED:
+                return True
+            self._metrics['short_circuits'] += 1
+            return False
+
+    def record_success(self):
+        if self.state == self.CLOSED and not self._failures:
+            return
+        with self._lock:
+            if self.state != self.CLOSED:
+                print("DB circuit breaker closed: database reachable again")
+            self.state = self.CLOSED
+            self._failures = 0
+            self._trial_started_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._metrics['failures'] += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._trip()
+
+    def _trip(self):
+        if self.state != self.OPEN:
+            print(f"DB circuit breaker open after {self._failures} failure(s)")
+            self._metrics['opens'] += 1
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._trial_started_at = None
+        if self.probe and (self._probe_thread is None or not self._probe_thread.is_alive()):
+            self._probe_thread = threading.Thread(target=self._probe_loop, name='db-breaker-probe', daemon=True)
+            self._probe_thread.start()
+
+    def _probe_loop(self):
+        while True:
+            time.sleep(self.probe_interval)
+            if self.state == self.CLOSED:
+                return
+            with self._lock:
+                self._metrics['probes'] += 1
+            try:
+                self.probe()
+            except Exception:
+                with self._lock:
+                    self._metrics['probe_failures'] += 1
+                continue
+            self.record_success()
+            return
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._metrics)
+            data.update({
+                'state': self.state,
+                'consecutive_failures': self._failures,
+                'failure_threshold': self.failure_threshold,
+            })
+        return data
+
+
+def pool_from_env(config):
+    return ConnectionPool(
+        config,
+        size=_env_int('DB_POOL_SIZE', 5),
+        max_overflow=_env_int('DB_POOL_MAX_OVERFLOW', 10),
+        max_lifetime=_env_int('DB_POOL_MAX_LIFETIME', 1800),
+        ping_interval=_env_float('DB_POOL_PING_INTERVAL', 5.0),
+        timeout=_env_float('DB_POOL_TIMEOUT', 5.0),
+    )
+
+
+def breaker_from_env(probe=None):
+    return CircuitBreaker(
+        failure_threshold=_env_int('DB_BREAKER_FAILURE_THRESHOLD', 3),
+        reset_timeout=_env_float('DB_BREAKER_RESET_TIMEOUT', 30.0),
+        probe=probe,
+        probe_interval=_env_float('DB_BREAKER_PROBE_INTERVAL', 5.0),
+    )
@@ -0,0 +1,147 @@
+"""
+Stand-in for the OpenAI chat completions API, for local runs and load tests.
+
+    python fake_ai_server.py --port 8001 --delay 2.0
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=fake python app.py
+
+Answers POST .../chat/completions with a canned HTML analysis (one marked
+section per prescription for packed prompts) after --delay seconds (plus up
+to --jitter), streamed word by word when the request asks for stream=true,
+and fails a --fail-rate fraction of requests with HTTP 500 so error handling
+can be exercised.
+"""
+import argparse
+import json
+import random
+import re
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CANNED_ANALYSIS = (
+    "<h3>AI Analysis Report (Fake Server)</h3>"
+    "<p><strong>Medicines:</strong> {summary}</p>"
+    "<ul><li><strong>Interactions:</strong> None detected by the fake server.</li>"
+    "<li><strong>Recommendation:</strong> Dispense as prescribed.</li></ul>"
+)
+
+
+# Packed prompts (precompute_analyses.py) ask for one marked section per prescription
+PACKED_COUNT = re.compile(r"Analyze each of the following (\d+) prescriptions")
+
+
+def _summary(messages):
+    # Echo a little of the last user text back so responses differ per prompt
+    content = messages[-1].get('content', '') if messages else ''
+    if isinstance(content, list):
+        content = ' '.join(part.get('text', '') for part in content if part.get('type') == 'text')
+    return ' '.join(content.split())[:200]
+
+
+class FakeAIHandler(BaseHTTPRequestHandler):
+    delay = 0.0
+    jitter = 0.0
+    fail_rate = 0.0
+    token_delay = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, model, text):
+        # OpenAI-style SSE: one chunk per word, then [DONE]
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.end_headers()
+        chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+        words = text.split(' ')
+        for i, word in enumerate(words):
+            delta = {'content': word if i == len(words) - 1 else word + ' '}
+            if i == 0:
+                delta['role'] = 'assistant'
+            self._send_event({'id': chunk_id, 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                              'model': model, 'choices': [{'index': 0, 'delta': delta, 'finish_reason': None}]})
+            time.sleep(self.token_delay)
+        self._send_event({'id': chunk_id, 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                          'model': model, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]})
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def _send_event(self, body):
+        self.wfile.write(f"data: {json.dumps(body)}\n\n".encode('utf-8'))
+        self.wfile.flush()
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': f"Unknown path {self.path}"}})
+            return
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self._send_json(400, {'error': {'message': 'Invalid JSON'}})
+            return
+
+        time.sleep(self.delay + random.uniform(0, self.jitter))
+        if random.random() < self.fail_rate:
+            self._send_json(500, {'error': {'message': 'Fake server failure', 'type': 'server_error'}})
+            return
+
+        summary = _summary(payload.get('messages', []))
+        packed = PACKED_COUNT.search(summary)
+        if packed:
+            text = ''.join(f"<!-- analysis {i} -->" + CANNED_ANALYSIS.format(summary=f"packed item {i}")
+                           for i in range(1, int(packed.group(1)) + 1))
+        else:
+            text = CANNED_ANALYSIS.format(summary=summary)
+        if payload.get('stream'):
+            self._send_stream(payload.get('model', 'fake-model'), text)
+            return
+        self._send_json(200, {
+            'id': f"chatcmpl-{uuid.uuid4().hex}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': payload.get('model', 'fake-model'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': text},
+                'finish_reason': 'stop',
+            }],
+            'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0},
+        })
+
+
+def serve(port=8001, delay=0.0, jitter=0.0, fail_rate=0.0, host='127.0.0.1', token_delay=0.0):
+    """Build (not start) a fake server; call serve_forever() or run it in a thread."""
+    handler = type('ConfiguredFakeAIHandler', (FakeAIHandler,),
+                   {'delay': delay, 'jitter': jitter, 'fail_rate': fail_rate, 'token_delay': token_delay})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--delay', type=float, default=1.0, help='seconds before each response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='extra random delay, up to this many seconds')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='fraction of requests answered with HTTP 500')
+    parser.add_argument('--token-delay', type=float, default=0.05, help='seconds between words when streaming')
+    args = parser.parse_args()
+
+    server = serve(args.port, args.delay, args.jitter, args.fail_rate, args.host, args.token_delay)
+    print(f"Fake AI server on http://{args.host}:{args.port}/v1 (delay {args.delay}s, fail rate {args.fail_rate})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
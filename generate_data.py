@@ -0,0 +1,248 @@
+"""
+Synthetic dataset generator for scale testing.
+
+Fills the existing pharmacy_db schema with a deterministic, production-shaped
+dataset so benchmarks of reports(), patient_history() and the dashboards can be
+compared across commits. Run setup_db.py first, then e.g.:
+
+    python generate_data.py --patients 1000000 --seed 42 --fast
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+import mysql.connector
+
+from setup_db import DB_CONFIG, DB_NAME
+from validation import compile_dosage
+
+FIRST_NAMES = ['Aarav', 'Aditi', 'Amit', 'Ananya', 'Arjun', 'Deepa', 'Divya', 'Farhan', 'Gita', 'Hari',
+               'Isha', 'Jaya', 'Karan', 'Kavya', 'Lakshmi', 'Manoj', 'Meera', 'Nikhil', 'Priya', 'Rahul',
+               'Ravi', 'Riya', 'Sanjay', 'Sara', 'Suresh', 'Tara', 'Uma', 'Varun', 'Vikram', 'Zoya',
+               'John', 'Mary', 'David', 'Linda', 'James', 'Susan', 'Maria', 'Omar', 'Fatima', 'Chen']
+LAST_NAMES = ['Sharma', 'Patel', 'Nair', 'Iyer', 'Menon', 'Reddy', 'Khan', 'Singh', 'Das', 'Gupta',
+              'Joseph', 'Thomas', 'Kumar', 'Rao', 'Pillai', 'Varghese', 'Mathew', 'George', 'Smith', 'Jones',
+              'Brown', 'Wilson', 'Ali', 'Chowdhury', 'Bose', 'Mehta', 'Shah', 'Verma', 'Kapoor', 'Jain']
+ALLERGY_VOCAB = ['Penicillin', 'Sulfa', 'Aspirin', 'Ibuprofen', 'Amoxicillin', 'Cetirizine',
+                 'Diclofenac', 'Latex', 'Peanuts', 'Shellfish', 'Eggs', 'Codeine']
+EXTRA_MEDICINES = ['Losartan', 'Amlodipine', 'Levothyroxine', 'Simvastatin', 'Ranitidine', 'Montelukast',
+                   'Doxycycline', 'Ciprofloxacin', 'Prednisolone', 'Salbutamol', 'Gabapentin', 'Sertraline',
+                   'Fluoxetine', 'Clopidogrel', 'Warfarin', 'Glimepiride', 'Telmisartan', 'Domperidone',
+                   'Ondansetron', 'Levocetirizine', 'Rosuvastatin', 'Esomeprazole', 'Tramadol', 'Naproxen']
+STRENGTHS = ['5mg', '10mg', '20mg', '25mg', '40mg', '50mg', '100mg', '250mg', '500mg']
+
+# (value, weight) tables
+DOSAGES = [('1-0-1', 40), ('1-1-1', 20), ('0-0-1', 15), ('1-0-0', 15), ('1', 5), ('2-0-2', 5)]
+DAYS = [(3, 25), (5, 30), (7, 25), (10, 8), (14, 7), (30, 5)]
+LINES_PER_RX = [(1, 35), (2, 35), (3, 20), (4, 10)]
+ALLERGY_COUNT = [(0, 78), (1, 17), (2, 5)]
+
+
+def weighted(rng, table):
+    values, weights = zip(*table)
+    return rng.choices(values, weights=weights)[0]
+
+
+def zipf_cum_weights(n, s=1.1):
+    total = 0.0
+    cum = []
+    for rank in range(1, n + 1):
+        total += 1.0 / rank ** s
+        cum.append(total)
+    return cum
+
+
+class Generator:
+    def __init__(self, conn, args):
+        self.conn = conn
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.end_date = datetime.strptime(args.end_date, '%Y-%m-%d')
+        self.counts = {'users': 0, 'medicines': 0, 'patients': 0, 'prescriptions': 0,
+                       'prescription_details': 0, 'billing': 0}
+        self._doses = {}
+
+    # --- helpers ---
+    def insert_many(self, cursor, table, columns, rows):
+        # executemany() on INSERT is rewritten by the connector into multi-row INSERTs
+        if not rows:
+            return
+        placeholders = ', '.join(['%s'] * len(columns))
+        sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+        for start in range(0, len(rows), self.args.batch_size):
+            cursor.executemany(sql, rows[start:start + self.args.batch_size])
+        self.counts[table] += len(rows)
+
+    def compiled_dose(self, dosage, medicine_name):
+        # Same structured columns create_prescription stores; few distinct combinations
+        key = (dosage, medicine_name)
+        if key not in self._doses:
+            self._doses[key] = compile_dosage(dosage, medicine_name)
+        return self._doses[key]
+
+    def next_id(self, cursor, table, column):
+        cursor.execute(f"SELECT COALESCE(MAX({column}), 0) FROM {table}")
+        return cursor.fetchone()[0] + 1
+
+    # --- reference data ---
+    def generate_doctors(self, cursor):
+        start = self.next_id(cursor, 'users', 'user_id')
+        rows = []
+        for i in range(self.args.doctors):
+            user_id = start + i
+            first, last = self.rng.choice(FIRST_NAMES), self.rng.choice(LAST_NAMES)
+            rows.append((user_id, f"Dr. {first} {last}", f"gen_doc{user_id}", f"gen_doc{user_id}@medihub.com",
+                         'pass123', 'doctor'))
+        self.insert_many(cursor, 'users', ['user_id', 'full_name', 'username', 'email', 'password', 'role'], rows)
+        cursor.execute("SELECT user_id FROM users WHERE role = 'doctor' ORDER BY user_id")
+        return [r[0] for r in cursor.fetchall()]
+
+    def generate_medicines(self, cursor):
+        cursor.execute("SELECT COUNT(*) FROM medicines")
+        existing = cursor.fetchone()[0]
+        start = self.next_id(cursor, 'medicines', 'medicine_id')
+        rows = []
+        for i in range(max(0, self.args.medicines - existing)):
+            name = f"{EXTRA_MEDICINES[i % len(EXTRA_MEDICINES)]} {self.rng.choice(STRENGTHS)}"
+            if i >= len(EXTRA_MEDICINES):
+                name += f" ({i // len(EXTRA_MEDICINES) + 1})"
+            rows.append((start + i, name, self.rng.randint(0, 2000), round(self.rng.uniform(1.5, 80.0), 2)))
+        self.insert_many(cursor, 'medicines', ['medicine_id', 'name', 'quantity', 'price'], rows)
+        cursor.execute("SELECT medicine_id, price, name FROM medicines ORDER BY medicine_id")
+        medicines = [(r[0], float(r[1]), r[2]) for r in cursor.fetchall()]
+        # Skewed popularity: a shuffled rank order with Zipf weights
+        self.rng.shuffle(medicines)
+        return medicines, zipf_cum_weights(len(medicines))
+
+    # --- transactional data, one chunk of patients at a time ---
+    def generate_chunk(self, cursor, patient_ids, doctors, medicines, med_cum, ids):
+        patients, prescriptions, details, bills = [], [], [], []
+        rx_mean = self.args.rx_per_patient
+        history_days = self.args.days
+
+        for patient_id in patient_ids:
+            name = f"{self.rng.choice(FIRST_NAMES)} {self.rng.choice(LAST_NAMES)}"
+            age = min(95, max(1, int(self.rng.gauss(42, 18))))
+            gender = weighted(self.rng, [('Male', 49), ('Female', 49), ('Other', 2)])
+            contact = f"9{self.rng.randint(100000000, 999999999)}"
+            allergies = ', '.join(self.rng.sample(ALLERGY_VOCAB, weighted(self.rng, ALLERGY_COUNT)))
+            patients.append((patient_id, name, age, gender, contact, allergies))
+
+            # Long-tailed visits per patient: most have a few, chronic patients many
+            n_rx = min(500, int(self.rng.expovariate(1.0 / rx_mean)))
+            for _ in range(n_rx):
+                rx_id = ids['prescription']
+                ids['prescription'] += 1
+                age_days = history_days * self.rng.random() ** 1.5  # more recent activity
+                rx_date = self.end_date - timedelta(days=age_days, seconds=self.rng.randint(0, 86399))
+                if age_days < 2:
+                    status = weighted(self.rng, [('pending', 60), ('validated', 25), ('dispensed', 15)])
+                else:
+                    status = weighted(self.rng, [('pending', 3), ('validated', 7), ('dispensed', 90)])
+                prescriptions.append((rx_id, patient_id, self.rng.choice(doctors), rx_date, status))
+
+                total = 0.0
+                lines = weighted(self.rng, LINES_PER_RX)
+                chosen = set()
+                for _ in range(lines):
+                    medicine_id, price, medicine_name = self.rng.choices(medicines, cum_weights=med_cum)[0]
+                    if medicine_id in chosen:
+                        continue
+                    chosen.add(medicine_id)
+                    days = weighted(self.rng, DAYS)
+                    dosage = weighted(self.rng, DOSAGES)
+                    dose = self.compiled_dose(dosage, medicine_name)
+                    details.append((rx_id, medicine_id, dosage, days, dose['units_per_slot'], dose['units_per_day'],
+                                    dose['strength_mg'], dose['daily_mg']))
+                    total += price * days
+
+                if status != 'pending':
+                    bills.append((rx_id, round(total, 2), 'Paid' if status == 'dispensed' else 'Unpaid',
+                                  rx_date + timedelta(minutes=self.rng.randint(5, 240))))
+
+        self.insert_many(cursor, 'patients', ['patient_id', 'name', 'age', 'gender', 'contact', 'allergies'], patients)
+        self.insert_many(cursor, 'prescriptions', ['prescription_id', 'patient_id', 'doctor_id', 'date', 'status'],
+                         prescriptions)
+        self.insert_many(cursor, 'prescription_details',
+                         ['prescription_id', 'medicine_id', 'dosage', 'days',
+                          'units_per_slot', 'units_per_day', 'strength_mg', 'daily_mg'], details)
+        self.insert_many(cursor, 'billing', ['prescription_id', 'total_amount', 'payment_status', 'generated_at'], bills)
+
+    def run(self):
+        cursor = self.conn.cursor()
+        if self.args.fast:
+            # Bulk-load settings for this session only
+            cursor.execute("SET SESSION foreign_key_checks = 0")
+            cursor.execute("SET SESSION unique_checks = 0")
+
+        doctors = self.generate_doctors(cursor)
+        if not doctors:
+            raise SystemExit("No doctors available; use --doctors to create some.")
+        medicines, med_cum = self.generate_medicines(cursor)
+        self.conn.commit()
+
+        first_patient = self.next_id(cursor, 'patients', 'patient_id')
+        ids = {'prescription': self.next_id(cursor, 'prescriptions', 'prescription_id')}
+        started = time.perf_counter()
+        chunk = self.args.chunk_size
+        for offset in range(0, self.args.patients, chunk):
+            patient_ids = range(first_patient + offset, first_patient + min(offset + chunk, self.args.patients))
+            self.generate_chunk(cursor, patient_ids, doctors, medicines, med_cum, ids)
+            self.conn.commit()
+            done = min(offset + chunk, self.args.patients)
+            rate = done / max(time.perf_counter() - started, 1e-9)
+            print(f"  {done}/{self.args.patients} patients ({self.counts['prescriptions']} prescriptions, "
+                  f"{rate:.0f} patients/s)")
+
+        if self.args.fast:
+            cursor.execute("SET SESSION foreign_key_checks = 1")
+            cursor.execute("SET SESSION unique_checks = 1")
+        cursor.close()
+        return self.counts
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Fill pharmacy_db with a deterministic synthetic dataset.")
+    parser.add_argument('--patients', type=int, default=10000, help="patients to create")
+    parser.add_argument('--doctors', type=int, default=50, help="doctor accounts to create")
+    parser.add_argument('--medicines', type=int, default=200, help="total medicines in the catalog")
+    parser.add_argument('--rx-per-patient', type=float, default=4.0, help="mean prescriptions per patient")
+    parser.add_argument('--days', type=int, default=730, help="days of history to spread prescriptions over")
+    parser.add_argument('--end-date', default='2026-01-01', help="newest prescription date (YYYY-MM-DD)")
+    parser.add_argument('--seed', type=int, default=42, help="random seed; same seed + empty DB = same data")
+    parser.add_argument('--batch-size', type=int, default=5000, help="rows per multi-row INSERT")
+    parser.add_argument('--chunk-size', type=int, default=10000, help="patients generated per transaction")
+    parser.add_argument('--fast', action='store_true', help="disable FK/unique checks during the load")
+    args = parser.parse_args(argv)
+    args.chunk_size = max(1, args.chunk_size)
+    args.batch_size = max(1, args.batch_size)
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        conn = mysql.connector.connect(database=DB_NAME, **DB_CONFIG)
+    except mysql.connector.Error as err:
+        print(f"Error connecting to MySQL: {err}")
+        return 1
+
+    started = time.perf_counter()
+    try:
+        counts = Generator(conn, args).run()
+    except mysql.connector.Error as err:
+        conn.rollback()
+        print(f"Generation failed: {err}")
+        return 1
+    finally:
+        conn.close()
+
+    print(f"\nGenerated in {time.perf_counter() - started:.1f}s (seed {args.seed}):")
+    for table, n in counts.items():
+        print(f"  {table}: {n}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,151 @@
+import base64
+import io
+import threading
+import time
+
+try:
+    from PIL import Image, ImageOps
+except Exception:
+    Image = None
+
+# Magic numbers -> MIME type, for labelling uploads correctly without Pillow
+_SIGNATURES = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+)
+
+_MIME_BY_FORMAT = {'JPEG': 'image/jpeg', 'WEBP': 'image/webp', 'PNG': 'image/png', 'GIF': 'image/gif'}
+
+
+def sniff_mime(head):
+    for signature, mime in _SIGNATURES:
+        if head.startswith(signature):
+            return mime
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    return 'application/octet-stream'
+
+
+class PreparedImage:
+    """Image bytes ready for a vision request, plus what preprocessing did to them."""
+
+    def __init__(self, data, mime, original_bytes, elapsed_ms, processed, size=None):
+        self.data = data
+        self.mime = mime
+        self.original_bytes = original_bytes
+        self.elapsed_ms = elapsed_ms
+        self.processed = processed
+        self.size = size
+
+    @property
+    def bytes_saved(self):
+        return self.original_bytes - len(self.data)
+
+    def data_url(self):
+        # The SDK serializes the whole request body at once, so the image is
+        # held in memory here anyway; preprocessing is what keeps it small
+        return f"data:{self.mime};base64," + base64.b64encode(self.data).decode('ascii')
+
+
+class ImagePreprocessor:
+    """
+    Shrinks prescription photos before they are sent to a vision model.
+
+    Applies EXIF orientation, converts to grayscale, downscales so the longest
+    side is at most max_side, and re-encodes as JPEG or WebP without metadata,
+    lowering quality (then resolution) until the result fits in max_bytes.
+    Without Pillow the original bytes are sent unchanged, labelled with the
+    MIME type read from their header.
+    """
+
+    def __init__(self, max_side=1600, max_bytes=512 * 1024, fmt='JPEG', quality=85,
+                 min_quality=40, grayscale=True):
+        self.max_side = max_side
+        self.max_bytes = max_bytes
+        self.fmt = fmt.upper()
+        self.quality = quality
+        self.min_quality = min_quality
+        self.grayscale = grayscale
+        self._lock = threading.Lock()
+        self._metrics = {
+            'images': 0,
+            'processed': 0,
+            'passthrough': 0,
+            'errors': 0,
+            'bytes_in': 0,
+            'bytes_out': 0,
+            'time_total_ms': 0.0,
+        }
+
+    @property
+    def available(self):
+        return Image is not None
+
+    def prepare(self, path):
+        started = time.perf_counter()
+        with open(path, 'rb') as f:
+            original = f.read()
+
+        prepared = None
+        if Image is not None:
+            try:
+                prepared = self._process(original)
+            except Exception as err:
+                # Unreadable or unusual image: send it as uploaded
+                print(f"Image Preprocessing Error: {err}")
+                self._count('errors')
+        if prepared is None:
+            data, mime, size, processed = original, sniff_mime(original[:16]), None, False
+        else:
+            data, mime, size = prepared
+            processed = True
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self._metrics['images'] += 1
+            self._metrics['processed' if processed else 'passthrough'] += 1
+            self._metrics['bytes_in'] += len(original)
+            self._metrics['bytes_out'] += len(data)
+            self._metrics['time_total_ms'] += elapsed_ms
+        return PreparedImage(data, mime, len(original), elapsed_ms, processed, size)
+
+    def _process(self, original):
+        with Image.open(io.BytesIO(original)) as img:
+            img = ImageOps.exif_transpose(img)
+            img = img.convert('L' if self.grayscale else 'RGB')
+            img.thumbnail((self.max_side, self.max_side))
+
+            quality = self.quality
+            while True:
+                out = io.BytesIO()
+                # A fresh save without exif/icc arguments carries no metadata
+                img.save(out, format=self.fmt, quality=quality, optimize=True)
+                data = out.getvalue()
+                if len(data) <= self.max_bytes:
+                    break
+                if quality > self.min_quality:
+                    quality = max(self.min_quality, quality - 15)
+                elif min(img.size) > 256:
+                    img = img.resize((int(img.width * 0.75), int(img.height * 0.75)))
+                else:
+                    break
+            size = img.size
+
+        if len(data) >= len(original) and sniff_mime(original[:16]) == _MIME_BY_FORMAT[self.fmt]:
+            # Already small and in the target format; re-encoding bought nothing
+            return None
+        return data, _MIME_BY_FORMAT[self.fmt], size
+
+    def _count(self, name):
+        with self._lock:
+            self._metrics[name] += 1
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._metrics)
+        data['bytes_saved'] = data['bytes_in'] - data['bytes_out']
+        data['time_avg_ms'] = round(data['time_total_ms'] / data['images'], 2) if data['images'] else 0.0
+        data['pillow'] = Image is not None
+        return data
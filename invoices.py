@@ -0,0 +1,147 @@
+import json
+import threading
+from datetime import date, datetime
+from decimal import Decimal
+
+from ai_cache import MemoryTier
+
+# billing + prescription + patient + doctor + every line, in one round trip.
+# s.document is the frozen copy of a paid invoice; when present the rest is ignored.
+INVOICE_QUERY = """
+    SELECT b.bill_id, b.prescription_id, b.total_amount, b.payment_status, b.generated_at,
+           p.date AS prescription_date, p.status AS prescription_status, p.patient_id, p.doctor_id,
+           pat.name AS patient_name, pat.contact AS patient_contact,
+           u.full_name AS doctor_name,
+           pd.detail_id, pd.medicine_id, pd.dosage, pd.days, pd.unit_price,
+           s.document
+    FROM billing b
+    LEFT JOIN invoice_snapshots s ON s.bill_id = b.bill_id
+    JOIN prescriptions p ON b.prescription_id = p.prescription_id
+    LEFT JOIN patients pat ON p.patient_id = pat.patient_id
+    LEFT JOIN users u ON p.doctor_id = u.user_id
+    LEFT JOIN prescription_details pd ON pd.prescription_id = b.prescription_id
+    WHERE b.bill_id = %s
+    ORDER BY pd.detail_id
+"""
+
+
+def assemble_invoice(rows):
+    """
+    The invoice document (bill, prescription, patient, doctor, items) from the
+    INVOICE_QUERY rows of one bill, or None when there are none. Items carry
+    medicine_id, dosage, days and price (the unit price billed at validation,
+    None for older lines); the caller adds medicine_name.
+    """
+    if not rows:
+        return None
+    first = rows[0]
+    return {
+        'bill': {'bill_id': first['bill_id'], 'prescription_id': first['prescription_id'],
+                 'total_amount': first['total_amount'], 'payment_status': first['payment_status'],
+                 'generated_at': first['generated_at']},
+        'prescription': {'prescription_id': first['prescription_id'], 'date': first['prescription_date'],
+                         'status': first['prescription_status'], 'patient_id': first['patient_id'],
+                         'doctor_id': first['doctor_id']},
+        'patient': {'patient_id': first['patient_id'], 'name': first['patient_name'],
+                    'contact': first['patient_contact']},
+        'doctor': {'full_name': first['doctor_name']},
+        'items': [{'detail_id': r['detail_id'], 'medicine_id': r['medicine_id'], 'dosage': r['dosage'],
+                   'days': r['days'], 'price': r['unit_price']} for r in rows if r['detail_id'] is not None],
+    }
+
+
+def _encode(value):
+    # Money stays Decimal on the way back, so reprints show the same digits
+    if isinstance(value, Decimal):
+        return {'__decimal__': str(value)}
+    if isinstance(value, (datetime, date)):
+        return str(value)
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def _decode(obj):
+    if '__decimal__' in obj and len(obj) == 1:
+        return Decimal(obj['__decimal__'])
+    return obj
+
+
+def dumps(document):
+    return json.dumps(document, default=_encode, sort_keys=True)
+
+
+def loads(text):
+    return json.loads(text, object_hook=_decode)
+
+
+class InvoiceSnapshots:
+    """
+    Paid invoices frozen as JSON documents in invoice_snapshots, keyed by bill_id.
+
+    A bill never changes once paid, so freeze() stores the document assembled
+    right after the payment commits and every later view,
+    reprint or audit reads that copy instead of the live tables: renamed
+    medicines, new prices and edited patient details don't alter it. Bills
+    paid before snapshots existed are frozen the first time they are viewed.
+
+    Decoded documents are also kept in a per-process LRU (max_entries); since
+    they never change there is no expiry. A bill can still be deleted, though,
+    possibly through another worker, so cached() confirms the snapshot row is
+    there (a primary-key probe) before serving from memory.
+    """
+
+    def __init__(self, max_entries=1024):
+        self._memory = MemoryTier(max_entries=max_entries, ttl=float('inf'))
+        self._lock = threading.Lock()
+        self._metrics = {'memory_hits': 0, 'snapshot_hits': 0, 'assembled': 0, 'frozen': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._metrics[name] += 1
+
+    def cached(self, cursor, bill_id):
+        """The frozen document for bill_id from memory, or None."""
+        document = self._memory.get(bill_id)
+        if document is None:
+            return None
+        cursor.execute("SELECT 1 FROM invoice_snapshots WHERE bill_id = %s", (bill_id,))
+        if cursor.fetchone() is None:
+            # Deleted with its bill since it was cached
+            self.forget(bill_id)
+            return None
+        self._count('memory_hits')
+        return document
+
+    def forget(self, bill_id):
+        self._memory.delete(bill_id)
+
+    def load(self, cursor, bill_id):
+        """
+        (document, frozen) for bill_id from one INVOICE_QUERY round trip, or
+        (None, False) if the bill doesn't exist. An unfrozen document still
+        needs medicine names and prices.
+        """
+        cursor.execute(INVOICE_QUERY, (bill_id,))
+        rows = cursor.fetchall()
+        if rows and rows[0]['document']:
+            self._count('snapshot_hits')
+            document = loads(rows[0]['document'])
+            self._memory.put(bill_id, document)
+            return document, True
+        if rows:
+            self._count('assembled')
+        return assemble_invoice(rows), False
+
+    def freeze(self, cursor, document):
+        """Store a paid invoice's document; the first one stored for a bill wins."""
+        bill_id = document['bill']['bill_id']
+        cursor.execute("INSERT IGNORE INTO invoice_snapshots (bill_id, document) VALUES (%s, %s)",
+                       (bill_id, dumps(document)))
+        if cursor.rowcount:
+            self._count('frozen')
+            self._memory.put(bill_id, loads(dumps(document)))
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._metrics)
+        data['memory_entries'] = len(self._memory)
+        return data
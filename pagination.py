@@ -0,0 +1,99 @@
+import base64
+import binascii
+
+
+def encode_cursor(direction, key):
+    """Opaque page token: 'after' or 'before' a key value, base64url without padding."""
+    raw = f"{direction}:{key}".encode('ascii')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """(direction, key) from a token, or (None, None) for a missing or malformed one (first page)."""
+    if not token:
+        return None, None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode('ascii')
+        direction, key = raw.split(':', 1)
+        key = int(key)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        return None, None
+    if direction not in ('after', 'before'):
+        return None, None
+    return direction, key
+
+
+class KeysetPage:
+    def __init__(self, items, next_cursor=None, prev_cursor=None, page_size=0):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.page_size = page_size
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+class KeysetPaginator:
+    """
+    Seek pagination over an integer column, largest (newest) first.
+
+    Instead of OFFSET, each page starts from the last key shown, so with an
+    index on the column every page costs the same however deep it is:
+
+        where, params, order = pages.seek(direction, key)
+        SELECT ... WHERE <where> ORDER BY <order> LIMIT page_size + 1
+
+    The extra row only tells whether another page exists. page() turns the
+    fetched rows into a KeysetPage with tokens for the next (older) and
+    previous (newer) pages.
+    """
+
+    def __init__(self, column, default_size=25, max_size=100):
+        self.column = column
+        self.default_size = default_size
+        self.max_size = max_size
+
+    def page_size(self, requested=None):
+        try:
+            size = int(requested) if requested else self.default_size
+        except (TypeError, ValueError):
+            size = self.default_size
+        return max(1, min(size, self.max_size))
+
+    def seek(self, direction, key):
+        if direction == 'after':
+            return f"{self.column} < %s", (key,), f"{self.column} DESC"
+        if direction == 'before':
+            return f"{self.column} > %s", (key,), f"{self.column} ASC"
+        return "1 = 1", (), f"{self.column} DESC"
+
+    def page(self, rows, direction, size):
+        """rows: up to size + 1 rows in seek() order."""
+        has_more = len(rows) > size
+        rows = list(rows[:size])
+        if direction == 'before':
+            rows.reverse()
+        if not rows:
+            return KeysetPage([], page_size=size)
+        first, last = rows[0][self.column], rows[-1][self.column]
+        if direction == 'before':
+            next_cursor = encode_cursor('after', last)
+            prev_cursor = encode_cursor('before', first) if has_more else None
+        else:
+            next_cursor = encode_cursor('after', last) if has_more else None
+            prev_cursor = encode_cursor('before', first) if direction else None
+        return KeysetPage(rows, next_cursor, prev_cursor, size)
+
+    def page_from_list(self, items, direction, key, size):
+        """Same paging over an in-memory list (TEMP_DATA fallback)."""
+        if direction == 'after':
+            matching = sorted((i for i in items if i[self.column] < key), key=lambda i: -i[self.column])
+        elif direction == 'before':
+            matching = sorted((i for i in items if i[self.column] > key), key=lambda i: i[self.column])
+        else:
+            matching = sorted(items, key=lambda i: -i[self.column])
+        return self.page(matching[:size + 1], direction, size)
@@ -0,0 +1,265 @@
+import os
+import re
+import threading
+import time
+
+import mysql.connector
+
+# Columns returned to the type-ahead (and shown in the option labels)
+RESULT_COLUMNS = "patient_id, name, age, gender, contact"
+
+_WORD = re.compile(r"[0-9a-z]+")
+
+# InnoDB FULLTEXT ignores words shorter than innodb_ft_min_token_size (3 by default)
+FULLTEXT_MIN_WORD = 3
+
+
+def search_tokens(text):
+    """Lowercase alphanumeric words of a name or contact, as the trie and FULLTEXT see them."""
+    return _WORD.findall((text or '').lower())
+
+
+def _like_prefix(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+class PrefixTrie:
+    """
+    Word-prefix index: every prefix of every token points at the most recent
+    (highest) ids containing it, at most `bucket` per node, so a lookup costs
+    O(len(prefix)) however many patients share it.
+    """
+
+    def __init__(self, bucket=32):
+        self.bucket = bucket
+        self._root = {}
+        self._removed = set()
+
+    def add(self, item_id, tokens):
+        for token in set(tokens):
+            node = self._root
+            for ch in token:
+                node = node.setdefault(ch, {})
+                ids = node.setdefault('', [])
+                if not ids or item_id > ids[0]:
+                    # Loads run in id order, so this is the common case
+                    ids.insert(0, item_id)
+                elif item_id not in ids:
+                    ids.append(item_id)
+                    ids.sort(reverse=True)
+                del ids[self.bucket:]
+        self._removed.discard(item_id)
+
+    def remove(self, item_id):
+        # Lazy: buckets keep the id, lookups skip it
+        self._removed.add(item_id)
+
+    def lookup(self, prefix):
+        node = self._root
+        for ch in prefix:
+            node = node.get(ch)
+            if node is None:
+                return []
+        return [i for i in node.get('', ()) if i not in self._removed]
+
+
+class PatientSearch:
+    """
+    Type-ahead patient search: top `limit` matches for a partial name, contact or ID.
+
+    Database path (always available):
+    - digits: exact patient_id, then contact prefix (idx_patients_contact)
+    - text: name prefix on idx_patients_name, topped up from the
+      ft_patients_name_contact FULLTEXT index (any word, e.g. a surname)
+      with a prefix search on every word of 3+ characters
+
+    With use_trie, each process also keeps a PrefixTrie over the words of
+    every name and contact. It is built in the background in patient_id
+    batches, then refreshed incrementally (only patients above the highest
+    id seen) at most every refresh_interval seconds. Trie hits are confirmed
+    with one primary-key lookup, so deleted or edited patients never show
+    stale. Lookups fall back to the database until the trie is ready, when it
+    has no match (another worker may have added the patient), and for IDs.
+
+    connect is a context manager yielding a connection or None (app.get_db_connection).
+    """
+
+    def __init__(self, connect, use_trie=False, refresh_interval=30.0, batch_size=5000, max_limit=25):
+        self.connect = connect
+        self.use_trie = use_trie
+        self.refresh_interval = refresh_interval
+        self.batch_size = batch_size
+        self.max_limit = max_limit
+        self._trie = PrefixTrie()
+        self._max_id = 0
+        self._indexed = 0
+        self._ready = False
+        self._refreshed_at = 0.0
+        self._pid = None
+        self._loader = None
+        self._lock = threading.Lock()
+        self._metrics = {'searches': 0, 'trie_answers': 0, 'db_answers': 0, 'errors': 0,
+                         'time_total_ms': 0.0, 'trie_loads': 0}
+
+    def search(self, conn, term, limit=10):
+        """Up to limit matching rows (dicts of RESULT_COLUMNS) and the source that answered."""
+        started = time.perf_counter()
+        term = ' '.join((term or '').split())[:100]
+        limit = max(1, min(int(limit), self.max_limit))
+        rows, source = [], 'none'
+        if term and conn:
+            try:
+                if self.use_trie and not term.isdigit():
+                    self._maybe_refresh()
+                    rows = self._search_trie(conn, term, limit)
+                    source = 'trie'
+                if not rows:
+                    rows = self._search_db(conn, term, limit)
+                    source = 'index'
+            except mysql.connector.Error as err:
+                print(f"Patient Search Error: {err}")
+                self._count('errors')
+                rows, source = [], 'error'
+        with self._lock:
+            self._metrics['searches'] += 1
+            if source == 'trie':
+                self._metrics['trie_answers'] += 1
+            elif source == 'index':
+                self._metrics['db_answers'] += 1
+            self._metrics['time_total_ms'] += (time.perf_counter() - started) * 1000
+        return rows, source
+
+    def _search_db(self, conn, term, limit):
+        cursor = conn.cursor(dictionary=True, buffered=True)
+        try:
+            rows = []
+            if term.isdigit():
+                cursor.execute(f"SELECT {RESULT_COLUMNS} FROM patients WHERE patient_id = %s", (int(term),))
+                rows = cursor.fetchall()
+                cursor.execute(f"""
+                    SELECT {RESULT_COLUMNS} FROM patients
+                    WHERE contact LIKE %s
+                    ORDER BY contact
+                    LIMIT %s
+                """, (_like_prefix(term), limit))
+                seen = {r['patient_id'] for r in rows}
+                rows += [r for r in cursor.fetchall() if r['patient_id'] not in seen]
+                return rows[:limit]
+
+            cursor.execute(f"""
+                SELECT {RESULT_COLUMNS} FROM patients
+                WHERE name LIKE %s
+                ORDER BY name
+                LIMIT %s
+            """, (_like_prefix(term), limit))
+            rows = cursor.fetchall()
+            words = [w for w in search_tokens(term) if len(w) >= FULLTEXT_MIN_WORD]
+            if len(rows) < limit and words:
+                seen = {r['patient_id'] for r in rows}
+                cursor.execute(f"""
+                    SELECT {RESULT_COLUMNS} FROM patients
+                    WHERE MATCH(name, contact) AGAINST (%s IN BOOLEAN MODE)
+                    LIMIT %s
+                """, (' '.join(f"+{w}*" for w in words), limit + len(seen)))
+                rows += [r for r in cursor.fetchall() if r['patient_id'] not in seen]
+            return rows[:limit]
+        finally:
+            cursor.close()
+
+    def _search_trie(self, conn, term, limit):
+        """Rows for the trie candidates; empty when the trie isn't ready or has nothing (ask the database)."""
+        words = search_tokens(term)
+        if not self._ready or not words:
+            return []
+        with self._lock:
+            candidates = self._trie.lookup(words[0])
+            for word in words[1:]:
+                ids = set(self._trie.lookup(word))
+                candidates = [i for i in candidates if i in ids]
+        if not candidates:
+            return []
+        candidates = candidates[:limit]
+        cursor = conn.cursor(dictionary=True, buffered=True)
+        try:
+            cursor.execute(f"SELECT {RESULT_COLUMNS} FROM patients WHERE patient_id IN "
+                           f"({','.join(['%s'] * len(candidates))})", tuple(candidates))
+            found = {r['patient_id']: r for r in cursor.fetchall()}
+        finally:
+            cursor.close()
+        return [found[i] for i in candidates if i in found]
+
+    def add(self, patient_id, name, contact):
+        """Index a patient added by this process straight away."""
+        if self.use_trie:
+            with self._lock:
+                self._trie.add(patient_id, search_tokens(name) + search_tokens(contact))
+
+    def remove(self, patient_id):
+        if self.use_trie:
+            with self._lock:
+                self._trie.remove(patient_id)
+
+    def _maybe_refresh(self):
+        now = time.monotonic()
+        if self._pid == os.getpid() and now - self._refreshed_at < self.refresh_interval:
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                # First use in this process (or after a fork): start from an empty trie
+                self._pid = os.getpid()
+                self._trie = PrefixTrie()
+                self._max_id = 0
+                self._indexed = 0
+                self._ready = False
+                self._loader = None
+            if self._loader is not None and self._loader.is_alive():
+                return
+            self._refreshed_at = now
+            self._loader = threading.Thread(target=self._load_new, name='patient-search-load', daemon=True)
+            self._loader.start()
+
+    def _load_new(self):
+        # Patients above the highest id indexed so far, one keyset batch per checkout
+        try:
+            while True:
+                with self.connect() as conn:
+                    if not conn:
+                        return
+                    cursor = conn.cursor(buffered=True)
+                    cursor.execute("""
+                        SELECT patient_id, name, contact FROM patients
+                        WHERE patient_id > %s
+                        ORDER BY patient_id
+                        LIMIT %s
+                    """, (self._max_id, self.batch_size))
+                    batch = cursor.fetchall()
+                    cursor.close()
+                with self._lock:
+                    for patient_id, name, contact in batch:
+                        self._trie.add(patient_id, search_tokens(name) + search_tokens(contact))
+                    self._indexed += len(batch)
+                    if batch:
+                        self._max_id = max(self._max_id, batch[-1][0])
+                if len(batch) < self.batch_size:
+                    break
+        except Exception as err:
+            print(f"Patient Search Index Error: {err}")
+            self._count('errors')
+            return
+        with self._lock:
+            if not self._ready:
+                print(f"Patient search trie ready: {self._indexed} patients")
+            self._ready = True
+            self._metrics['trie_loads'] += 1
+
+    def _count(self, name):
+        with self._lock:
+            self._metrics[name] += 1
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._metrics)
+            data.update({'trie': self.use_trie, 'trie_ready': self._ready, 'trie_patients': self._indexed,
+                         'trie_max_id': self._max_id})
+        data['time_avg_ms'] = round(data['time_total_ms'] / data['searches'], 3) if data['searches'] else 0.0
+        return data
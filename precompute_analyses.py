@@ -0,0 +1,254 @@
+"""
+Precompute AI analyses for every stored prescription into the analysis cache.
+
+Reads prescriptions in prescription_id order, one page at a time through an
+unbuffered (server-side) cursor, and skips medicine lists that are already
+cached or already queued in this run (the cache key depends only on the
+medicines, so repeat prescriptions cost nothing). Small prescriptions are
+packed several to a prompt. Prompts run on a bounded thread pool, and each
+answer is written to the same cache key that analyze_prescription looks up,
+so the UI serves it without calling the model.
+
+Progress is checkpointed after every page; rerunning resumes after the last
+finished page. Analyses that failed are not cached: run again with --restart
+to retry them (cached ones are skipped quickly).
+
+    python precompute_analyses.py --workers 8 --pack 5
+    python precompute_analyses.py --restart --limit 1000
+"""
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from itertools import groupby
+
+import app as pharmacy
+from ai_budget import LatencyBudget
+from ai_cache import analysis_key, normalize_medicines
+
+
+def load_checkpoint(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_checkpoint(path, data):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def fetch_page(conn, after_id, page_size):
+    """
+    The next page_size prescriptions after after_id, as [(prescription_id, [medicine names])].
+    Rows are streamed from an unbuffered cursor and grouped as they arrive; the
+    page is read to the end before any AI call starts, so the server never
+    waits on a slow model with a half-read result set.
+    """
+    cursor = conn.cursor(buffered=True)
+    cursor.execute("""
+        SELECT prescription_id FROM prescriptions
+        WHERE prescription_id > %s
+        ORDER BY prescription_id
+        LIMIT 1 OFFSET %s
+    """, (after_id, page_size - 1))
+    row = cursor.fetchone()
+    cursor.close()
+    upper_id = row[0] if row else None
+
+    cursor = conn.cursor(buffered=False)
+    cursor.execute("""
+        SELECT pd.prescription_id, m.name
+        FROM prescription_details pd
+        JOIN medicines m ON pd.medicine_id = m.medicine_id
+        WHERE pd.prescription_id > %s AND (%s IS NULL OR pd.prescription_id <= %s)
+        ORDER BY pd.prescription_id, pd.detail_id
+    """, (after_id, upper_id, upper_id))
+    page = [(p_id, [name for _, name in rows]) for p_id, rows in groupby(cursor, key=lambda r: r[0])]
+    cursor.close()
+    return page, upper_id
+
+
+class Precomputer:
+    """
+    Runs analysis prompts for distinct medicine lists on a bounded pool.
+
+    Lists with at most pack_max_medicines medicines are packed `pack` to a
+    prompt; a packed answer that doesn't split back into exactly one section
+    per prescription is discarded and its prescriptions are asked one by one.
+    """
+
+    def __init__(self, budget, workers=4, pack=5, pack_max_medicines=6):
+        self.budget = budget
+        self.pack = pack
+        self.pack_max_medicines = pack_max_medicines
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='precompute')
+        self._queued = set()
+        self._lock = threading.Lock()
+        self._metrics = {'prescriptions': 0, 'cached_already': 0, 'analysed': 0, 'failed': 0,
+                         'prompts': 0, 'packed_prompts': 0, 'unpacked_retries': 0}
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._metrics[name] += n
+
+    def _complete(self, kwargs):
+        response = pharmacy.routed_completion(kwargs, budget=self.budget)
+        self._count('prompts')
+        return response.choices[0].message.content
+
+    def _analyse_one(self, key, med_names):
+        try:
+            text = self._complete(pharmacy.analysis_request(" ".join(med_names)))
+        except Exception as err:
+            print(f"Analysis failed for {', '.join(med_names)}: {err}")
+            self._count('failed')
+            return
+        pharmacy.AI_CACHE.put(key, text.replace("```html", "").replace("```", ""))
+        self._count('analysed')
+
+    def _analyse_packed(self, items):
+        try:
+            text = self._complete(pharmacy.packed_analysis_request([" ".join(names) for _, names in items]))
+            parts = pharmacy.split_packed_analysis(text, len(items))
+        except Exception as err:
+            print(f"Packed prompt failed ({err}); asking one by one")
+            parts = None
+        if parts is None:
+            self._count('unpacked_retries')
+            for key, names in items:
+                self._analyse_one(key, names)
+            return
+        self._count('packed_prompts')
+        for (key, _), part in zip(items, parts):
+            pharmacy.AI_CACHE.put(key, part)
+        self._count('analysed', len(items))
+
+    def submit_page(self, page):
+        """Queue the uncached medicine lists of one page; returns its futures."""
+        singles, packable = [], []
+        for _, med_names in page:
+            self._count('prescriptions')
+            if not med_names:
+                continue
+            key = analysis_key('text', med_names, pharmacy.AI_PROMPT_VERSION, pharmacy.AI_MODEL)
+            if key in self._queued or pharmacy.AI_CACHE.get(key) is not None:
+                self._count('cached_already')
+                continue
+            self._queued.add(key)
+            if self.pack > 1 and len(normalize_medicines(med_names)) <= self.pack_max_medicines:
+                packable.append((key, med_names))
+            else:
+                singles.append((key, med_names))
+
+        futures = [self.pool.submit(self._analyse_one, key, names) for key, names in singles]
+        for i in range(0, len(packable), self.pack):
+            chunk = packable[i:i + self.pack]
+            if len(chunk) == 1:
+                futures.append(self.pool.submit(self._analyse_one, *chunk[0]))
+            else:
+                futures.append(self.pool.submit(self._analyse_packed, chunk))
+        return futures
+
+    def page_done(self, futures):
+        wait(futures)
+        # Keys from this page are in the cache (or failed) now; stop tracking them
+        with self._lock:
+            self._queued.clear()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._metrics)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4, help='prompts in flight at once')
+    parser.add_argument('--pack', type=int, default=5, help='prescriptions per prompt (1 disables packing)')
+    parser.add_argument('--pack-max-medicines', type=int, default=6,
+                        help='only prescriptions with at most this many medicines are packed')
+    parser.add_argument('--page-size', type=int, default=500, help='prescriptions read per page')
+    parser.add_argument('--limit', type=int, default=0, help='stop after this many prescriptions (0 = all)')
+    parser.add_argument('--budget', type=float, default=120.0, help='seconds allowed per prompt, retries included')
+    parser.add_argument('--retries', type=int, default=4)
+    parser.add_argument('--checkpoint', default=os.path.join('cache', 'precompute_checkpoint.json'))
+    parser.add_argument('--restart', action='store_true', help='ignore the checkpoint and scan from the start')
+    args = parser.parse_args()
+
+    if not pharmacy.AI_PROVIDERS.serving():
+        parser.error("No AI provider configured: set OPENAI_API_KEY, GROQ_API_KEY or AI_PROVIDERS_FILE")
+
+    checkpoint = {} if args.restart else load_checkpoint(args.checkpoint)
+    if checkpoint and (checkpoint.get('model'), checkpoint.get('prompt_version')) != \
+            (pharmacy.AI_MODEL, pharmacy.AI_PROMPT_VERSION):
+        print("Checkpoint was written for another model or prompt version; starting from the beginning.")
+        checkpoint = {}
+    after_id = checkpoint.get('last_prescription_id', 0)
+    if after_id:
+        print(f"Resuming after prescription {after_id}")
+
+    budget = LatencyBudget(budget=args.budget, connect_timeout=10.0, read_timeout=args.budget,
+                           retries=args.retries, backoff=1.0, retry_on=pharmacy.AI_BUDGET.retry_on)
+    worker = Precomputer(budget, workers=args.workers, pack=args.pack, pack_max_medicines=args.pack_max_medicines)
+    started = time.time()
+    seen = 0
+    try:
+        with pharmacy.get_db_connection() as conn:
+            if not conn:
+                raise SystemExit("Database unavailable")
+            page, upper_id = fetch_page(conn, after_id, args.page_size)
+            last_id = after_id
+            while True:
+                truncated = args.limit and len(page) > args.limit - seen
+                if truncated:
+                    page = page[:args.limit - seen]
+                futures = worker.submit_page(page)
+                seen += len(page)
+                # A window ends at upper_id even if none of its prescriptions had
+                # details (an empty page), so such windows are skipped rather than
+                # taken for the end of the table; the last one ends at its last row
+                if upper_id is not None and not truncated:
+                    last_id = upper_id
+                elif page:
+                    last_id = page[-1][0]
+                more = upper_id is not None and not (args.limit and seen >= args.limit)
+                # Read the next page while this one's prompts are running
+                if more:
+                    next_page, upper_id = fetch_page(conn, last_id, args.page_size)
+                    conn.commit()  # end the read snapshot so later pages see new prescriptions
+                worker.page_done(futures)
+                save_checkpoint(args.checkpoint, {
+                    'last_prescription_id': last_id,
+                    'model': pharmacy.AI_MODEL,
+                    'prompt_version': pharmacy.AI_PROMPT_VERSION,
+                    'updated_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+                })
+                stats = worker.stats()
+                print(f"Up to prescription {last_id}: {stats['analysed']} analysed, "
+                      f"{stats['cached_already']} already cached, {stats['failed']} failed")
+                if not more:
+                    break
+                page = next_page
+    finally:
+        worker.pool.shutdown(wait=True)
+
+    elapsed = time.time() - started
+    stats = worker.stats()
+    print(f"Done in {elapsed:.1f}s: {stats}")
+    print(f"Latency: {budget.stats()}")
+    print(f"Providers: {pharmacy.AI_PROVIDERS.stats()['providers']}")
+    if stats['failed']:
+        print("Some analyses failed and were not cached; rerun with --restart to retry them.")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,44 +1,620 @@
+import os
+import re
+import sys
+import time
 import mysql.connector
 
-def setup_database():
-    db_config = {
-        'host': 'localhost',
-        'user': 'root',
-        'password': '123456' 
-    }
+from validation import compile_dosage, DosageError, DEFAULT_MAX_DOSAGE, DEFAULT_INTERACTIONS
+
+DB_CONFIG = {
+    'host': 'localhost',
+    'user': 'root',
+    'password': '123456'
+}
+DB_NAME = 'pharmacy_db'
+
+
+def setup_database(verbose=False):
+    db_config = dict(DB_CONFIG)
     
     try:
         conn = mysql.connector.connect(**db_config)
-        cursor = conn.cursor(buffered=True)
         
         # Use absolute path relative to this script
-        import os
         base_dir = os.path.dirname(os.path.abspath(__file__))
         sql_file_path = os.path.join(base_dir, 'database', 'pharmacy.sql')
         
-        with open(sql_file_path, 'r') as f:
-            sql_script = f.read()
-        
-        # Split by semicolon to execute multiple statements
-        statements = sql_script.split(';')
-        
-        for statement in statements:
-            if statement.strip():
-                try:
-                    cursor.execute(statement)
-                    print(f"Executed: {statement[:50]}...")
-                except mysql.connector.Error as err:
-                    print(f"Skipping/Error: {err}")
-        
-        conn.commit()
+        load_sql_script(conn, sql_file_path, verbose=verbose)
         print("\nDatabase setup completed successfully!")
         
+        # Bring the fresh schema up to the latest migration
+        conn.database = DB_NAME
+        migrate(conn)
+        
     except mysql.connector.Error as err:
-        print(f"Error connecting to MySQL: {err}")
+        print(f"Error setting up database: {err}")
     finally:
         if 'conn' in locals() and conn.is_connected():
-            cursor.close()
             conn.close()
 
+
+# --- SQL Script Loader ---
+# Streams a .sql file line by line and splits it into statements while tracking
+# quotes, comments and DELIMITER changes, so semicolons inside string literals
+# or stored-procedure bodies don't break statements apart. Memory use is bounded
+# by the longest single statement, not the file size.
+
+_QUOTE_END = {
+    "'": re.compile(r"['\\]"),
+    '"': re.compile(r'["\\]'),
+    '`': re.compile(r'`'),
+}
+
+
+def _statement_scanner(delimiter):
+    return re.compile(r"""['"`#]|--(?=\s|$)|/\*|""" + re.escape(delimiter))
+
+
+def iter_sql_statements(lines):
+    """
+    Yield (statement, standalone) tuples from an iterable of SQL text lines.
+    standalone is True for statements written under a custom DELIMITER
+    (procedure/trigger bodies); those must not be batched with others.
+    """
+    delimiter = ';'
+    scanner = _statement_scanner(delimiter)
+    buf = []
+    quote = None            # open quote character, if inside a literal
+    in_comment = False      # inside /* ... */
+    keep_comment = False    # /*! ... */ is executable and must be sent
+    
+    for line in lines:
+        # DELIMITER is a client directive, only valid between statements
+        if (line.lstrip()[:10].upper() == 'DELIMITER '
+                and not quote and not in_comment and not ''.join(buf).strip()):
+            delimiter = line.split(None, 1)[1].strip()
+            scanner = _statement_scanner(delimiter)
+            buf = []
+            continue
+        
+        pos = 0
+        end = len(line)
+        while pos < end:
+            if in_comment:
+                idx = line.find('*/', pos)
+                stop = end if idx == -1 else idx + 2
+                if keep_comment:
+                    buf.append(line[pos:stop])
+                if idx != -1:
+                    in_comment = False
+                pos = stop
+                continue
+            
+            if quote:
+                m = _QUOTE_END[quote].search(line, pos)
+                if not m:
+                    buf.append(line[pos:])
+                    break
+                idx = m.start()
+                if line[idx] == '\\':
+                    # Backslash escape: take the next character verbatim
+                    buf.append(line[pos:idx + 2])
+                    pos = idx + 2
+                elif line.startswith(quote * 2, idx):
+                    # Doubled quote ('it''s') stays inside the literal
+                    buf.append(line[pos:idx + 2])
+                    pos = idx + 2
+                else:
+                    buf.append(line[pos:idx + 1])
+                    pos = idx + 1
+                    quote = None
+                continue
+            
+            m = scanner.search(line, pos)
+            if not m:
+                buf.append(line[pos:])
+                break
+            token = m.group()
+            idx = m.start()
+            buf.append(line[pos:idx])
+            if token in _QUOTE_END:
+                buf.append(token)
+                quote = token
+                pos = idx + 1
+            elif token == '#' or token == '--':
+                # Line comment: drop the rest, keep the newline
+                buf.append('\n')
+                break
+            elif token == '/*':
+                in_comment = True
+                keep_comment = line.startswith('/*!', idx)
+                if keep_comment:
+                    buf.append('/*')
+                pos = idx + 2
+            else:
+                statement = ''.join(buf).strip()
+                if statement:
+                    yield statement, delimiter != ';'
+                buf = []
+                pos = idx + len(token)
+    
+    statement = ''.join(buf).strip()
+    if statement:
+        yield statement, delimiter != ';'
+
+
+def _drain_results(cursor):
+    # A multi-statement execute returns one result per statement; all of them
+    # must be consumed before the connection can be used again.
+    while True:
+        if cursor.with_rows:
+            cursor.fetchall()
+        if not cursor.nextset():
+            break
+
+
+def load_sql_script(conn, path, batch_bytes=1024 * 1024, batch_statements=500, verbose=False):
+    """
+    Execute a SQL script in multi-statement batches with a single commit.
+    Batches are capped by size (keep below max_allowed_packet) and statement count.
+    """
+    cursor = conn.cursor()
+    batch = []
+    batch_size = 0
+    stats = {'statements': 0, 'batches': 0}
+    started = time.perf_counter()
+    
+    def flush():
+        nonlocal batch, batch_size
+        if not batch:
+            return
+        cursor.execute(';\n'.join(batch))
+        _drain_results(cursor)
+        stats['batches'] += 1
+        if verbose:
+            print(f"Executed batch {stats['batches']}: {len(batch)} statements ({batch_size} bytes)")
+        batch = []
+        batch_size = 0
+    
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for statement, standalone in iter_sql_statements(f):
+                stats['statements'] += 1
+                if standalone:
+                    flush()
+                    cursor.execute(statement)
+                    _drain_results(cursor)
+                    stats['batches'] += 1
+                    continue
+                batch.append(statement)
+                batch_size += len(statement)
+                if batch_size >= batch_bytes or len(batch) >= batch_statements:
+                    flush()
+        flush()
+        conn.commit()
+    except mysql.connector.Error:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    
+    elapsed = time.perf_counter() - started
+    print(f"Loaded {os.path.basename(path)}: {stats['statements']} statements in {stats['batches']} batches ({elapsed:.2f}s)")
+    return stats
+
+
+# --- Schema Migrations ---
+# Each migration is (version, name, function). Versions are applied in order and
+# recorded in schema_migrations. MySQL commits DDL implicitly, so every helper
+# below checks information_schema first and a half-applied migration can be re-run.
+
+def _index_exists(cursor, table, index_name):
+    cursor.execute("""
+        SELECT 1 FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+        LIMIT 1
+    """, (table, index_name))
+    return cursor.fetchone() is not None
+
+
+def _add_index(cursor, table, index_name, columns):
+    if _index_exists(cursor, table, index_name):
+        print(f"  index {table}.{index_name} already exists")
+        return
+    cursor.execute(f"CREATE INDEX {index_name} ON {table} ({columns})")
+    print(f"  created index {table}.{index_name} ({columns})")
+
+
+def _column_exists(cursor, table, column):
+    cursor.execute("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s
+        LIMIT 1
+    """, (table, column))
+    return cursor.fetchone() is not None
+
+
+def _add_column(cursor, table, column, definition):
+    if _column_exists(cursor, table, column):
+        print(f"  column {table}.{column} already exists")
+        return
+    cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    print(f"  added column {table}.{column}")
+
+
+def m001_prescription_indexes(cursor):
+    # reports(): WHERE status = 'pending' / GROUP BY status
+    _add_index(cursor, 'prescriptions', 'idx_prescriptions_status_date', 'status, date')
+    # ai_analysis_dashboard(): ORDER BY p.date DESC LIMIT 20
+    _add_index(cursor, 'prescriptions', 'idx_prescriptions_date', 'date')
+
+
+def m002_billing_indexes(cursor):
+    # reports(): SUM(total_amount) WHERE payment_status = 'Paid' (covering)
+    _add_index(cursor, 'billing', 'idx_billing_status_amount', 'payment_status, total_amount')
+    # pharmacist_dashboard() / admin_dashboard(): ORDER BY b.generated_at DESC LIMIT 5
+    _add_index(cursor, 'billing', 'idx_billing_generated_at', 'generated_at')
+
+
+def m003_medicine_usage_index(cursor):
+    # reports(): top medicines SUM(pd.days) grouped per medicine (covering).
+    # Low stock is read from the catalog and login() uses the UNIQUE username
+    _add_index(cursor, 'prescription_details', 'idx_details_medicine_days', 'medicine_id, days')
+
+
+def m004_structured_dosage(cursor, batch_size=5000):
+    # Dosage parsed once at prescription creation (see validation.compile_dosage)
+    _add_column(cursor, 'prescription_details', 'units_per_slot', 'VARCHAR(32) NULL')
+    _add_column(cursor, 'prescription_details', 'units_per_day', 'DECIMAL(8,3) NULL')
+    _add_column(cursor, 'prescription_details', 'strength_mg', 'DECIMAL(12,3) NULL')
+    _add_column(cursor, 'prescription_details', 'daily_mg', 'DECIMAL(14,3) NULL')
+    
+    # Backfill existing rows in detail_id order, one batch at a time
+    last_id = 0
+    backfilled = unparsed = 0
+    while True:
+        cursor.execute("""
+            SELECT pd.detail_id, pd.dosage, m.name
+            FROM prescription_details pd
+            JOIN medicines m ON pd.medicine_id = m.medicine_id
+            WHERE pd.detail_id > %s AND pd.units_per_day IS NULL
+            ORDER BY pd.detail_id
+            LIMIT %s
+        """, (last_id, batch_size))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        updates = []
+        for detail_id, dosage, medicine_name in rows:
+            try:
+                d = compile_dosage(dosage, medicine_name)
+            except DosageError:
+                unparsed += 1
+                continue
+            updates.append((d['units_per_slot'], d['units_per_day'], d['strength_mg'], d['daily_mg'], detail_id))
+        if updates:
+            cursor.executemany("""
+                UPDATE prescription_details
+                SET units_per_slot = %s, units_per_day = %s, strength_mg = %s, daily_mg = %s
+                WHERE detail_id = %s
+            """, updates)
+            cursor.execute("COMMIT")
+        backfilled += len(updates)
+        last_id = rows[-1][0]
+    print(f"  backfilled {backfilled} prescription lines ({unparsed} with unreadable dosage left NULL)")
+
+
+def _trigger_exists(cursor, name):
+    cursor.execute("""
+        SELECT 1 FROM information_schema.triggers
+        WHERE trigger_schema = DATABASE() AND trigger_name = %s
+    """, (name,))
+    return cursor.fetchone() is not None
+
+
+def m005_rule_tables(cursor):
+    # Validation rules, versioned: any change to either table bumps
+    # rule_set_version, which app workers poll to reload (see validation.RuleStore)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS rule_set_version (
+            id TINYINT PRIMARY KEY,
+            version INT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS dosage_rules (
+            rule_id INT AUTO_INCREMENT PRIMARY KEY,
+            ingredient VARCHAR(100) NOT NULL UNIQUE,
+            max_daily_mg DECIMAL(12,3) NOT NULL
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS interaction_rules (
+            rule_id INT AUTO_INCREMENT PRIMARY KEY,
+            ingredient_a VARCHAR(100) NOT NULL,
+            ingredient_b VARCHAR(100) NOT NULL,
+            message VARCHAR(255) NOT NULL,
+            UNIQUE KEY uq_interaction_pair (ingredient_a, ingredient_b)
+        )
+    """)
+    cursor.execute("INSERT IGNORE INTO rule_set_version (id, version) VALUES (1, 1)")
+    
+    # Seed with the rules previously hardcoded in app.py
+    cursor.executemany(
+        "INSERT IGNORE INTO dosage_rules (ingredient, max_daily_mg) VALUES (%s, %s)",
+        list(DEFAULT_MAX_DOSAGE.items()))
+    cursor.executemany(
+        "INSERT IGNORE INTO interaction_rules (ingredient_a, ingredient_b, message) VALUES (%s, %s, %s)",
+        [tuple(sorted(pair)) + (message,) for pair, message in DEFAULT_INTERACTIONS.items()])
+    
+    for table in ('dosage_rules', 'interaction_rules'):
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            name = f"trg_{table}_{event.lower()}_version"
+            if not _trigger_exists(cursor, name):
+                cursor.execute(f"""
+                    CREATE TRIGGER {name} AFTER {event} ON {table}
+                    FOR EACH ROW UPDATE rule_set_version SET version = version + 1 WHERE id = 1
+                """)
+
+
+def m006_ai_jobs(cursor):
+    # Background AI analysis jobs (see ai_jobs.JobQueue); polled by job_id
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ai_jobs (
+            job_id CHAR(32) PRIMARY KEY,
+            user_id INT NULL,
+            source_type VARCHAR(20) NULL,
+            source_ref VARCHAR(255) NULL,
+            status VARCHAR(10) NOT NULL DEFAULT 'queued',
+            result MEDIUMTEXT NULL,
+            error TEXT NULL,
+            created_at DATETIME(3) NOT NULL,
+            started_at DATETIME(3) NULL,
+            finished_at DATETIME(3) NULL,
+            INDEX idx_ai_jobs_created (created_at)
+        )
+    """)
+
+
+def m007_upload_store(cursor):
+    # Content-addressed uploads (see uploads.ContentStore): one row per distinct file,
+    # one ref per upload
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS uploads (
+            sha256 CHAR(64) PRIMARY KEY,
+            path VARCHAR(255) NOT NULL,
+            mime VARCHAR(50) NOT NULL,
+            size_bytes BIGINT NOT NULL,
+            refcount INT NOT NULL DEFAULT 1,
+            first_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS upload_refs (
+            ref_id INT AUTO_INCREMENT PRIMARY KEY,
+            sha256 CHAR(64) NOT NULL,
+            user_id INT NULL,
+            original_name VARCHAR(255) NULL,
+            uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_upload_refs_sha (sha256),
+            FOREIGN KEY (sha256) REFERENCES uploads(sha256) ON DELETE CASCADE
+        )
+    """)
+
+
+def m008_patient_search(cursor):
+    # /patients/search: name and contact prefixes for type-ahead, FULLTEXT
+    # for matching any word of a name (see patient_search.PatientSearch)
+    _add_index(cursor, 'patients', 'idx_patients_name', 'name')
+    _add_index(cursor, 'patients', 'idx_patients_contact', 'contact')
+    if _index_exists(cursor, 'patients', 'ft_patients_name_contact'):
+        print("  index patients.ft_patients_name_contact already exists")
+    else:
+        cursor.execute("CREATE FULLTEXT INDEX ft_patients_name_contact ON patients (name, contact)")
+        print("  created fulltext index patients.ft_patients_name_contact (name, contact)")
+
+
+def m009_catalog_version(cursor):
+    # Medicine catalog cached in every app worker (see catalog.MedicineCatalog).
+    # version: bumped by triggers on catalog edits (not on stock changes, so
+    # dispensing transactions never contend on this row); stock_version: bumped
+    # by the app after each committed dispense
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS catalog_version (
+            id TINYINT PRIMARY KEY,
+            version INT NOT NULL,
+            stock_version INT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("INSERT IGNORE INTO catalog_version (id, version, stock_version) VALUES (1, 1, 1)")
+    triggers = {
+        'trg_medicines_insert_version': ('INSERT', "UPDATE catalog_version SET version = version + 1 WHERE id = 1"),
+        'trg_medicines_delete_version': ('DELETE', "UPDATE catalog_version SET version = version + 1 WHERE id = 1"),
+        'trg_medicines_update_version': ('UPDATE', """
+            BEGIN
+                IF NOT (NEW.name <=> OLD.name) OR NOT (NEW.price <=> OLD.price) THEN
+                    UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+                END IF;
+            END"""),
+    }
+    for name, (event, body) in triggers.items():
+        if not _trigger_exists(cursor, name):
+            cursor.execute(f"""
+                CREATE TRIGGER {name} AFTER {event} ON medicines
+                FOR EACH ROW {body}
+            """)
+
+
+def m010_invoice_snapshots(cursor):
+    # Paid invoices frozen as JSON documents (see invoices.InvoiceSnapshots);
+    # removed with their bill when a patient is deleted
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS invoice_snapshots (
+            bill_id INT PRIMARY KEY,
+            document MEDIUMTEXT NOT NULL,
+            frozen_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (bill_id) REFERENCES billing(bill_id) ON DELETE CASCADE
+        )
+    """)
+
+
+def m011_line_prices(cursor):
+    # Unit price each line was billed at, written with the bill when a
+    # prescription is validated, so invoices repeat the billed amounts.
+    # NULL on lines validated before this; invoices price those from the catalog
+    _add_column(cursor, 'prescription_details', 'unit_price', 'DECIMAL(10,2) NULL')
+
+
+MIGRATIONS = [
+    (1, 'prescription_indexes', m001_prescription_indexes),
+    (2, 'billing_indexes', m002_billing_indexes),
+    (3, 'medicine_usage_index', m003_medicine_usage_index),
+    (4, 'structured_dosage', m004_structured_dosage),
+    (5, 'rule_tables', m005_rule_tables),
+    (6, 'ai_jobs', m006_ai_jobs),
+    (7, 'upload_store', m007_upload_store),
+    (8, 'patient_search', m008_patient_search),
+    (9, 'catalog_version', m009_catalog_version),
+    (10, 'invoice_snapshots', m010_invoice_snapshots),
+    (11, 'line_prices', m011_line_prices),
+]
+
+
+def migrate(conn):
+    cursor = conn.cursor(buffered=True)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            name VARCHAR(100) NOT NULL,
+            applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("SELECT version FROM schema_migrations")
+    applied = {row[0] for row in cursor.fetchall()}
+    
+    pending = [m for m in MIGRATIONS if m[0] not in applied]
+    if not pending:
+        print("Schema is up to date.")
+    for version, name, func in pending:
+        print(f"Applying migration {version:03d}_{name}...")
+        func(cursor)
+        cursor.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+        conn.commit()
+    
+    cursor.close()
+    return [m[0] for m in pending]
+
+
+# --- Index Verification ---
+# (description, query, params, index the optimizer is expected to use)
+HOT_QUERIES = [
+    ("reports: revenue",
+     "SELECT SUM(total_amount) as rev FROM billing WHERE payment_status = 'Paid'", (),
+     'idx_billing_status_amount'),
+    ("reports: pending count",
+     "SELECT COUNT(*) as c FROM prescriptions WHERE status = 'pending'", (),
+     'idx_prescriptions_status_date'),
+    ("reports: status distribution",
+     "SELECT status, COUNT(*) as c FROM prescriptions GROUP BY status", (),
+     'idx_prescriptions_status_date'),
+    ("pharmacist: recent sales",
+     """SELECT b.bill_id, b.total_amount, b.payment_status, b.generated_at, p.name as patient_name
+        FROM billing b
+        JOIN prescriptions pr ON b.prescription_id = pr.prescription_id
+        JOIN patients p ON pr.patient_id = p.patient_id
+        ORDER BY b.generated_at DESC LIMIT 5""", (),
+     'idx_billing_generated_at'),
+    ("ai_analysis: latest prescriptions",
+     """SELECT p.prescription_id, p.date, pat.name as patient_name
+        FROM prescriptions p
+        JOIN patients pat ON p.patient_id = pat.patient_id
+        ORDER BY p.date DESC LIMIT 20""", (),
+     'idx_prescriptions_date'),
+    # Seeks on the patient_id foreign-key index, which InnoDB already extends
+    # with the primary key, so no extra index is needed
+    ("patient_history: visit page (seek)",
+     """SELECT p.*, u.full_name as doctor_name
+        FROM prescriptions p
+        JOIN users u ON p.doctor_id = u.user_id
+        WHERE p.patient_id = %s AND prescription_id < %s
+        ORDER BY prescription_id DESC
+        LIMIT 11""", (1, 2 ** 31 - 1),
+     'patient_id'),
+    ("dashboards: patient page (seek)",
+     """SELECT patient_id, name, age, gender, contact
+        FROM patients
+        WHERE patient_id < %s
+        ORDER BY patient_id DESC
+        LIMIT 26""", (1000000,),
+     'PRIMARY'),
+    ("patient search: name prefix",
+     """SELECT patient_id, name, age, gender, contact FROM patients
+        WHERE name LIKE %s ORDER BY name LIMIT 10""", ('Ara%',),
+     'idx_patients_name'),
+    ("patient search: contact prefix",
+     """SELECT patient_id, name, age, gender, contact FROM patients
+        WHERE contact LIKE %s ORDER BY contact LIMIT 10""", ('98%',),
+     'idx_patients_contact'),
+    ("patient search: any word",
+     """SELECT patient_id, name, age, gender, contact FROM patients
+        WHERE MATCH(name, contact) AGAINST (%s IN BOOLEAN MODE) LIMIT 10""", ('+sharm*',),
+     'ft_patients_name_contact'),
+    ("login",
+     "SELECT * FROM users WHERE username = %s AND password = %s", ('admin', 'pass123'),
+     'username'),
+]
+
+
+def plan_keys(cursor, query, params=()):
+    """The indexes the planner chooses for query (from EXPLAIN) on a dictionary cursor."""
+    cursor.execute("EXPLAIN " + query, params)
+    # Only the chosen key counts; possible_keys merely lists what the planner considered
+    return {row['key'] for row in cursor.fetchall() if row.get('key')}
+
+
+def verify_indexes(conn):
+    """EXPLAIN every hot query and check the planner actually uses the index added for it."""
+    cursor = conn.cursor(dictionary=True, buffered=True)
+    failures = []
+    for description, query, params, expected in HOT_QUERIES:
+        used = plan_keys(cursor, query, params)
+        ok = expected in used
+        if not ok:
+            failures.append(description)
+        print(f"[{'OK' if ok else 'MISSING'}] {description}: expected {expected}, plan uses {sorted(used) or '-'}")
+    cursor.close()
+    return failures
+
+
+def _connect_app_db():
+    return mysql.connector.connect(database=DB_NAME, **DB_CONFIG)
+
+
 if __name__ == '__main__':
-    setup_database()
+    command = sys.argv[1] if len(sys.argv) > 1 else 'setup'
+    if command == 'setup':
+        setup_database(verbose='-v' in sys.argv)
+    elif command in ('migrate', 'verify', 'load'):
+        if command == 'load' and len(sys.argv) < 3:
+            print("Usage: python setup_db.py load <file.sql>")
+            sys.exit(2)
+        try:
+            conn = _connect_app_db()
+        except mysql.connector.Error as err:
+            print(f"Error connecting to MySQL: {err}")
+            sys.exit(1)
+        try:
+            if command == 'migrate':
+                migrate(conn)
+            elif command == 'load':
+                load_sql_script(conn, sys.argv[2], verbose='-v' in sys.argv)
+            else:
+                sys.exit(1 if verify_indexes(conn) else 0)
+        finally:
+            conn.close()
+    else:
+        print("Usage: python setup_db.py [setup|migrate|verify|load <file.sql>] [-v]")
+        sys.exit(2)
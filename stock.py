@@ -0,0 +1,212 @@
+import random
+import threading
+import time
+
+import mysql.connector
+from mysql.connector import errorcode
+
+# Lock conflicts worth retrying: the whole transaction was rolled back (deadlock)
+# or gave up waiting for a row lock held by another dispense.
+RETRYABLE_ERRORS = (errorcode.ER_LOCK_DEADLOCK, errorcode.ER_LOCK_WAIT_TIMEOUT)
+
+
+class InsufficientStock(Exception):
+    """Raised when one or more medicines can't cover the requested quantity."""
+
+    def __init__(self, shortages):
+        self.shortages = shortages  # [{'medicine_id', 'name', 'requested', 'available'}]
+        super().__init__("Insufficient stock: " + ", ".join(
+            f"{s['name']} (need {s['requested']}, have {s['available']})" for s in shortages))
+
+
+class AlreadyProcessed(Exception):
+    """Raised when a prescription was validated by someone else first."""
+
+
+def demand(lines):
+    """Total quantity per medicine_id for a set of prescription lines."""
+    totals = {}
+    for line in lines:
+        if line['days'] > 0:
+            totals[line['medicine_id']] = totals.get(line['medicine_id'], 0) + line['days']
+    return totals
+
+
+def allocate(stock, demands):
+    """
+    Grant whole requests in order while stock lasts.
+    stock: {medicine_id: available}; demands: [(key, {medicine_id: qty})].
+    Returns (granted keys, {key: [shortages]}). stock is not modified.
+    """
+    remaining = dict(stock)
+    granted, refused = [], {}
+    for key, wanted in demands:
+        short = [
+            {'medicine_id': med_id, 'requested': qty, 'available': remaining.get(med_id, 0)}
+            for med_id, qty in sorted(wanted.items())
+            if remaining.get(med_id, 0) < qty
+        ]
+        if short:
+            refused[key] = short
+            continue
+        for med_id, qty in wanted.items():
+            remaining[med_id] -= qty
+        granted.append(key)
+    return granted, refused
+
+
+class StockReservations:
+    """
+    Short-lock stock deduction for dispensing.
+
+    - deduct(): all lines in one conditional UPDATE; every row must still have
+      enough stock or nothing is deducted and InsufficientStock is raised.
+    - lock(): SELECT ... FOR UPDATE in medicine_id order, for batches that need
+      to decide per prescription what can be dispensed before writing.
+    - run(): executes a unit of work as one transaction and retries it with
+      jittered backoff on deadlock / lock wait timeout.
+
+    Rows are always locked in ascending medicine_id order (the primary key
+    range scan order), so two dispenses never wait on each other in a cycle.
+    """
+
+    def __init__(self, attempts=3, backoff=0.05):
+        self.attempts = attempts
+        self.backoff = backoff
+        self._lock = threading.Lock()
+        self._metrics = {
+            'transactions': 0,
+            'deductions': 0,
+            'units_deducted': 0,
+            'insufficient': 0,
+            'conflicts': 0,
+            'retries': 0,
+            'gave_up': 0,
+        }
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._metrics[name] += n
+
+    def run(self, conn, work):
+        """Call work(cursor) inside a transaction, commit, and return its result."""
+        for attempt in range(1, self.attempts + 1):
+            cursor = conn.cursor(buffered=True)
+            try:
+                # autocommit is off: the first statement opens the transaction
+                result = work(cursor)
+                conn.commit()
+                self._count('transactions')
+                return result
+            except mysql.connector.Error as err:
+                conn.rollback()
+                if err.errno not in RETRYABLE_ERRORS:
+                    raise
+                if attempt == self.attempts:
+                    self._count('gave_up')
+                    raise
+                self._count('retries')
+                time.sleep(self.backoff * attempt * random.uniform(0.5, 1.5))
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+
+    def deduct(self, cursor, wanted):
+        """Deduct {medicine_id: qty} in one statement, or raise InsufficientStock."""
+        if not wanted:
+            return
+        ids = sorted(wanted)
+        cases = ' '.join(['WHEN %s THEN %s'] * len(ids))
+        params = [v for med_id in ids for v in (med_id, wanted[med_id])]
+        placeholders = ', '.join(['%s'] * len(ids))
+        cursor.execute(f"""
+            UPDATE medicines
+            SET quantity = quantity - (CASE medicine_id {cases} END)
+            WHERE medicine_id IN ({placeholders})
+              AND quantity >= (CASE medicine_id {cases} END)
+        """, params + ids + params)
+        if cursor.rowcount != len(ids):
+            # Some row failed its guard; nothing is kept once the caller rolls back
+            self._count('insufficient')
+            raise InsufficientStock(self.shortages(cursor, wanted))
+        self._count('deductions')
+        self._count('units_deducted', sum(wanted.values()))
+
+    def lock(self, cursor, medicine_ids):
+        """Lock medicine rows in ID order; returns {medicine_id: quantity}."""
+        ids = sorted(set(medicine_ids))
+        if not ids:
+            return {}
+        placeholders = ', '.join(['%s'] * len(ids))
+        cursor.execute(f"""
+            SELECT medicine_id, quantity FROM medicines
+            WHERE medicine_id IN ({placeholders})
+            ORDER BY medicine_id
+            FOR UPDATE
+        """, ids)
+        return dict(cursor.fetchall())
+
+    def prices(self, cursor, medicine_ids):
+        """
+        Current prices, locked in ID order like lock(); returns {medicine_id: price}.
+        Bills are priced from this inside the dispensing transaction, so a price
+        change committed elsewhere can't be missed.
+        """
+        ids = sorted(set(medicine_ids))
+        if not ids:
+            return {}
+        placeholders = ', '.join(['%s'] * len(ids))
+        cursor.execute(f"""
+            SELECT medicine_id, price FROM medicines
+            WHERE medicine_id IN ({placeholders})
+            ORDER BY medicine_id
+            FOR UPDATE
+        """, ids)
+        return dict(cursor.fetchall())
+
+    def lock_pending(self, cursor, prescription_ids):
+        """Lock the still-pending prescriptions among prescription_ids, in ID order."""
+        ids = sorted(set(prescription_ids))
+        placeholders = ', '.join(['%s'] * len(ids))
+        cursor.execute(f"""
+            SELECT prescription_id FROM prescriptions
+            WHERE prescription_id IN ({placeholders}) AND status = 'pending'
+            ORDER BY prescription_id
+            FOR UPDATE
+        """, ids)
+        return [row[0] for row in cursor.fetchall()]
+
+    def claim(self, cursor, prescription_ids):
+        """Move pending prescriptions to 'validated'; raises AlreadyProcessed if any was not pending."""
+        placeholders = ', '.join(['%s'] * len(prescription_ids))
+        cursor.execute(f"""
+            UPDATE prescriptions SET status = 'validated'
+            WHERE prescription_id IN ({placeholders}) AND status = 'pending'
+        """, list(prescription_ids))
+        if cursor.rowcount != len(prescription_ids):
+            self._count('conflicts')
+            raise AlreadyProcessed("Prescription was already processed by another pharmacist.")
+
+    def shortages(self, cursor, wanted):
+        ids = sorted(wanted)
+        placeholders = ', '.join(['%s'] * len(ids))
+        # Locking read: sees the committed quantity, not this transaction's snapshot
+        cursor.execute(f"""
+            SELECT medicine_id, name, quantity FROM medicines
+            WHERE medicine_id IN ({placeholders})
+            ORDER BY medicine_id
+            FOR UPDATE
+        """, ids)
+        found = {row[0]: row for row in cursor.fetchall()}
+        short = []
+        for med_id in ids:
+            _, name, available = found.get(med_id, (med_id, f"Medicine #{med_id}", 0))
+            if available < wanted[med_id]:
+                short.append({'medicine_id': med_id, 'name': name, 'requested': wanted[med_id], 'available': available})
+        return short
+
+    def stats(self):
+        with self._lock:
+            return dict(self._metrics)
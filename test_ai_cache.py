@@ -0,0 +1,38 @@
+"""Unit tests for ai_cache.AnalysisCache across workers sharing one disk tier: python -m pytest -q"""
+from ai_cache import AnalysisCache, MemoryTier, DiskTier
+
+
+def worker(directory):
+    return AnalysisCache(MemoryTier(max_entries=16, ttl=3600), DiskTier(str(directory)))
+
+
+def test_purge_in_one_worker_empties_the_memory_of_the_others(tmp_path):
+    first, second = worker(tmp_path), worker(tmp_path)
+    first.put('k1', '<p>one</p>')
+    assert second.get('k1') == '<p>one</p>'  # promoted into second's memory tier
+
+    assert first.purge() == 1
+    assert second.get('k1') is None
+    assert second.stats()['remote_purges'] == 1
+    assert first.get('k1') is None
+
+
+def test_entries_written_after_a_purge_are_served(tmp_path):
+    first, second = worker(tmp_path), worker(tmp_path)
+    first.put('k1', 'old')
+    second.get('k1')
+    second.purge()
+    first.put('k1', 'new')
+    assert first.get('k1') == 'new'
+    assert second.get('k1') == 'new'
+    assert second.stats()['remote_purges'] == 0
+
+
+def test_repeated_purges_are_each_seen(tmp_path):
+    first, second = worker(tmp_path), worker(tmp_path)
+    for round_ in range(3):
+        first.put('k', f'v{round_}')
+        assert second.get('k') == f'v{round_}'
+        first.purge()
+        assert second.get('k') is None
+    assert second.stats()['remote_purges'] == 3
@@ -0,0 +1,121 @@
+"""
+Provider routing against local fake_ai_server instances (no network or API
+keys needed): python -m pytest -q
+"""
+import threading
+
+import pytest
+
+import fake_ai_server
+from ai_budget import LatencyBudget
+from ai_providers import Provider, ProviderRegistry
+
+pytest.importorskip('openai')
+from openai import APIConnectionError, InternalServerError, RateLimitError  # noqa: E402
+
+RETRYABLE = (APIConnectionError, RateLimitError, InternalServerError)
+
+
+@pytest.fixture
+def fake_servers():
+    """start(**options) runs a fake server on a free port and returns its base URL."""
+    servers = []
+
+    def start(**options):
+        server = fake_ai_server.serve(0, **options)
+        threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def routed(registry, budget, stream=False):
+    # Same failover loop as app.routed_completion: one untried provider per attempt
+    tried = set()
+
+    def attempt(connect, read):
+        provider = registry.choose(exclude=tried)
+        tried.add(provider.name)
+        return registry.complete(provider, {'messages': [{'role': 'user', 'content': 'Aspirin'}]},
+                                 connect, read, stream=stream)
+
+    return budget.call(attempt)
+
+
+def budget(retries=2):
+    return LatencyBudget(budget=10, connect_timeout=2, read_timeout=5, retries=retries, backoff=0.01,
+                         retry_on=RETRYABLE)
+
+
+def test_fails_over_to_a_healthy_provider(fake_servers):
+    broken = Provider('broken', 'm', base_url=fake_servers(fail_rate=1.0), api_key='k', failure_threshold=1)
+    healthy = Provider('healthy', 'm', base_url=fake_servers(), api_key='k')
+    registry = ProviderRegistry([broken, healthy])
+
+    response = routed(registry, budget())
+    assert 'Fake Server' in response.choices[0].message.content
+    stats = registry.stats()
+    assert stats['providers']['broken']['failures'] == 1
+    assert stats['providers']['healthy']['successes'] == 1
+    # The broken one is cooling down, so the next request goes straight to the healthy one
+    assert not stats['providers']['broken']['healthy']
+    assert registry.choose().name == 'healthy'
+
+
+def test_prefers_the_faster_provider_once_measured(fake_servers):
+    slow = Provider('slow', 'm', base_url=fake_servers(delay=0.2), api_key='k')
+    fast = Provider('fast', 'm', base_url=fake_servers(), api_key='k')
+    registry = ProviderRegistry([slow, fast])
+    for _ in range(4):
+        routed(registry, budget())
+    assert slow.score() > fast.score()
+    assert registry.choose().name == 'fast'
+
+
+def test_providers_without_a_key_are_never_chosen(fake_servers):
+    registry = ProviderRegistry([Provider('nokey', 'm', base_url=fake_servers()),
+                                 Provider('keyed', 'm', base_url=fake_servers(), api_key='k')])
+    assert [p.name for p in registry.serving()] == ['keyed']
+    assert registry.choose().name == 'keyed'
+
+
+def test_stream_holds_its_concurrency_slot_until_read(fake_servers):
+    streaming = Provider('streaming', 'm', base_url=fake_servers(), api_key='k', max_concurrency=1)
+    other = Provider('other', 'm', base_url=fake_servers(delay=0.1), api_key='k')
+    registry = ProviderRegistry([streaming, other])
+
+    first, chunks = registry.complete(streaming, {'messages': [{'role': 'user', 'content': 'Aspirin'}]}, 2, 5,
+                                      stream=True)
+    assert first is not None
+    assert streaming.stats()['in_flight'] == 1
+    assert streaming.full()
+    # A full provider is only used once every other one is full too
+    assert registry.choose().name == 'other'
+
+    text = ''.join(c.choices[0].delta.content or '' for c in chunks if c.choices)
+    assert 'Fake Server' in text
+    assert streaming.stats()['in_flight'] == 0
+    assert streaming.stats()['successes'] == 1
+
+
+def test_closing_a_stream_early_frees_the_slot(fake_servers):
+    provider = Provider('streaming', 'm', base_url=fake_servers(token_delay=0.01), api_key='k', max_concurrency=1)
+    registry = ProviderRegistry([provider])
+    kwargs = {'messages': [{'role': 'user', 'content': 'Aspirin'}]}
+
+    _, chunks = registry.complete(provider, kwargs, 2, 5, stream=True)
+    next(chunks)
+    chunks.close()
+    assert provider.stats()['in_flight'] == 0
+
+    # Never read at all
+    _, chunks = registry.complete(provider, kwargs, 2, 5, stream=True)
+    assert provider.stats()['in_flight'] == 1
+    chunks.close()
+    stats = provider.stats()
+    assert stats['in_flight'] == 0
+    assert stats['failures'] == 0
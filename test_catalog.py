@@ -0,0 +1,76 @@
+"""Unit tests for catalog.MedicineCatalog's handling of unknown medicine ids: python -m pytest -q"""
+from contextlib import contextmanager
+
+from catalog import MedicineCatalog
+
+
+class FakeMedicinesDb:
+    """catalog_version and medicines in memory; counts the queries run."""
+
+    def __init__(self, medicines):
+        self.medicines = medicines
+        self.version = 1
+        self.queries = 0
+
+    def add(self, medicine_id, name):
+        self.medicines.append({'medicine_id': medicine_id, 'name': name, 'price': 1, 'quantity': 10})
+        self.version += 1  # as trg_medicines_insert_version does
+
+    @contextmanager
+    def connect(self):
+        yield self
+
+    def cursor(self, **kwargs):
+        return self
+
+    def execute(self, query, params=()):
+        self.queries += 1
+        self._rows = ([{'version': self.version, 'stock_version': 1}] if 'catalog_version' in query
+                      else [dict(m) for m in self.medicines])
+
+    def fetchone(self):
+        return self._rows[0]
+
+    def fetchall(self):
+        return self._rows
+
+    def close(self):
+        pass
+
+    def commit(self):
+        pass
+
+
+def catalog(db, miss_interval=0):
+    return MedicineCatalog(db.connect, refresh_interval=0, miss_interval=miss_interval)
+
+
+def test_medicine_added_since_the_last_poll_is_found():
+    db = FakeMedicinesDb([{'medicine_id': 1, 'name': 'Aspirin 75mg', 'price': 1, 'quantity': 10}])
+    medicines = catalog(db)
+    medicines.current()
+    db.add(2, 'Ibuprofen 400mg')
+    assert medicines.lookup([1, 2]).get(2)['name'] == 'Ibuprofen 400mg'
+    assert medicines.stats()['reloads'] == 2
+
+
+def test_known_missing_ids_do_not_check_again():
+    db = FakeMedicinesDb([{'medicine_id': 1, 'name': 'Aspirin 75mg', 'price': 1, 'quantity': 10}])
+    medicines = catalog(db)
+    medicines.current()
+    assert medicines.lookup([1, 99]).get(99) is None
+    queries = db.queries
+    for _ in range(5):
+        assert medicines.lookup([99]).get(99) is None
+    assert db.queries == queries
+    assert medicines.stats()['miss_checks'] == 1
+    assert medicines.stats()['reloads'] == 1  # a miss only probes the version
+
+
+def test_miss_checks_are_rate_limited():
+    db = FakeMedicinesDb([{'medicine_id': 1, 'name': 'Aspirin 75mg', 'price': 1, 'quantity': 10}])
+    medicines = catalog(db, miss_interval=60)
+    medicines.current()
+    for bogus in range(100, 110):
+        medicines.lookup([bogus])
+    assert medicines.stats()['miss_checks'] == 1
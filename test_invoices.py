@@ -0,0 +1,61 @@
+"""Unit tests for invoices.InvoiceSnapshots' per-process LRU: python -m pytest -q"""
+from decimal import Decimal
+
+from invoices import InvoiceSnapshots, assemble_invoice
+
+
+class FakeCursor:
+    """Answers the snapshot probe from a set of bill_ids with a stored snapshot."""
+
+    def __init__(self, stored):
+        self.stored = stored
+        self.rowcount = 0
+        self._row = None
+
+    def execute(self, query, params):
+        if query.startswith('INSERT IGNORE INTO invoice_snapshots'):
+            self.rowcount = 0 if params[0] in self.stored else 1
+            self.stored.add(params[0])
+        else:
+            self._row = {'1': 1} if params[0] in self.stored else None
+
+    def fetchone(self):
+        return self._row
+
+
+def document(bill_id):
+    return {'bill': {'bill_id': bill_id, 'total_amount': Decimal('13.50')}, 'items': []}
+
+
+def test_frozen_invoice_is_served_from_memory():
+    snapshots, cursor = InvoiceSnapshots(), FakeCursor(set())
+    snapshots.freeze(cursor, document(9))
+    assert snapshots.cached(cursor, 9) == document(9)
+    assert snapshots.stats()['memory_hits'] == 1
+
+
+def test_invoice_deleted_elsewhere_is_not_served_from_memory():
+    stored = set()
+    snapshots = InvoiceSnapshots()
+    snapshots.freeze(FakeCursor(stored), document(9))
+    stored.discard(9)  # bill deleted through another worker; the snapshot cascades
+    assert snapshots.cached(FakeCursor(stored), 9) is None
+    assert snapshots.stats()['memory_entries'] == 0
+
+
+def test_forget_evicts_the_cached_document():
+    snapshots, cursor = InvoiceSnapshots(), FakeCursor(set())
+    snapshots.freeze(cursor, document(9))
+    snapshots.forget(9)
+    assert snapshots.stats()['memory_entries'] == 0
+    snapshots.forget(9)  # already gone: no error
+
+
+def test_items_carry_the_price_billed_at_validation():
+    row = {'bill_id': 9, 'prescription_id': 5, 'total_amount': Decimal('16.00'), 'payment_status': 'Unpaid',
+           'generated_at': None, 'prescription_date': None, 'prescription_status': 'validated',
+           'patient_id': 1, 'doctor_id': 7, 'patient_name': 'Ann', 'patient_contact': '555',
+           'doctor_name': 'Dr X', 'document': None}
+    rows = [dict(row, detail_id=1, medicine_id=1, dosage='1-0-1', days=3, unit_price=Decimal('4.00')),
+            dict(row, detail_id=2, medicine_id=2, dosage='1', days=2, unit_price=None)]
+    assert [item['price'] for item in assemble_invoice(rows)['items']] == [Decimal('4.00'), None]
@@ -0,0 +1,25 @@
+"""
+EXPLAIN checks for setup_db.HOT_QUERIES against a live pharmacy_db (skipped
+without MySQL): python -m pytest -q test_setup_db.py
+
+The planner only prefers an index once a table has enough rows, so run it on
+a dataset from generate_data.py rather than the seed data alone.
+"""
+import pytest
+
+from setup_db import HOT_QUERIES, migrate, plan_keys
+
+
+@pytest.fixture(scope='module')
+def cursor(connect):
+    conn = connect()
+    migrate(conn)
+    cursor = conn.cursor(dictionary=True, buffered=True)
+    yield cursor
+    cursor.close()
+
+
+@pytest.mark.parametrize('description, query, params, expected', HOT_QUERIES, ids=[q[0] for q in HOT_QUERIES])
+def test_hot_query_uses_its_index(cursor, description, query, params, expected):
+    used = plan_keys(cursor, query, params)
+    assert expected in used, f"{description}: expected {expected}, plan uses {sorted(used) or '-'}"
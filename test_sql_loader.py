@@ -0,0 +1,79 @@
+"""Unit tests for setup_db.iter_sql_statements (no database needed): python -m pytest -q"""
+from setup_db import iter_sql_statements
+
+
+def split(sql):
+    return list(iter_sql_statements(sql.splitlines(keepends=True)))
+
+
+def statements(sql):
+    return [statement for statement, _ in split(sql)]
+
+
+def test_splits_on_semicolons():
+    assert statements("CREATE TABLE a (id INT);\nINSERT INTO a VALUES (1); INSERT INTO a VALUES (2);\n") == [
+        "CREATE TABLE a (id INT)", "INSERT INTO a VALUES (1)", "INSERT INTO a VALUES (2)"]
+
+
+def test_statement_spanning_lines_and_missing_final_semicolon():
+    assert statements("SELECT 1,\n  2\nFROM dual;\nSELECT 3") == ["SELECT 1,\n  2\nFROM dual", "SELECT 3"]
+
+
+def test_semicolons_inside_quotes_are_kept():
+    assert statements("INSERT INTO t VALUES ('a;b', \"c;d\");\nSELECT `odd;name` FROM t;") == [
+        "INSERT INTO t VALUES ('a;b', \"c;d\")", "SELECT `odd;name` FROM t"]
+
+
+def test_escaped_and_doubled_quotes_stay_inside_the_literal():
+    assert statements("SELECT 'it''s; fine';\nSELECT 'back\\'slash; too';") == [
+        "SELECT 'it''s; fine'", "SELECT 'back\\'slash; too'"]
+
+
+def test_literal_spanning_lines():
+    assert statements("INSERT INTO t VALUES ('line one;\nline two');\nSELECT 1;") == [
+        "INSERT INTO t VALUES ('line one;\nline two')", "SELECT 1"]
+
+
+def test_line_comments_are_dropped():
+    assert statements("-- setup; with a semicolon\nSELECT 1; # trailing; comment\nSELECT 2;") == [
+        "SELECT 1", "SELECT 2"]
+
+
+def test_double_dash_needs_whitespace_to_start_a_comment():
+    assert statements("SELECT 5--1;") == ["SELECT 5--1"]
+
+
+def test_block_comments_are_dropped_even_across_lines():
+    assert statements("/* header;\n still comment; */ SELECT 1;\nSELECT /* inline; */ 2;") == [
+        "SELECT 1", "SELECT  2"]
+
+
+def test_comment_markers_inside_quotes_are_text():
+    assert statements("SELECT '-- not a comment; /* nor this */';") == ["SELECT '-- not a comment; /* nor this */'"]
+
+
+def test_executable_comments_are_kept():
+    assert statements("/*!40101 SET NAMES utf8mb4 */;\nSELECT 1;") == ["/*!40101 SET NAMES utf8mb4 */", "SELECT 1"]
+
+
+def test_delimiter_blocks_are_standalone():
+    sql = (
+        "CREATE TABLE t (id INT);\n"
+        "DELIMITER $$\n"
+        "CREATE TRIGGER trg AFTER INSERT ON t FOR EACH ROW\n"
+        "BEGIN\n"
+        "  UPDATE counters SET n = n + 1;\n"
+        "  INSERT INTO log VALUES ('x;y');\n"
+        "END$$\n"
+        "DELIMITER ;\n"
+        "SELECT 1;\n"
+    )
+    result = split(sql)
+    assert [standalone for _, standalone in result] == [False, True, False]
+    assert result[1][0].startswith("CREATE TRIGGER trg")
+    assert result[1][0].endswith("INSERT INTO log VALUES ('x;y');\nEND")
+    assert result[2][0] == "SELECT 1"
+
+
+def test_delimiter_word_inside_a_statement_is_not_a_directive():
+    assert statements("SELECT\nDELIMITER $$\nFROM t;") == ["SELECT\nDELIMITER $$\nFROM t"]
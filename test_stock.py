@@ -0,0 +1,129 @@
+"""Unit tests for stock: demand(), allocate() and StockReservations' locking order: python -m pytest -q"""
+import mysql.connector
+import pytest
+from mysql.connector import errorcode
+
+from stock import StockReservations, AlreadyProcessed, InsufficientStock, allocate, demand
+
+
+class RecordingCursor:
+    """Records statements; fetchall() returns rows, rowcount is fixed."""
+
+    def __init__(self, rows=(), rowcount=0):
+        self.rows = list(rows)
+        self.rowcount = rowcount
+        self.executed = []
+
+    def execute(self, query, params=()):
+        self.executed.append((' '.join(query.split()), list(params)))
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+def test_demand_sums_duplicate_medicine_lines():
+    lines = [{'medicine_id': 2, 'days': 3}, {'medicine_id': 1, 'days': 5}, {'medicine_id': 2, 'days': 4}]
+    assert demand(lines) == {1: 5, 2: 7}
+
+
+def test_demand_skips_lines_without_days():
+    assert demand([{'medicine_id': 1, 'days': 0}, {'medicine_id': 2, 'days': -1}]) == {}
+
+
+def test_allocate_grants_in_order_until_stock_runs_out():
+    stock = {1: 10, 2: 5}
+    granted, refused = allocate(stock, [('a', {1: 6}), ('b', {1: 6, 2: 1}), ('c', {1: 4, 2: 5})])
+    assert granted == ['a', 'c']
+    assert refused == {'b': [{'medicine_id': 1, 'requested': 6, 'available': 4}]}
+    assert stock == {1: 10, 2: 5}  # caller's stock is left alone
+
+
+def test_allocate_refuses_the_whole_request_and_keeps_its_stock():
+    granted, refused = allocate({1: 5, 2: 1}, [('a', {1: 5, 2: 2}), ('b', {1: 5})])
+    # 'a' is short on 2 only, but nothing of it is taken, so 'b' still gets all of 1
+    assert granted == ['b']
+    assert refused == {'a': [{'medicine_id': 2, 'requested': 2, 'available': 1}]}
+
+
+def test_allocate_lists_every_shortage_in_medicine_order():
+    granted, refused = allocate({1: 0}, [('a', {3: 1, 1: 2})])
+    assert granted == []
+    assert refused['a'] == [{'medicine_id': 1, 'requested': 2, 'available': 0},
+                            {'medicine_id': 3, 'requested': 1, 'available': 0}]
+
+
+def test_rows_are_locked_in_ascending_id_order():
+    reservations = StockReservations()
+    cursor = RecordingCursor()
+    reservations.lock(cursor, [5, 2, 9, 2])
+    reservations.prices(cursor, [7, 3])
+    reservations.lock_pending(cursor, [40, 10, 30])
+    assert [params for _, params in cursor.executed] == [[2, 5, 9], [3, 7], [10, 30, 40]]
+    assert all('ORDER BY' in query and query.endswith('FOR UPDATE') for query, _ in cursor.executed)
+
+
+def test_deduct_updates_every_line_in_id_order():
+    cursor = RecordingCursor(rowcount=2)
+    StockReservations().deduct(cursor, {9: 1, 4: 3})
+    (query, params), = cursor.executed
+    assert query.startswith('UPDATE medicines')
+    assert params == [4, 3, 9, 1, 4, 9, 4, 3, 9, 1]
+
+
+def test_deduct_raises_when_a_row_fails_its_guard():
+    cursor = RecordingCursor(rows=[(4, 'Aspirin 75mg', 1)], rowcount=1)
+    with pytest.raises(InsufficientStock) as info:
+        StockReservations().deduct(cursor, {4: 3, 9: 1})
+    assert info.value.shortages == [{'medicine_id': 4, 'name': 'Aspirin 75mg', 'requested': 3, 'available': 1},
+                                    {'medicine_id': 9, 'name': 'Medicine #9', 'requested': 1, 'available': 0}]
+
+
+def test_claim_raises_when_a_prescription_is_no_longer_pending():
+    reservations = StockReservations()
+    with pytest.raises(AlreadyProcessed):
+        reservations.claim(RecordingCursor(rowcount=1), [1, 2])
+    assert reservations.stats()['conflicts'] == 1
+
+
+class FlakyConnection:
+    """Raises a deadlock from work() for the first `failures` attempts."""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.commits = self.rollbacks = 0
+
+    def cursor(self, **kwargs):
+        return RecordingCursor()
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+def deadlocking(conn):
+    def work(cursor):
+        if conn.failures:
+            conn.failures -= 1
+            raise mysql.connector.Error(errno=errorcode.ER_LOCK_DEADLOCK)
+        return 'done'
+    return work
+
+
+def test_run_retries_a_deadlocked_transaction():
+    reservations, conn = StockReservations(attempts=3, backoff=0), FlakyConnection(failures=2)
+    assert reservations.run(conn, deadlocking(conn)) == 'done'
+    assert (conn.rollbacks, conn.commits) == (2, 1)
+    assert reservations.stats()['retries'] == 2
+
+
+def test_run_gives_up_after_its_attempts():
+    reservations, conn = StockReservations(attempts=2, backoff=0), FlakyConnection(failures=5)
+    with pytest.raises(mysql.connector.Error):
+        reservations.run(conn, deadlocking(conn))
+    assert conn.commits == 0
+    assert reservations.stats()['gave_up'] == 1
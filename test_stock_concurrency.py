@@ -0,0 +1,186 @@
+"""
+Concurrent stress tests for stock.StockReservations against a real pharmacy_db
+(skipped without MySQL): python -m pytest -q test_stock_concurrency.py
+
+Each test creates scratch medicines and prescriptions, lets many threads work
+on them at once through the same run/deduct/claim/lock_pending paths the
+validate routes use, and checks that stock never went negative, every
+successful dispense is accounted for exactly, and no prescription is
+dispensed twice. Scratch rows are removed afterwards.
+"""
+import os
+import random
+import threading
+import time
+
+import pytest
+
+from stock import StockReservations, AlreadyProcessed, InsufficientStock, allocate
+
+THREADS = int(os.getenv('STRESS_THREADS', 16))
+ATTEMPTS = int(os.getenv('STRESS_ATTEMPTS', 50))  # dispenses tried per thread
+STOCK = 500  # starting quantity of each scratch medicine
+
+
+@pytest.fixture
+def scratch(connect):
+    """Creates scratch medicines and one patient; yields (conn, medicine_ids, new_prescriptions)."""
+    conn = connect()
+    cursor = conn.cursor()
+    tag = f"STRESS-TEST-{time.time_ns()}"
+    med_ids = []
+    for i in range(3):
+        cursor.execute("INSERT INTO medicines (name, quantity, price) VALUES (%s, %s, 1.00)", (f"{tag}-{i}", STOCK))
+        med_ids.append(cursor.lastrowid)
+    cursor.execute("INSERT INTO patients (name) VALUES (%s)", (tag,))
+    patient_id = cursor.lastrowid
+    conn.commit()
+
+    def new_prescriptions(count):
+        cursor.executemany("INSERT INTO prescriptions (patient_id, status) VALUES (%s, 'pending')",
+                           [(patient_id,)] * count)
+        conn.commit()
+        cursor.execute("SELECT prescription_id FROM prescriptions WHERE patient_id = %s ORDER BY prescription_id",
+                       (patient_id,))
+        return [row[0] for row in cursor.fetchall()][-count:]
+
+    yield conn, med_ids, new_prescriptions
+
+    conn.rollback()
+    placeholders = ', '.join(['%s'] * len(med_ids))
+    cursor.execute("DELETE FROM prescriptions WHERE patient_id = %s", (patient_id,))
+    cursor.execute("DELETE FROM patients WHERE patient_id = %s", (patient_id,))
+    cursor.execute(f"DELETE FROM medicines WHERE medicine_id IN ({placeholders})", med_ids)
+    conn.commit()
+    cursor.close()
+
+
+def hammer(connect, work):
+    """Run work(conn, rng) on THREADS threads, each with its own connection; re-raises the first error."""
+    errors = []
+
+    def worker(seed):
+        conn = connect()
+        try:
+            work(conn, random.Random(seed))
+        except Exception as err:
+            errors.append(err)
+
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(THREADS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if errors:
+        raise errors[0]
+
+
+def quantities(conn, med_ids):
+    conn.commit()  # end the snapshot so the committed quantities are read
+    cursor = conn.cursor()
+    placeholders = ', '.join(['%s'] * len(med_ids))
+    cursor.execute(f"SELECT medicine_id, quantity FROM medicines WHERE medicine_id IN ({placeholders})", med_ids)
+    final = dict(cursor.fetchall())
+    cursor.close()
+    return final
+
+
+def statuses(conn, prescription_ids):
+    conn.commit()
+    cursor = conn.cursor()
+    placeholders = ', '.join(['%s'] * len(prescription_ids))
+    cursor.execute(f"SELECT prescription_id, status FROM prescriptions WHERE prescription_id IN ({placeholders})",
+                   prescription_ids)
+    found = dict(cursor.fetchall())
+    cursor.close()
+    return found
+
+
+def test_concurrent_deducts_never_oversell(connect, scratch):
+    conn, med_ids, _ = scratch
+    reservations = StockReservations(attempts=5)
+    dispensed = {med_id: 0 for med_id in med_ids}
+    lock = threading.Lock()
+
+    def work(worker_conn, rng):
+        for _ in range(ATTEMPTS):
+            # Random subsets in random order: exercises the ID-ordered locking
+            picked = rng.sample(med_ids, rng.randint(1, len(med_ids)))
+            wanted = {med_id: rng.randint(1, 5) for med_id in picked}
+            try:
+                reservations.run(worker_conn, lambda c: reservations.deduct(c, wanted))
+            except InsufficientStock:
+                continue
+            with lock:
+                for med_id, qty in wanted.items():
+                    dispensed[med_id] += qty
+
+    hammer(connect, work)
+    final = quantities(conn, med_ids)
+    assert final == {med_id: STOCK - dispensed[med_id] for med_id in med_ids}
+    assert min(final.values()) >= 0
+
+
+def test_each_prescription_is_claimed_once(connect, scratch):
+    conn, med_ids, new_prescriptions = scratch
+    p_ids = new_prescriptions(50)
+    reservations = StockReservations(attempts=5)
+    claimed = []
+    lock = threading.Lock()
+
+    def work(worker_conn, rng):
+        # Every thread races for every prescription, in its own order
+        for p_id in rng.sample(p_ids, len(p_ids)):
+            try:
+                reservations.run(worker_conn, lambda c: reservations.claim(c, [p_id]))
+            except AlreadyProcessed:
+                continue
+            with lock:
+                claimed.append(p_id)
+
+    hammer(connect, work)
+    assert sorted(claimed) == p_ids
+    assert set(statuses(conn, p_ids).values()) == {'validated'}
+
+
+def test_concurrent_batches_dispense_each_prescription_once(connect, scratch):
+    conn, med_ids, new_prescriptions = scratch
+    p_ids = new_prescriptions(200)
+    rng = random.Random(0)
+    # Oversubscribed on purpose: 200 prescriptions want ~1200 of each 500 in stock
+    wanted = {p_id: {med_id: rng.randint(1, 10) for med_id in rng.sample(med_ids, rng.randint(1, len(med_ids)))}
+              for p_id in p_ids}
+    reservations = StockReservations(attempts=5)
+    granted_all = []
+    lock = threading.Lock()
+
+    def dispense(cursor, batch):
+        # Same steps as the batch validate route
+        claimed = reservations.lock_pending(cursor, batch)
+        requests = [(p_id, wanted[p_id]) for p_id in batch if p_id in claimed]
+        stock = reservations.lock(cursor, [med_id for _, w in requests for med_id in w])
+        granted, _ = allocate(stock, requests)
+        totals = {}
+        for p_id in granted:
+            for med_id, qty in wanted[p_id].items():
+                totals[med_id] = totals.get(med_id, 0) + qty
+        reservations.deduct(cursor, totals)
+        cursor.executemany("UPDATE prescriptions SET status = 'validated' WHERE prescription_id = %s",
+                           [(p_id,) for p_id in granted])
+        return granted
+
+    def work(worker_conn, rng):
+        for _ in range(ATTEMPTS // 5):
+            batch = rng.sample(p_ids, 10)
+            granted = reservations.run(worker_conn, lambda c: dispense(c, batch))
+            with lock:
+                granted_all.extend(granted)
+
+    hammer(connect, work)
+    assert len(granted_all) == len(set(granted_all)), "a prescription was dispensed twice"
+    final = quantities(conn, med_ids)
+    for med_id in med_ids:
+        assert final[med_id] == STOCK - sum(wanted[p_id].get(med_id, 0) for p_id in granted_all)
+        assert final[med_id] >= 0
+    found = statuses(conn, p_ids)
+    assert {p_id for p_id, status in found.items() if status == 'validated'} == set(granted_all)
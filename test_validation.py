@@ -0,0 +1,270 @@
+"""Unit tests for the pure rule logic in validation.py (no database needed): python -m pytest -q"""
+from contextlib import contextmanager
+
+import pytest
+
+from validation import (InteractionIndex, DEFAULT_INTERACTIONS, AhoCorasick, AllergyMatcher, RuleStore,
+                        ValidationCache, parse_dosage, parse_strength_mg, compile_dosage, DosageError)
+
+
+# --- Interactions ---
+
+def test_interacting_pair_is_reported_once_in_prescription_order():
+    index = InteractionIndex(DEFAULT_INTERACTIONS)
+    assert index.check(['Aspirin 75mg', 'Paracetamol 500mg', 'Ibuprofen 400mg']) == [
+        ('Aspirin 75mg', 'Ibuprofen 400mg', 'Increased risk of bleeding')]
+
+
+def test_no_hits_without_an_interacting_pair():
+    index = InteractionIndex(DEFAULT_INTERACTIONS)
+    assert index.check(['Aspirin 75mg', 'Paracetamol 500mg', 'Metformin 500mg']) == []
+    assert index.check([]) == []
+
+
+def test_ingredients_match_whole_words_only():
+    index = InteractionIndex({frozenset(['Aspirin', 'Ibuprofen']): 'bleeding'})
+    # Substrings of longer words are different drugs
+    assert index.check(['Aspirinol', 'Ibuprofenate']) == []
+    assert index.resolve('Aspirinol 75mg') == ()
+    # Case and punctuation don't matter
+    assert index.check(['ASPIRIN (75mg)', 'ibuprofen-400']) == [('ASPIRIN (75mg)', 'ibuprofen-400', 'bleeding')]
+
+
+def test_multi_word_ingredients():
+    index = InteractionIndex(DEFAULT_INTERACTIONS)
+    assert index.check(['Metformin 500mg', 'Contrast Dye Injection']) == [
+        ('Metformin 500mg', 'Contrast Dye Injection', 'Risk of lactic acidosis')]
+    assert index.check(['Metformin 500mg', 'Dye Contrast']) == []
+
+
+def test_each_earlier_line_is_reported_against_a_later_one():
+    index = InteractionIndex(DEFAULT_INTERACTIONS)
+    hits = index.check(['Aspirin 75mg', 'Aspirin 300mg', 'Ibuprofen 400mg'])
+    assert [(a, b) for a, b, _ in hits] == [('Aspirin 75mg', 'Ibuprofen 400mg'), ('Aspirin 300mg', 'Ibuprofen 400mg')]
+
+
+def test_combination_product_resolves_every_ingredient():
+    index = InteractionIndex(DEFAULT_INTERACTIONS)
+    assert index.resolve('Aspirin + Ibuprofen') == (index.lexicon.ids['aspirin'], index.lexicon.ids['ibuprofen'])
+    assert index.check(['Aspirin + Ibuprofen', 'Ibuprofen 200mg']) == [
+        ('Aspirin + Ibuprofen', 'Ibuprofen 200mg', 'Increased risk of bleeding')]
+
+
+def test_rule_order_does_not_matter():
+    index = InteractionIndex(DEFAULT_INTERACTIONS)
+    assert index.check(['Warfarin 5mg', 'Paracetamol 500mg']) == [
+        ('Warfarin 5mg', 'Paracetamol 500mg', 'Increased risk of bleeding')]
+
+
+def test_self_interaction_rule():
+    index = InteractionIndex({frozenset(['Methotrexate']): 'Duplicate methotrexate'})
+    assert index.check(['Methotrexate 2.5mg', 'Methotrexate 10mg']) == [
+        ('Methotrexate 2.5mg', 'Methotrexate 10mg', 'Duplicate methotrexate')]
+    assert index.check(['Methotrexate 2.5mg']) == []
+
+
+# --- Allergies ---
+
+def test_aho_corasick_finds_overlapping_patterns():
+    automaton = AhoCorasick(['he', 'she', 'hers', 'his'])
+    assert automaton.find('ushers') == {0, 1, 2}
+    assert automaton.find('xyz') == set()
+
+
+def test_allergy_matches_terms_inside_medicine_names():
+    matcher = AllergyMatcher(['penicillin', 'sulfa'])
+    profile = matcher.patient_profile(1, 'Penicillin, Sulfa')
+    assert matcher.match(profile, 'Penicillin V 250mg') == ['penicillin']
+    assert matcher.match(profile, 'Sulfamethoxazole') == ['sulfa']
+    assert matcher.match(profile, 'Paracetamol 500mg') == []
+
+
+def test_allergy_text_is_normalized():
+    matcher = AllergyMatcher()
+    profile = matcher.patient_profile(1, '  CONTRAST   Dye ,, ')
+    assert matcher.match(profile, 'contrast dye injection') == ['contrast dye']
+
+
+def test_empty_profile_matches_nothing():
+    matcher = AllergyMatcher(['aspirin'])
+    assert matcher.match(matcher.patient_profile(1, ''), 'Aspirin 75mg') == []
+    assert matcher.match(matcher.patient_profile(2, None), 'Aspirin 75mg') == []
+
+
+def test_patient_only_terms_match_without_growing_the_vocabulary():
+    matcher = AllergyMatcher(['aspirin'])
+    assert matcher.medicine_terms('Latex gloves') == frozenset()
+    profile = matcher.patient_profile(1, 'latex, Aspirin')
+    assert matcher.match(profile, 'Latex gloves') == ['latex']
+    assert matcher.match(profile, 'Aspirin latex-free 75mg') == ['aspirin', 'latex']
+    automaton = matcher._automaton
+    for patient_id in range(2, 50):
+        matcher.patient_profile(patient_id, f'custom allergen {patient_id}')
+    assert matcher._automaton is automaton
+    assert matcher._vocabulary == ['aspirin']
+
+
+def test_profile_is_reparsed_when_the_text_changes():
+    matcher = AllergyMatcher()
+    first = matcher.patient_profile(7, 'aspirin')
+    assert matcher.patient_profile(7, 'aspirin') is first
+    changed = matcher.patient_profile(7, 'ibuprofen')
+    assert matcher.match(changed, 'Aspirin 75mg') == []
+    assert matcher.match(changed, 'Ibuprofen 400mg') == ['ibuprofen']
+
+
+def test_patient_cache_is_bounded():
+    matcher = AllergyMatcher(max_patients=2)
+    for patient_id in range(5):
+        matcher.patient_profile(patient_id, 'aspirin')
+    assert list(matcher._patients) == [3, 4]
+    matcher.invalidate(4)
+    assert list(matcher._patients) == [3]
+    matcher.invalidate()
+    assert not matcher._patients
+
+
+# --- Dosage ---
+
+@pytest.mark.parametrize('dosage, slots', [
+    ('1-0-1', (1.0, 0.0, 1.0)),
+    ('1-0-1 after food', (1.0, 0.0, 1.0)),
+    ('1/2-0-1', (0.5, 0.0, 1.0)),
+    (' 0.5 - 1', (0.5, 1.0)),
+    ('2', (2.0,)),
+])
+def test_parse_dosage(dosage, slots):
+    assert parse_dosage(dosage) == slots
+
+
+@pytest.mark.parametrize('dosage', ['', None, 'twice daily', '1/0-1', '1-0-1/', '1-0-'])
+def test_parse_dosage_rejects_unreadable_text(dosage):
+    with pytest.raises(DosageError):
+        parse_dosage(dosage)
+
+
+@pytest.mark.parametrize('name, mg', [
+    ('Paracetamol 500mg', 500.0),
+    ('Amoxicillin 1g', 1000.0),
+    ('Vitamin D 1000 mcg', 1.0),
+    ('Insulin Syrup', None),
+])
+def test_parse_strength_mg(name, mg):
+    assert parse_strength_mg(name) == mg
+
+
+def test_compile_dosage():
+    assert compile_dosage('1/2-0-1', 'Paracetamol 500mg') == {
+        'units_per_slot': '0.5-0-1', 'units_per_day': 1.5, 'strength_mg': 500.0, 'daily_mg': 750.0}
+    assert compile_dosage('2', 'Cough Syrup')['daily_mg'] is None
+
+
+# --- Validation cache ---
+
+def line(dosage, units_per_day, daily_mg, medicine_id=1, medicine_name='Paracetamol 500mg'):
+    return {'medicine_id': medicine_id, 'medicine_name': medicine_name, 'dosage': dosage,
+            'units_per_day': units_per_day, 'daily_mg': daily_mg}
+
+
+def test_fingerprint_sorts_parsed_and_unparsed_lines_of_one_medicine():
+    parsed, unparsed = line('1-0-1', 2, 1000.0), line('as needed', None, None)
+    first = ValidationCache.fingerprint([parsed, unparsed], frozenset(), 1)
+    assert first == ValidationCache.fingerprint([unparsed, parsed], frozenset(), 1)
+
+
+def test_fingerprint_tells_missing_values_from_zero_and_empty():
+    assert ValidationCache.fingerprint([line('0', 0, 0.0)], frozenset(), 1) != \
+        ValidationCache.fingerprint([line('0', 0, None)], frozenset(), 1)
+    assert ValidationCache.fingerprint([line('', None, None)], frozenset(), 1) != \
+        ValidationCache.fingerprint([line('', 1, None)], frozenset(), 1)
+
+
+# --- Rule store ---
+
+class FakeRuleDb:
+    """
+    The three rule tables in memory, behind a connection that keeps
+    mysql-connector's transaction rules: with autocommit off any statement
+    opens a transaction, and start_transaction() inside one is an error.
+    """
+
+    def __init__(self):
+        self.version = 1
+        self.dosage = [('Paracetamol', 4000)]
+        self.interactions = [('Aspirin', 'Ibuprofen', 'Increased risk of bleeding')]
+        self.in_transaction = False
+
+    def cursor(self, **kwargs):
+        return FakeRuleCursor(self)
+
+    def start_transaction(self, **kwargs):
+        if self.in_transaction:
+            raise RuntimeError("Transaction already in progress")
+        self.in_transaction = True
+
+    def commit(self):
+        self.in_transaction = False
+
+    @contextmanager
+    def connect(self):
+        yield self
+
+
+class FakeRuleCursor:
+    def __init__(self, db):
+        self.db = db
+        self.rows = []
+
+    def execute(self, query, params=()):
+        self.db.in_transaction = True
+        if 'rule_set_version' in query:
+            self.rows = [(self.db.version,)]
+        elif 'dosage_rules' in query:
+            self.rows = list(self.db.dosage)
+        else:
+            self.rows = list(self.db.interactions)
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+def test_rule_store_loads_and_reloads_on_version_bump():
+    db = FakeRuleDb()
+    rules = RuleStore(db.connect, refresh_interval=0)
+    assert rules.current().version == 1
+    assert rules.current().dosage_limits('Paracetamol 500mg') == [('Paracetamol', 4000.0)]
+    assert rules.stats()['errors'] == 0
+
+    db.version = 2
+    db.dosage = [('Paracetamol', 3000)]
+    db.interactions = []
+    assert rules.refresh() is True
+    assert rules.current().version == 2
+    assert rules.current().dosage_limits('Paracetamol 500mg') == [('Paracetamol', 3000.0)]
+    assert rules.current().check_interactions(['Aspirin', 'Ibuprofen']) == []
+    assert not db.in_transaction
+
+
+def test_rule_store_skips_reload_when_version_is_unchanged():
+    db = FakeRuleDb()
+    rules = RuleStore(db.connect, refresh_interval=0)
+    rules.current()
+    assert rules.refresh() is False
+    assert rules.stats()['reloads'] == 1
+    assert not db.in_transaction
+
+
+def test_rule_store_serves_defaults_without_a_database():
+    @contextmanager
+    def down():
+        yield None
+
+    rules = RuleStore(down, refresh_interval=0)
+    assert rules.current().version == 0
+    assert rules.current().dosage_limits('Aspirin 75mg') == [('Aspirin', 300.0)]
@@ -0,0 +1,110 @@
+import hashlib
+import os
+import tempfile
+import threading
+
+import mysql.connector
+
+from imaging import sniff_mime
+
+_EXTENSIONS = {'image/jpeg': 'jpg', 'image/png': 'png', 'image/gif': 'gif', 'image/webp': 'webp'}
+
+
+class StoredUpload:
+    def __init__(self, sha256, path, mime, size, deduplicated):
+        self.sha256 = sha256
+        self.path = path
+        self.mime = mime
+        self.size = size
+        self.deduplicated = deduplicated
+
+
+class ContentStore:
+    """
+    Uploads stored once per distinct content, under root/<sha[:2]>/<sha>.<ext>.
+
+    The request body is streamed to a temp file in chunks while it is hashed,
+    then renamed to its content path, or dropped if that content is already
+    stored. Every upload is recorded in upload_refs (who uploaded it, under
+    which name), and uploads.refcount counts them per content hash.
+
+    connect is a context manager yielding a connection or None (app.get_db_connection);
+    without a database the files are still stored and deduplicated.
+    """
+
+    def __init__(self, root, connect, chunk_size=64 * 1024):
+        self.root = root
+        self.connect = connect
+        self.chunk_size = chunk_size
+        self._lock = threading.Lock()
+        self._metrics = {'uploads': 0, 'deduplicated': 0, 'bytes_received': 0, 'bytes_stored': 0}
+
+    def path_for(self, sha256, mime):
+        return os.path.join(self.root, sha256[:2], f"{sha256}.{_EXTENSIONS.get(mime, 'bin')}")
+
+    def save(self, stream, user_id=None, original_name=None):
+        incoming = os.path.join(self.root, '.incoming')
+        os.makedirs(incoming, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        head = b''
+        fd, tmp_path = tempfile.mkstemp(dir=incoming)
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                for chunk in iter(lambda: stream.read(self.chunk_size), b''):
+                    if len(head) < 16:
+                        head += chunk[:16 - len(head)]
+                    digest.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+
+            sha256 = digest.hexdigest()
+            mime = sniff_mime(head)
+            path = self.path_for(sha256, mime)
+            deduplicated = os.path.exists(path)
+            if deduplicated:
+                os.unlink(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+        with self._lock:
+            self._metrics['uploads'] += 1
+            self._metrics['bytes_received'] += size
+            if deduplicated:
+                self._metrics['deduplicated'] += 1
+            else:
+                self._metrics['bytes_stored'] += size
+
+        self._record(sha256, path, mime, size, user_id, original_name)
+        return StoredUpload(sha256, path, mime, size, deduplicated)
+
+    def _record(self, sha256, path, mime, size, user_id, original_name):
+        with self.connect() as conn:
+            if not conn:
+                return
+            try:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    INSERT INTO uploads (sha256, path, mime, size_bytes, refcount)
+                    VALUES (%s, %s, %s, %s, 1)
+                    ON DUPLICATE KEY UPDATE refcount = refcount + 1, last_seen = CURRENT_TIMESTAMP
+                """, (sha256, path, mime, size))
+                cursor.execute("""
+                    INSERT INTO upload_refs (sha256, user_id, original_name)
+                    VALUES (%s, %s, %s)
+                """, (sha256, user_id, (original_name or '')[:255]))
+                conn.commit()
+                cursor.close()
+            except mysql.connector.Error as err:
+                print(f"Upload Metadata Error: {err}")
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._metrics)
+        data['bytes_saved'] = data['bytes_received'] - data['bytes_stored']
+        return data
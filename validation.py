@@ -0,0 +1,511 @@
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+
+_WORD = re.compile(r'[a-z]+|[0-9]+')
+
+
+def name_tokens(name):
+    """Lower-cased word/number runs of a name ('Aspirin 75mg' -> ['aspirin', '75', 'mg'])."""
+    return _WORD.findall(name.lower()) if name else []
+
+
+class IngredientLexicon:
+    """
+    Ingredient names mapped to small integer IDs, with a cached name resolver.
+    A medicine name resolves to the ingredients it mentions as whole words
+    ('Aspirin 75mg' -> aspirin), computed once per distinct name.
+    """
+
+    def __init__(self):
+        self.ids = {}        # 'contrast dye' -> 3
+        self.names = []
+        self.max_words = 1
+        self._resolved = {}  # medicine name -> tuple of ingredient ids
+
+    def add(self, name):
+        key = ' '.join(name_tokens(name))
+        if key not in self.ids:
+            self.ids[key] = len(self.names)
+            self.names.append(name)
+            self.max_words = max(self.max_words, len(key.split()))
+        return self.ids[key]
+
+    def resolve(self, medicine_name):
+        ids = self._resolved.get(medicine_name)
+        if ids is None:
+            tokens = name_tokens(medicine_name)
+            found = []
+            for size in range(1, self.max_words + 1):
+                for start in range(len(tokens) - size + 1):
+                    ingredient = self.ids.get(' '.join(tokens[start:start + size]))
+                    if ingredient is not None and ingredient not in found:
+                        found.append(ingredient)
+            ids = tuple(found)
+            self._resolved[medicine_name] = ids
+        return ids
+
+
+class InteractionIndex:
+    """
+    Drug-drug interaction rules compiled for fast prescription checks.
+
+    Every ingredient named in a rule gets a small integer ID, and each ingredient
+    keeps a bitset (a Python int) of the ingredients it interacts with. Medicine
+    names are resolved to ingredient IDs once and cached, so checking a
+    prescription is one AND per line against the bitset of lines seen so far,
+    no matter how many rules exist.
+    """
+
+    def __init__(self, interactions):
+        self.lexicon = IngredientLexicon()
+        self.adjacency = []        # ingredient id -> bitset of interacting ids
+        self.messages = {}         # (low id, high id) -> message
+
+        for members, message in interactions.items():
+            ids = [self._ingredient_id(name) for name in members]
+            a, b = (ids[0], ids[0]) if len(ids) == 1 else (ids[0], ids[1])
+            self.adjacency[a] |= 1 << b
+            self.adjacency[b] |= 1 << a
+            self.messages[(min(a, b), max(a, b))] = message
+
+    @property
+    def ingredient_names(self):
+        return self.lexicon.names
+
+    def _ingredient_id(self, name):
+        ingredient = self.lexicon.add(name)
+        if ingredient == len(self.adjacency):
+            self.adjacency.append(0)
+        return ingredient
+
+    def resolve(self, medicine_name):
+        """Ingredient IDs mentioned in a medicine name, matched on whole words."""
+        return self.lexicon.resolve(medicine_name)
+
+    def check(self, med_names):
+        """Return (earlier medicine, later medicine, message) for every interacting pair of lines."""
+        hits = []
+        seen_bits = 0
+        seen_meds = {}  # ingredient id -> medicine names already on the prescription
+        for name in med_names:
+            ids = self.resolve(name)
+            reported = set()
+            for a in ids:
+                matches = self.adjacency[a] & seen_bits
+                while matches:
+                    low = matches & -matches
+                    b = low.bit_length() - 1
+                    matches ^= low
+                    for other in seen_meds[b]:
+                        if (other, b, a) in reported:
+                            continue
+                        reported.add((other, b, a))
+                        hits.append((other, name, self.messages[(min(a, b), max(a, b))]))
+            for a in ids:
+                seen_bits |= 1 << a
+                seen_meds.setdefault(a, []).append(name)
+        return hits
+
+
+# --- Rule Snapshots ---
+# Seed rules: loaded into dosage_rules / interaction_rules by setup_db.py, and
+# used as-is when the database is unreachable.
+DEFAULT_MAX_DOSAGE = {
+    'Paracetamol': 4000, # mg
+    'Ibuprofen': 1200,
+    'Amoxicillin': 1500,
+    'Cetirizine': 10,
+    'Aspirin': 300,
+    'Metformin': 2000,
+    'Atorvastatin': 80,
+    'Omeprazole': 40,
+    'Azithromycin': 500,
+    'Pantoprazole': 40,
+    'Diclofenac': 150
+}
+
+DEFAULT_INTERACTIONS = {
+    frozenset(['Aspirin', 'Ibuprofen']): 'Increased risk of bleeding',
+    frozenset(['Paracetamol', 'Warfarin']): 'Increased risk of bleeding',
+    frozenset(['Amoxicillin', 'Methotrexate']): 'Increased toxicity',
+    frozenset(['Metformin', 'Contrast Dye']): 'Risk of lactic acidosis',
+    frozenset(['Simvastatin', 'Amlodipine']): 'Increased risk of myopathy'
+}
+
+
+class RuleSnapshot:
+    """
+    One immutable version of the validation rules, indexed for lookups.
+    Built off the request path and never modified afterwards; the only
+    mutable parts are the per-name resolve caches, which are idempotent.
+    """
+
+    def __init__(self, version, max_dosage, interactions):
+        self.version = version
+        self.interactions = InteractionIndex(interactions)
+        self.dosage = IngredientLexicon()
+        self.dosage_limits_mg = []  # dosage ingredient id -> mg/day
+        for name, limit in max_dosage.items():
+            ingredient = self.dosage.add(name)
+            if ingredient == len(self.dosage_limits_mg):
+                self.dosage_limits_mg.append(float(limit))
+            else:
+                self.dosage_limits_mg[ingredient] = min(self.dosage_limits_mg[ingredient], float(limit))
+
+    @property
+    def ingredient_names(self):
+        return self.dosage.names + self.interactions.ingredient_names
+
+    def dosage_limits(self, medicine_name):
+        """(ingredient, mg/day limit) for every dosage rule whose ingredient the name mentions."""
+        return [(self.dosage.names[i], self.dosage_limits_mg[i]) for i in self.dosage.resolve(medicine_name)]
+
+    def check_interactions(self, med_names):
+        return self.interactions.check(med_names)
+
+
+class RuleStore:
+    """
+    Process-wide holder of the current RuleSnapshot.
+
+    current() is a plain attribute read: no lock and no database access on the
+    validation path. A daemon thread polls the one-row rule_set_version table
+    every refresh_interval seconds; when the version moves it loads both rule
+    tables in one read-only transaction, builds a new snapshot and swaps the
+    reference. Requests already holding the old snapshot finish on it.
+
+    connect is a context manager yielding a connection or None (app.get_db_connection).
+    Until the first successful load, the seed rules are served as version 0.
+    """
+
+    def __init__(self, connect, defaults=None, refresh_interval=10.0):
+        self.connect = connect
+        self.refresh_interval = refresh_interval
+        defaults = defaults or (DEFAULT_MAX_DOSAGE, DEFAULT_INTERACTIONS)
+        self._snapshot = RuleSnapshot(0, *defaults)
+        self._lock = threading.Lock()
+        self._pid = None
+        self._loaded_at = None
+        self._metrics = {'polls': 0, 'reloads': 0, 'errors': 0}
+
+    def current(self):
+        if self._pid != os.getpid():
+            self._start()
+        return self._snapshot
+
+    def _start(self):
+        # First call in this process (also after a fork): load synchronously,
+        # then leave version polling to a background thread.
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self.refresh()
+            self._pid = os.getpid()
+            if self.refresh_interval:
+                threading.Thread(target=self._poll_loop, name='rule-store-poll', daemon=True).start()
+
+    def _poll_loop(self):
+        while True:
+            time.sleep(self.refresh_interval)
+            self.refresh()
+
+    def refresh(self):
+        """Reload the rule tables if their version changed. Returns True if a new snapshot was swapped in."""
+        self._metrics['polls'] += 1
+        try:
+            with self.connect() as conn:
+                if not conn:
+                    return False
+                cursor = conn.cursor(buffered=True)
+                try:
+                    cursor.execute("SELECT version FROM rule_set_version WHERE id = 1")
+                    row = cursor.fetchone()
+                    # Autocommit is off, so the probe opened a transaction; end it so the
+                    # next poll sees new commits and _load can start its snapshot
+                    conn.commit()
+                    if row is None or row[0] == self._snapshot.version:
+                        return False
+                    snapshot = self._load(conn, cursor)
+                finally:
+                    cursor.close()
+        except Exception as err:
+            self._metrics['errors'] += 1
+            print(f"Rule Reload Error: {err}")
+            return False
+        self._snapshot = snapshot
+        self._loaded_at = time.time()
+        self._metrics['reloads'] += 1
+        print(f"Validation rules loaded: version {snapshot.version}")
+        return True
+
+    @staticmethod
+    def _load(conn, cursor):
+        # Version and both tables read from one consistent view
+        conn.start_transaction(readonly=True, consistent_snapshot=True)
+        try:
+            cursor.execute("SELECT version FROM rule_set_version WHERE id = 1")
+            version = cursor.fetchone()[0]
+            cursor.execute("SELECT ingredient, max_daily_mg FROM dosage_rules")
+            max_dosage = dict(cursor.fetchall())
+            cursor.execute("SELECT ingredient_a, ingredient_b, message FROM interaction_rules")
+            interactions = {frozenset([a, b]): message for a, b, message in cursor.fetchall()}
+        finally:
+            conn.commit()
+        return RuleSnapshot(version, max_dosage, interactions)
+
+    def stats(self):
+        data = dict(self._metrics)
+        data.update({
+            'version': self._snapshot.version,
+            'loaded_at': self._loaded_at,
+            'dosage_rules': len(self._snapshot.dosage_limits_mg),
+            'interaction_rules': len(self._snapshot.interactions.messages),
+        })
+        return data
+
+
+class ValidationCache:
+    """
+    Bounded LRU of validation results for repeat prescriptions.
+
+    Keyed by a canonical fingerprint of the lines (see fingerprint), the
+    patient's parsed allergy set and the rule-set version. Seeing a new rule
+    version drops every cached result, since none of them can hit again.
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # fingerprint -> tuple of error messages
+        self._version = None
+        self._lock = threading.Lock()
+        self._metrics = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    @staticmethod
+    def fingerprint(lines, allergy_profile, rules_version):
+        # Medicine name rides along with the ID so a catalog rename can't serve
+        # stale alert text; the raw dosage only matters when it couldn't be parsed.
+        # Missing values are flagged instead of None so every slot sorts.
+        items = sorted(
+            (line['medicine_id'], line['medicine_name'] or '',
+             line['daily_mg'] is None, float(line['daily_mg'] or 0),
+             line['units_per_day'] is None, (line['dosage'] or '') if line['units_per_day'] is None else '')
+            for line in lines
+        )
+        return (rules_version, tuple(items), allergy_profile)
+
+    def _check_version(self, version):
+        if version != self._version:
+            if self._entries:
+                self._metrics['invalidations'] += 1
+            self._entries.clear()
+            self._version = version
+
+    def get(self, key):
+        with self._lock:
+            self._check_version(key[0])
+            errors = self._entries.get(key)
+            if errors is None:
+                self._metrics['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._metrics['hits'] += 1
+            return list(errors)
+
+    def put(self, key, errors):
+        with self._lock:
+            self._check_version(key[0])
+            self._entries[key] = tuple(errors)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._metrics['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._metrics)
+            data.update({'entries': len(self._entries), 'max_entries': self.max_entries,
+                         'rules_version': self._version})
+        lookups = data['hits'] + data['misses']
+        data['hit_rate'] = round(data['hits'] / lookups, 3) if lookups else 0.0
+        return data
+
+
+class AhoCorasick:
+    """Multi-pattern substring matcher: one pass over the text finds every pattern it contains."""
+
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [()]
+        for pattern_id, pattern in enumerate(patterns):
+            node = 0
+            for ch in pattern:
+                nxt = self.goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[node][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(())
+                node = nxt
+            self.output[node] += (pattern_id,)
+
+        # Breadth-first pass to wire failure links
+        queue = list(self.goto[0].values())
+        for node in queue:
+            for ch, nxt in self.goto[node].items():
+                queue.append(nxt)
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.output[nxt] += self.output[self.fail[nxt]]
+
+    def find(self, text):
+        found = set()
+        node = 0
+        goto, fail, output = self.goto, self.fail, self.output
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if output[node]:
+                found.update(output[node])
+        return found
+
+
+def normalize_term(text):
+    return ' '.join(text.lower().split())
+
+
+class AllergyMatcher:
+    """
+    Allergy screening against a fixed vocabulary of allergen terms.
+
+    Each medicine name is scanned once by an Aho-Corasick automaton built from
+    the vocabulary (ingredient names) and the set of terms it contains is
+    cached. A patient's allergies string is parsed once into a set of terms,
+    cached per patient and re-parsed automatically if the stored text changes.
+    Screening a line is then a set intersection, independent of vocabulary
+    size. Terms only a patient uses (free text such as 'latex') stay in that
+    patient's profile and are checked as plain substrings of the medicine
+    name, so the automaton is built once and never grows with the patient list.
+    """
+
+    def __init__(self, vocabulary=(), max_patients=10000):
+        self.max_patients = max_patients
+        self._vocabulary = sorted({normalize_term(t) for t in vocabulary} - {''})
+        self._vocabulary_set = frozenset(self._vocabulary)
+        self._automaton = AhoCorasick(self._vocabulary)
+        self._medicines = {}                           # medicine name -> vocabulary terms
+        self._patients = OrderedDict()                 # patient_id -> (raw text, terms)
+        self._lock = threading.Lock()
+
+    def _parse(self, allergies_text):
+        terms = {normalize_term(a) for a in (allergies_text or '').split(',')}
+        terms.discard('')
+        return frozenset(terms)
+
+    def patient_profile(self, patient_id, allergies_text):
+        """A patient's allergy terms, parsed once per (patient, text)."""
+        cached = self._patients.get(patient_id)
+        if cached is not None and cached[0] == allergies_text:
+            return cached[1]
+        profile = self._parse(allergies_text)
+        if patient_id is not None:
+            with self._lock:
+                self._patients[patient_id] = (allergies_text, profile)
+                self._patients.move_to_end(patient_id)
+                while len(self._patients) > self.max_patients:
+                    self._patients.popitem(last=False)
+        return profile
+
+    def invalidate(self, patient_id=None):
+        with self._lock:
+            if patient_id is None:
+                self._patients.clear()
+            else:
+                self._patients.pop(patient_id, None)
+
+    def medicine_terms(self, medicine_name):
+        """Vocabulary terms found in the medicine name."""
+        hits = self._medicines.get(medicine_name)
+        if hits is None:
+            hits = frozenset(self._vocabulary[i] for i in self._automaton.find(normalize_term(medicine_name)))
+            self._medicines[medicine_name] = hits
+        return hits
+
+    def match(self, profile, medicine_name):
+        """Allergy terms from the profile found in the medicine name."""
+        if not profile:
+            return []
+        hits = self.medicine_terms(medicine_name) & profile
+        unscanned = profile - hits - self._vocabulary_set
+        if unscanned:
+            name = normalize_term(medicine_name)
+            hits |= {term for term in unscanned if term in name}
+        return sorted(hits)
+
+
+# --- Structured Dosage ---
+# Dosage is entered as units per slot ('1-0-1', '1/2-0-1 after food') or a plain
+# daily count ('2'). It is parsed once when the prescription is created and the
+# numbers are stored next to the free text, so validation never re-parses it.
+
+_UNITS = r'(?:\d+(?:\.\d+)?|\d+/\d+)'
+_DOSAGE = re.compile(r'^\s*(' + _UNITS + r'(?:\s*-\s*' + _UNITS + r')*)(?![\d./-])')
+_STRENGTH = re.compile(r'(\d+(?:\.\d+)?)\s*(mg|mcg|µg|ug|g)\b', re.IGNORECASE)
+_TO_MG = {'mg': 1.0, 'g': 1000.0, 'mcg': 0.001, 'µg': 0.001, 'ug': 0.001}
+
+
+class DosageError(ValueError):
+    pass
+
+
+def _units(text):
+    if '/' in text:
+        num, den = text.split('/')
+        if float(den) == 0:
+            raise DosageError(f"Invalid dosage fraction '{text}'")
+        return float(num) / float(den)
+    return float(text)
+
+
+def parse_dosage(dosage):
+    """'1-0-1 after food' -> (1.0, 0.0, 1.0). Raises DosageError if no unit pattern leads the text."""
+    m = _DOSAGE.match(dosage or '')
+    if not m:
+        raise DosageError(f"Could not read dosage '{dosage}'. Use units per slot like 1-0-1, or a daily count like 2.")
+    return tuple(_units(part.strip()) for part in m.group(1).split('-'))
+
+
+def parse_strength_mg(medicine_name):
+    """Strength per unit in mg from a name like 'Paracetamol 500mg', or None if it has none."""
+    m = _STRENGTH.search(medicine_name or '')
+    if not m:
+        return None
+    return float(m.group(1)) * _TO_MG[m.group(2).lower()]
+
+
+def _fmt(value):
+    return f"{value:g}"
+
+
+def compile_dosage(dosage, medicine_name):
+    """Structured columns stored on prescription_details for one line."""
+    slots = parse_dosage(dosage)
+    units_per_day = sum(slots)
+    strength_mg = parse_strength_mg(medicine_name)
+    return {
+        'units_per_slot': '-'.join(_fmt(u) for u in slots),
+        'units_per_day': units_per_day,
+        'strength_mg': strength_mg,
+        'daily_mg': units_per_day * strength_mg if strength_mg is not None else None,
+    }